@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import checks  # noqa: F401
+        from .middleware import install_query_counter
+        from foodgram.replicas import track_replica_errors
+
+        connection_created.connect(install_query_counter)
+        connection_created.connect(track_replica_errors)
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import CommandError
+
+
+def add_allow_writes_argument(parser):
+    parser.add_argument(
+        "--allow-writes", action="store_true",
+        help="Разрешить прогону создавать токены и менять данные в базе"
+    )
+
+
+def check_writes_allowed(options):
+    """Прогон пишет в настроенную базу только с явным флагом."""
+    if not options["allow_writes"]:
+        raise CommandError(
+            "Прогон создаёт токены и меняет данные в базе "
+            f"{settings.DATABASES['default']['NAME']}. Запускайте его "
+            "на копии с тестовыми данными и флагом --allow-writes"
+        )
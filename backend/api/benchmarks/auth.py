@@ -0,0 +1,30 @@
+import time
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+
+def authenticate(authenticator, tokens, requests=1000):
+    """Время и запросы к БД на аутентификацию одного запроса.
+
+    Токены перебираются по кругу, как от пользователей, которые
+    делают запросы по очереди.
+    """
+    factory = APIRequestFactory()
+    requests_list = [
+        factory.get("/api/users/me/", HTTP_AUTHORIZATION=f"Token {token}")
+        for token in tokens
+    ]
+    with CaptureQueriesContext(connections["default"]) as queries:
+        started = time.perf_counter()
+        for number in range(requests):
+            authenticator.authenticate(
+                requests_list[number % len(requests_list)]
+            )
+        duration = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "us_per_request": round(duration / requests * 1e6, 1),
+        "queries_per_request": round(len(queries) / requests, 3),
+    }
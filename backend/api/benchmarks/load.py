@@ -0,0 +1,315 @@
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from django.db import connections
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import CustomUser
+
+QUERY_COUNT_HEADER = "X-DB-Query-Count"
+# Размер страницы, который запрашивает фронтенд
+PAGE_LIMIT = 6
+PERCENTILES = (50, 95, 99)
+WORD_RE = re.compile(r"[^\W\d_]{3,}")
+
+
+class BenchmarkData:
+    """Пользователи с токенами и объекты, к которым идут запросы."""
+
+    def __init__(self, users=50, recipes=1000):
+        user_ids = list(
+            CustomUser.objects.order_by("?").values_list(
+                "id", flat=True
+            )[:users]
+        )
+        self.tokens = [
+            Token.objects.get_or_create(user_id=user_id)[0].key
+            for user_id in user_ids
+        ]
+        self.recipes = list(
+            Recipe.objects.order_by("?").values_list("id", "name")[:recipes]
+        )
+        self.tags = list(Tag.objects.values_list("slug", flat=True))
+        self.ingredients = list(
+            Ingredient.objects.order_by("?").values_list(
+                "id", "name"
+            )[:recipes]
+        )
+
+
+def recipe_list(rng, data):
+    params = {"limit": PAGE_LIMIT}
+    if data.tags and rng.random() < 0.5:
+        params["tags"] = rng.sample(data.tags, rng.randint(1, len(data.tags)))
+    if data.recipes and rng.random() < 0.2:
+        words = WORD_RE.findall(rng.choice(data.recipes)[1])
+        if words:
+            params["search"] = rng.choice(words)
+    if data.ingredients and rng.random() < 0.2:
+        params["ingredients"] = rng.choice(data.ingredients)[0]
+    # Дальние страницы листают только без фильтров, иначе их может не быть
+    params["page"] = 1 if len(params) > 1 else rng.randint(1, 5)
+    return [("GET", "/api/recipes/?" + urlencode(params, doseq=True))]
+
+
+def recipe_detail(rng, data):
+    return [("GET", f"/api/recipes/{rng.choice(data.recipes)[0]}/")]
+
+
+def favorite(rng, data):
+    path = f"/api/recipes/{rng.choice(data.recipes)[0]}/favorite/"
+    return [("POST", path), ("DELETE", path)]
+
+
+def shopping_cart(rng, data):
+    path = f"/api/recipes/{rng.choice(data.recipes)[0]}/shopping_cart/"
+    return [
+        ("POST", path),
+        ("GET", "/api/recipes/download_shopping_cart/"),
+        ("DELETE", path),
+    ]
+
+
+def subscriptions(rng, data):
+    params = {"page": 1, "limit": PAGE_LIMIT, "recipes_limit": 3}
+    return [("GET", "/api/users/subscriptions/?" + urlencode(params))]
+
+
+def ingredient_search(rng, data):
+    name = rng.choice(data.ingredients)[1]
+    return [("GET", "/api/ingredients/?" + urlencode({"name": name[:3]}))]
+
+
+def tags(rng, data):
+    return [("GET", "/api/tags/")]
+
+
+def recipe_feed(rng, data):
+    return [("GET", "/api/recipes/feed/?limit=" + str(PAGE_LIMIT))]
+
+
+# Сценарий, его доля в нагрузке и нужные ему данные
+WORKLOAD = (
+    ("recipe_list", 40, recipe_list, "recipes"),
+    ("recipe_detail", 20, recipe_detail, "recipes"),
+    ("favorite", 8, favorite, "recipes"),
+    ("shopping_cart", 5, shopping_cart, "recipes"),
+    ("subscriptions", 8, subscriptions, None),
+    ("ingredient_search", 12, ingredient_search, "ingredients"),
+    ("tags", 4, tags, None),
+    ("feed", 7, recipe_feed, None),
+)
+# Чтение, которое обслуживают асинхронные представления
+READ_SCENARIOS = (
+    "recipe_list", "recipe_detail", "subscriptions", "ingredient_search",
+    "tags",
+)
+
+
+def endpoint_name(method, path):
+    """Имя точки без id и параметров: статистика копится по нему."""
+    parts = [
+        "{id}" if part.isdigit() else part
+        for part in path.split("?")[0].split("/")
+    ]
+    return f"{method} {'/'.join(parts)}"
+
+
+class InProcessClient:
+    """Запросы через тестовый клиент Django в текущем процессе."""
+
+    def __init__(self, token):
+        self.client = Client(
+            raise_request_exception=False,
+            HTTP_AUTHORIZATION=f"Token {token}"
+        )
+
+    def request(self, method, path):
+        response = getattr(self.client, method.lower())(path)
+        return response.status_code, response.get(QUERY_COUNT_HEADER)
+
+    def close(self):
+        for connection in connections.all():
+            connection.close()
+
+
+class HTTPClient:
+    """Запросы к запущенному серверу по HTTP."""
+
+    def __init__(self, token, base_url):
+        self.token = token
+        self.base_url = base_url.rstrip("/")
+
+    def request(self, method, path):
+        request = Request(
+            self.base_url + path,
+            method=method,
+            headers={"Authorization": f"Token {self.token}"}
+        )
+        try:
+            with urlopen(request) as response:
+                response.read()
+                return response.status, response.headers.get(
+                    QUERY_COUNT_HEADER
+                )
+        except HTTPError as error:
+            return error.code, error.headers.get(QUERY_COUNT_HEADER)
+
+    def close(self):
+        pass
+
+
+def percentile(values, percent):
+    """Процентиль по ближайшему рангу для отсортированного списка."""
+    if not values:
+        return None
+    rank = math.ceil(percent / 100 * len(values))
+    return values[max(rank, 1) - 1]
+
+
+def summarize(samples, duration):
+    """Сводка по точкам: пропускная способность, задержки, запросы к БД."""
+    report = {}
+    for name, items in sorted(samples.items()):
+        latencies = sorted(latency for latency, _, _ in items)
+        queries = [count for _, _, count in items if count is not None]
+        report[name] = {
+            "requests": len(items),
+            "errors": sum(1 for _, status, _ in items if status >= 400),
+            "throughput": round(len(items) / duration, 2),
+            **{
+                f"p{percent}_ms": round(
+                    percentile(latencies, percent) * 1000, 2
+                )
+                for percent in PERCENTILES
+            },
+            "queries": (
+                round(sum(queries) / len(queries), 2) if queries else None
+            ),
+        }
+    return report
+
+
+def run(data, requests=1000, concurrency=4, warmup=50, base_url=None,
+        seed=None, scenarios=None):
+    """Прогоняет смешанную нагрузку и возвращает отчёт.
+
+    Каждый поток работает от имени своего пользователя и выбирает
+    сценарии по весам WORKLOAD, без scenarios - все. Первые warmup
+    запросов каждого потока не учитываются.
+    """
+    workload = [
+        item for item in WORKLOAD
+        if (scenarios is None or item[0] in scenarios)
+        and (item[3] is None or getattr(data, item[3]))
+    ]
+    weights = [weight for _, weight, _, _ in workload]
+    samples = defaultdict(list)
+    lock = threading.Lock()
+    per_thread = math.ceil(requests / concurrency)
+
+    def worker(number):
+        rng = random.Random(f"{seed}:{number}")
+        token = data.tokens[number % len(data.tokens)]
+        client = (
+            HTTPClient(token, base_url) if base_url
+            else InProcessClient(token)
+        )
+        done = 0
+        try:
+            while done < warmup + per_thread:
+                _, _, scenario, _ = rng.choices(workload, weights)[0]
+                for method, path in scenario(rng, data):
+                    start = time.perf_counter()
+                    status, queries = client.request(method, path)
+                    latency = time.perf_counter() - start
+                    done += 1
+                    if done <= warmup:
+                        continue
+                    with lock:
+                        samples[endpoint_name(method, path)].append((
+                            latency,
+                            status,
+                            None if queries is None else int(queries)
+                        ))
+        finally:
+            client.close()
+
+    threads = [
+        threading.Thread(target=worker, args=(number,))
+        for number in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+    latencies = sorted(
+        latency for items in samples.values() for latency, _, _ in items
+    )
+    return {
+        "mode": "http" if base_url else "in-process",
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "duration": round(duration, 3),
+        "throughput": round(len(latencies) / duration, 2),
+        **{
+            f"p{percent}_ms": round(percentile(latencies, percent) * 1000, 2)
+            for percent in PERCENTILES
+            if latencies
+        },
+        "endpoints": summarize(samples, duration),
+    }
+
+
+def compare(report, baseline, threshold=0.2):
+    """Ухудшения относительно сохранённого отчёта.
+
+    Задержка p95 и пропускная способность сравниваются с допуском
+    threshold, среднее число запросов к БД - без допуска.
+    """
+    regressions = []
+    for name, current in report["endpoints"].items():
+        previous = baseline["endpoints"].get(name)
+        if previous is None:
+            continue
+        if current["p95_ms"] > previous["p95_ms"] * (1 + threshold):
+            regressions.append(
+                f"{name}: p95 {previous['p95_ms']} -> {current['p95_ms']} мс"
+            )
+        if current["throughput"] < previous["throughput"] * (1 - threshold):
+            regressions.append(
+                f"{name}: {previous['throughput']} -> "
+                f"{current['throughput']} запросов/с"
+            )
+        if (
+            current["queries"] is not None
+            and previous["queries"] is not None
+            and current["queries"] > previous["queries"] + 0.5
+        ):
+            regressions.append(
+                f"{name}: {previous['queries']} -> "
+                f"{current['queries']} запросов к БД"
+            )
+    return regressions
+
+
+def load_report(path):
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_report(report, path):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
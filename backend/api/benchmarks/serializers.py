@@ -0,0 +1,16 @@
+import time
+
+from rest_framework.renderers import JSONRenderer
+
+
+def render(function, serializer, recipe_ids, repeat=20):
+    """Процессорное время на одну страницу рецептов, миллисекунды.
+
+    Возвращает его вместе с JSON последнего прогона для сравнения.
+    """
+    started = time.process_time()
+    for _ in range(repeat):
+        shared = function(serializer, recipe_ids)
+    duration = time.process_time() - started
+    content = JSONRenderer().render([shared[pk] for pk in recipe_ids])
+    return round(duration / repeat * 1000, 2), content
@@ -0,0 +1,94 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+from urllib.request import urlopen
+
+from django.conf import settings
+
+SERVER_START_TIMEOUT = 30
+SLOW_CLIENT_STEPS = 10
+READ_SIZE = 64 * 1024
+
+
+@contextmanager
+def server(application, worker_class, workers, port, env=None):
+    """Запускает gunicorn с приложением и ждёт, пока он начнёт отвечать.
+
+    Возвращает адрес сервера, после выхода из блока сервер
+    останавливается.
+    """
+    base_url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn", application,
+            "--worker-class", worker_class,
+            "--workers", str(workers),
+            "--bind", f"127.0.0.1:{port}",
+            "--chdir", str(settings.BASE_DIR),
+            "--log-level", "warning",
+        ],
+        env={**os.environ, **(env or {})}
+    )
+    try:
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while True:
+            try:
+                with urlopen(base_url + "/api/tags/"):
+                    break
+            except HTTPError:
+                break
+            except (URLError, ConnectionError):
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f"Сервер {application} не запустился")
+                time.sleep(0.2)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait()
+
+
+@contextmanager
+def slow_clients(base_url, count, delay):
+    """Клиенты, которые передают заголовки запроса по частям delay секунд.
+
+    Так ведут себя клиенты на медленных сетях без буферизующего прокси:
+    синхронный воркер всё это время занят одним соединением.
+    """
+    url = urlparse(base_url)
+    stop = threading.Event()
+
+    def client():
+        while not stop.is_set():
+            try:
+                with socket.create_connection(
+                    (url.hostname, url.port), timeout=delay + 10
+                ) as sock:
+                    sock.sendall(
+                        f"GET /api/tags/ HTTP/1.1\r\nHost: {url.netloc}\r\n"
+                        .encode()
+                    )
+                    for _ in range(SLOW_CLIENT_STEPS):
+                        if stop.wait(delay / SLOW_CLIENT_STEPS):
+                            break
+                        sock.sendall(b"X-Slow-Client: 1\r\n")
+                    sock.sendall(b"Connection: close\r\n\r\n")
+                    while sock.recv(READ_SIZE):
+                        pass
+            except OSError:
+                stop.wait(0.1)
+
+    threads = [threading.Thread(target=client) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
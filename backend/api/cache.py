@@ -0,0 +1,144 @@
+from copy import copy
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import representations
+from foodgram.replicas import primary
+from recipes.models import Recipe
+from recipes.versions import get_version, get_versions
+
+REPRESENTATION_KEY = "recipe:{}:{}:{}:{}"
+STATS_KEY = "recipe_cache:{}"
+USER_FIELDS = ("is_favorited", "is_in_shopping_cart")
+
+
+def record_stats(hits, misses):
+    """Счётчики попаданий общие для всех процессов, пока жив кэш."""
+    for name, value in (("hits", hits), ("misses", misses)):
+        if not value:
+            continue
+        key = STATS_KEY.format(name)
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            cache.set(key, value, timeout=None)
+
+
+def get_stats():
+    keys = [STATS_KEY.format("hits"), STATS_KEY.format("misses")]
+    values = cache.get_many(keys)
+    hits, misses = (values.get(key, 0) for key in keys)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / total if total else None,
+    }
+
+
+def reset_stats():
+    cache.delete_many([STATS_KEY.format("hits"), STATS_KEY.format("misses")])
+
+
+def variant_key(serializer):
+    """Набор полей и адрес сайта, от которых зависит представление."""
+    request = serializer.context.get("request")
+    base_url = request.build_absolute_uri("/") if request else ""
+    fields = ",".join(serializer.fields)
+    return md5(f"{base_url}|{fields}".encode()).hexdigest()[:12]
+
+
+def serialize_shared(serializer, recipe_ids):
+    """Общие части представлений через поля сериализатора: {id: данные}."""
+    return {
+        pk: serializer.to_shared_representation(recipe)
+        for pk, recipe in Recipe.objects.with_related(
+            list(serializer.fields)
+        ).in_bulk(recipe_ids).items()
+    }
+
+
+def render_shared(serializer, recipe_ids):
+    """Общие части представлений из строк .values(), если это возможно.
+
+    Результат совпадает с serialize_shared, но без экземпляров моделей
+    и объектов полей, которые дают основную нагрузку на процессор.
+    """
+    fields = list(serializer.fields)
+    if not representations.supports(fields):
+        return serialize_shared(serializer, recipe_ids)
+    return representations.shared_representations(
+        fields, recipe_ids, serializer.context.get("request")
+    )
+
+
+def render_uncached(serializer, recipes):
+    """Представления рецептов без кэша, при RECIPE_CACHE_ENABLED = False.
+
+    Общие части строятся из уже выбранных рецептов страницы,
+    без повторного чтения их строк.
+    """
+    fields = list(serializer.fields)
+    if representations.supports(fields):
+        shared = representations.loaded_representations(
+            fields, recipes, serializer.context.get("request")
+        )
+    else:
+        shared = serialize_shared(
+            serializer, [recipe.pk for recipe in recipes]
+        )
+    return [
+        serializer.overlay(
+            recipe,
+            shared[recipe.pk] if recipe.pk in shared
+            else serializer.to_shared_representation(copy(recipe))
+        )
+        for recipe in recipes
+    ]
+
+
+def render_recipes(serializer, recipes):
+    """Представления рецептов с общей частью из кэша.
+
+    Общая для всех пользователей часть хранится по id и версии рецепта,
+    версия меняется при любой записи в рецепт, его ингредиенты, теги
+    или автора. Промахи перечитываются из базы уже после чтения версий,
+    чтобы под новой версией не оказались старые данные, со связями
+    одним запросом на связь. Флаги избранного, корзины и подписки
+    накладываются для каждого запроса отдельно.
+
+    Поэтому от рецептов страницы нужны только id, author_id и флаги.
+    Рецепты, удалённые после выборки страницы, в результат не попадают.
+    """
+    if not settings.RECIPE_CACHE_ENABLED:
+        return render_uncached(serializer, recipes)
+    versions = get_versions(Recipe, {recipe.pk for recipe in recipes})
+    # Версия всей модели сбрасывает кэш после массовой загрузки
+    generation = get_version(Recipe)
+    variant = variant_key(serializer)
+    keys = {
+        recipe.pk: REPRESENTATION_KEY.format(
+            generation, recipe.pk, versions[recipe.pk], variant
+        )
+        for recipe in recipes
+    }
+    shared = cache.get_many(set(keys.values()))
+    missed = [pk for pk, key in keys.items() if key not in shared]
+    if missed:
+        # Реплика могла не догнать версию: промахи читаются с основной
+        with primary():
+            rendered = {
+                keys[pk]: data
+                for pk, data in render_shared(serializer, missed).items()
+            }
+        cache.set_many(rendered, timeout=settings.RECIPE_CACHE_TIMEOUT)
+        shared.update(rendered)
+        recipes = [recipe for recipe in recipes if keys[recipe.pk] in shared]
+    record_stats(len(keys) - len(missed), len(missed))
+    return [
+        serializer.overlay(recipe, shared[keys[recipe.pk]])
+        for recipe in recipes
+    ]
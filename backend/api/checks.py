@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core import checks
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Версии и ETag в локальном кэше у каждого процесса свои."""
+    if settings.SHARED_CACHE:
+        return []
+    return [
+        checks.Warning(
+            "Кэш LocMemCache не общий для процессов: изменения, "
+            "сделанные в одном воркере, не сбрасывают версии в остальных.",
+            hint="Задайте CACHE_BACKEND и CACHE_LOCATION для Redis "
+                 "или Memcached.",
+            id="api.W001",
+        )
+    ]
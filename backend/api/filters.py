@@ -1,14 +1,57 @@
+import json
+
+from django import forms
+from django.db import connection
+from django.db.models.expressions import RawSQL
 from django_filters.rest_framework import FilterSet, filters
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import BaseFilterBackend
+
+from recipes.indexes import ingredient_index, recipe_ingredient_index
+from recipes.models import Recipe
+from recipes.search import search_recipes
+from recipes.tags import filter_by_tags, tag_bits
+
+
+def id_list(ids):
+    """Список id одним параметром запроса вместо IN (%s, %s, ...)."""
+    ids = sorted(ids)
+    if connection.vendor == "postgresql":
+        return RawSQL("SELECT unnest(%s::integer[])", (ids,))
+    return RawSQL("SELECT value FROM json_each(%s)", (json.dumps(ids),))
+
+
+def tag_choices():
+    """Слаги тегов из кэша, см. tag_bits()."""
+    return [(slug, slug) for slug in tag_bits()]
+
+
+class TagsField(forms.MultipleChoiceField):
 
-from recipes.models import Recipe, Tag
+    def validate(self, value):
+        # Слаг тега, созданного в другом процессе, перечитывает справочник
+        if value:
+            tag_bits(value)
+        super().validate(value)
+
+
+class TagsFilter(filters.MultipleChoiceFilter):
+    field_class = TagsField
+
+
+class IntegerInFilter(filters.BaseInFilter, filters.NumberFilter):
+    # Дробные и нечисловые id отклоняются, а не округляются
+    field_class = forms.IntegerField
 
 
 class RecipeFilter(FilterSet):
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name="tags__slug",
-        to_field_name="slug",
-        queryset=Tag.objects.all()
+    # ?tags=a&tags=b - любой из тегов, ?tags_all=a&tags_all=b - все сразу
+    tags = TagsFilter(
+        choices=tag_choices,
+        method="tags_filter"
+    )
+    tags_all = TagsFilter(
+        choices=tag_choices,
+        method="tags_all_filter"
     )
     is_favorited = filters.BooleanFilter(
         method="is_favorited_filter"
@@ -16,6 +59,25 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method="is_in_shopping_cart_filter"
     )
+    # Ингредиенты перечисляются через запятую: ?ingredients=1,2,3
+    ingredients = IntegerInFilter(
+        method="ingredients_filter"
+    )
+    exclude_ingredients = IntegerInFilter(
+        method="exclude_ingredients_filter"
+    )
+    pantry = IntegerInFilter(
+        method="pantry_filter"
+    )
+    pantry_match = filters.NumberFilter(
+        method="pantry_match_filter",
+        min_value=1,
+        max_value=100
+    )
+    # Объявлен последним, чтобы искать среди уже отфильтрованных рецептов
+    search = filters.CharFilter(
+        method="search_filter"
+    )
 
     class Meta:
         fields = (
@@ -24,6 +86,12 @@ class RecipeFilter(FilterSet):
         )
         model = Recipe
 
+    def tags_filter(self, queryset, name, value):
+        return filter_by_tags(queryset, value)
+
+    def tags_all_filter(self, queryset, name, value):
+        return filter_by_tags(queryset, value, match_all=True)
+
     def is_favorited_filter(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
             return queryset.filter(favorite__user=self.request.user)
@@ -34,6 +102,41 @@ class RecipeFilter(FilterSet):
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
 
+    def ingredients_filter(self, queryset, name, value):
+        recipe_ids = recipe_ingredient_index.including(value)
+        return queryset.filter(id__in=id_list(recipe_ids))
+
+    def exclude_ingredients_filter(self, queryset, name, value):
+        recipe_ids = recipe_ingredient_index.containing_any(value)
+        if not recipe_ids:
+            return queryset
+        return queryset.exclude(id__in=id_list(recipe_ids))
+
+    def pantry_filter(self, queryset, name, value):
+        """Рецепты, которые можно приготовить из перечисленного.
+
+        pantry_match задаёт, какая доля ингредиентов рецепта в процентах
+        должна быть в списке, по умолчанию - все.
+        """
+        percent = self.form.cleaned_data.get("pantry_match") or 100
+        recipe_ids = recipe_ingredient_index.covered(
+            value, percent
+        )
+        return queryset.filter(id__in=id_list(recipe_ids))
+
+    def pantry_match_filter(self, queryset, name, value):
+        return queryset
+
+    def search_filter(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
 
-class IngredientSearch(SearchFilter):
+class IngredientSearch(BaseFilterBackend):
+    """Поиск ингредиентов по названию через индекс в памяти процесса."""
     search_param = "name"
+
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get(self.search_param)
+        if not name or view.action != "list":
+            return queryset
+        return ingredient_index.search(name)
@@ -0,0 +1,118 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import add_allow_writes_argument, check_writes_allowed
+from api.benchmarks.load import (
+    PERCENTILES,
+    WORKLOAD,
+    BenchmarkData,
+    compare,
+    load_report,
+    run,
+    save_report
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный прогон API смешанными запросами: пропускная "
+        "способность, задержки и число запросов к БД по точкам"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type=int, default=1000,
+            help="Количество учитываемых запросов"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=4,
+            help="Количество параллельных клиентов"
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=20,
+            help="Сколько первых запросов каждого клиента не учитывать"
+        )
+        parser.add_argument(
+            "--users", type=int, default=50,
+            help="Сколько пользователей выбрать для запросов"
+        )
+        parser.add_argument(
+            "--base-url",
+            help=(
+                "Адрес запущенного сервера, например http://localhost:8000; "
+                "без него запросы идут в текущем процессе"
+            )
+        )
+        parser.add_argument(
+            "--scenarios", nargs="+",
+            choices=[name for name, _, _, _ in WORKLOAD],
+            help="Сценарии нагрузки, по умолчанию все"
+        )
+        parser.add_argument(
+            "--seed", type=int, default=None,
+            help="Зерно генератора случайных чисел"
+        )
+        parser.add_argument(
+            "--output",
+            help="Сохранить отчёт в JSON-файл"
+        )
+        parser.add_argument(
+            "--compare",
+            help="Сравнить с отчётом из JSON-файла"
+        )
+        parser.add_argument(
+            "--threshold", type=float, default=0.2,
+            help="Допустимое ухудшение задержки и пропускной способности"
+        )
+        add_allow_writes_argument(parser)
+
+    def handle(self, *args, **options):
+        # Токены создаются для выбранных пользователей, а сценарии
+        # избранного и списка покупок добавляют и удаляют записи
+        check_writes_allowed(options)
+        data = BenchmarkData(users=options["users"])
+        if not data.tokens:
+            raise CommandError(
+                "Нет пользователей: создайте данные командой generate_dataset"
+            )
+        report = run(
+            data,
+            requests=options["requests"],
+            concurrency=options["concurrency"],
+            warmup=options["warmup"],
+            base_url=options["base_url"],
+            seed=options["seed"],
+            scenarios=options["scenarios"]
+        )
+        self.write_report(report)
+        if options["output"]:
+            save_report(report, options["output"])
+        if options["compare"]:
+            baseline = load_report(options["compare"])
+            for key in ("mode", "concurrency"):
+                if baseline.get(key) != report[key]:
+                    self.stdout.write(self.style.WARNING(
+                        f"{key} отличается от сохранённого отчёта: "
+                        f"{baseline.get(key)} и {report[key]}"
+                    ))
+            regressions = compare(report, baseline, options["threshold"])
+            for message in regressions:
+                self.stdout.write(self.style.WARNING(message))
+            if regressions:
+                raise CommandError(f"Ухудшений: {len(regressions)}")
+            self.stdout.write(self.style.SUCCESS("Ухудшений нет"))
+
+    def write_report(self, report):
+        self.stdout.write(
+            f"{report['requests']} запросов за {report['duration']} с, "
+            f"{report['throughput']} запросов/с"
+        )
+        for name, stats in report["endpoints"].items():
+            latencies = " ".join(
+                f"p{percent}={stats[f'p{percent}_ms']}"
+                for percent in PERCENTILES
+            )
+            self.stdout.write(
+                f"{name}: {stats['requests']} ({stats['errors']} ошибок), "
+                f"{stats['throughput']}/с, {latencies} мс, "
+                f"БД: {stats['queries']}"
+            )
@@ -0,0 +1,102 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import add_allow_writes_argument, check_writes_allowed
+from api.benchmarks.load import READ_SCENARIOS, BenchmarkData, run
+from api.benchmarks.servers import server, slow_clients
+
+# Приложение, класс воркера gunicorn и переменные окружения режима
+SERVERS = {
+    "wsgi": ("foodgram.wsgi:application", "sync", {
+        "ASYNC_READ_VIEWS": "False",
+    }),
+    "asgi": ("foodgram.asgi:application", "uvicorn.workers.UvicornWorker", {
+        "ASYNC_READ_VIEWS": "True",
+    }),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает чтение API под синхронными воркерами WSGI и "
+        "асинхронными представлениями под ASGI при одном числе воркеров"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=1,
+            help="Количество воркеров gunicorn в обоих режимах"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, nargs="+", default=[1, 8, 32],
+            help="Уровни параллельности клиентов"
+        )
+        parser.add_argument(
+            "--requests", type=int, default=500,
+            help="Количество учитываемых запросов на каждый прогон"
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=5,
+            help="Сколько первых запросов каждого клиента не учитывать"
+        )
+        parser.add_argument(
+            "--slow-clients", type=int, default=0,
+            help="Сколько медленных клиентов держат соединения при прогоне"
+        )
+        parser.add_argument(
+            "--slow-client-delay", type=float, default=1.0,
+            help="За сколько секунд медленный клиент передаёт запрос"
+        )
+        parser.add_argument(
+            "--port", type=int, default=8765,
+            help="Порт, на котором запускаются серверы"
+        )
+        parser.add_argument(
+            "--seed", type=int, default=None,
+            help="Зерно генератора случайных чисел"
+        )
+        add_allow_writes_argument(parser)
+
+    def handle(self, *args, **options):
+        # Сценарии только читают, но пользователям создаются токены
+        check_writes_allowed(options)
+        data = BenchmarkData()
+        if not data.tokens:
+            raise CommandError(
+                "Нет пользователей: создайте данные командой generate_dataset"
+            )
+        results = {}
+        for mode, (application, worker_class, env) in SERVERS.items():
+            try:
+                with server(
+                    application, worker_class, options["workers"],
+                    options["port"], env
+                ) as base_url, slow_clients(
+                    base_url, options["slow_clients"],
+                    options["slow_client_delay"]
+                ):
+                    for concurrency in options["concurrency"]:
+                        results[mode, concurrency] = run(
+                            data,
+                            requests=options["requests"],
+                            concurrency=concurrency,
+                            warmup=options["warmup"],
+                            base_url=base_url,
+                            seed=options["seed"],
+                            scenarios=READ_SCENARIOS
+                        )
+            except RuntimeError as error:
+                raise CommandError(error)
+        self.stdout.write(
+            f"Воркеров: {options['workers']}, "
+            f"медленных клиентов: {options['slow_clients']}; "
+            "запросов/с и p95 всех запросов, мс"
+        )
+        for concurrency in options["concurrency"]:
+            line = [f"клиентов {concurrency:>4}:"]
+            for mode in SERVERS:
+                report = results[mode, concurrency]
+                line.append(
+                    f"{mode} {report['throughput']:>8} "
+                    f"p95 {report.get('p95_ms', '-'):>8}"
+                )
+            self.stdout.write("  ".join(line))
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from api.benchmarks import add_allow_writes_argument, check_writes_allowed
+from api.benchmarks.auth import authenticate
+from users.authentication import CachedTokenAuthentication, forget_tokens
+from users.models import CustomUser
+
+# Название варианта и класс аутентификации
+AUTHENTICATORS = (
+    ("без кэша", TokenAuthentication),
+    ("с кэшем", CachedTokenAuthentication),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает аутентификацию по токену с кэшем и без него: "
+        "время и число запросов к БД на запрос"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type=int, default=5000,
+            help="Количество аутентифицируемых запросов"
+        )
+        parser.add_argument(
+            "--users", type=int, default=50,
+            help="Сколько пользователей делают запросы"
+        )
+        add_allow_writes_argument(parser)
+
+    def handle(self, *args, **options):
+        check_writes_allowed(options)
+        tokens = [
+            Token.objects.get_or_create(user_id=user_id)[0].key
+            for user_id in CustomUser.objects.filter(
+                is_active=True
+            ).values_list("id", flat=True)[:options["users"]]
+        ]
+        if not tokens:
+            raise CommandError(
+                "Нет пользователей: создайте данные командой generate_dataset"
+            )
+        # Прогон с кэшем начинается с пустого кэша и включает промахи
+        forget_tokens(tokens)
+        for name, authenticator in AUTHENTICATORS:
+            report = authenticate(
+                authenticator(), tokens, options["requests"]
+            )
+            self.stdout.write(
+                f"{name}: {report['us_per_request']} мкс, "
+                f"БД: {report['queries_per_request']} запросов на запрос"
+            )
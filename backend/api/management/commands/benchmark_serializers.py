@@ -0,0 +1,61 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIRequestFactory
+
+from api.benchmarks.serializers import render
+from api.cache import render_shared, serialize_shared
+from api.serializers import RecipeSerializer
+from api.views import RECIPE_VIEWS
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает представление рецептов полями DRF и из строк .values(): "
+        "процессорное время на страницу и совпадение JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--page-sizes", type=int, nargs="+", default=[6, 24, 100],
+            help="Размеры страниц"
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=20,
+            help="Сколько раз отрисовать каждую страницу"
+        )
+
+    def handle(self, *args, **options):
+        recipe_ids = list(
+            Recipe.objects.values_list("id", flat=True)[
+                :max(options["page_sizes"])
+            ]
+        )
+        if not recipe_ids:
+            raise CommandError(
+                "Нет рецептов: создайте данные командой generate_dataset"
+            )
+        request = APIRequestFactory().get("/api/recipes/")
+        request.user = AnonymousUser()
+        mismatches = 0
+        for view, fields in RECIPE_VIEWS.items():
+            serializer = RecipeSerializer(
+                context={"request": request, "fields": fields}
+            )
+            for size in options["page_sizes"]:
+                page = recipe_ids[:size]
+                drf, expected = render(
+                    serialize_shared, serializer, page, options["repeat"]
+                )
+                fast, content = render(
+                    render_shared, serializer, page, options["repeat"]
+                )
+                same = content == expected
+                mismatches += not same
+                self.stdout.write(
+                    f"{view}, {len(page)} рецептов: DRF {drf} мс, "
+                    f".values() {fast} мс, в {drf / fast:.1f} раза быстрее, "
+                    + ("JSON совпадает" if same else "JSON отличается")
+                )
+        if mismatches:
+            raise CommandError(f"Ответы отличаются: {mismatches}")
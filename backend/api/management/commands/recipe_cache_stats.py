@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = "Попадания в кэш представлений рецептов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Обнулить счётчики после вывода"
+        )
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        hit_ratio = stats["hit_ratio"]
+        self.stdout.write(
+            f"Попаданий: {stats['hits']}, промахов: {stats['misses']}, "
+            "доля попаданий: "
+            + ("-" if hit_ratio is None else f"{hit_ratio:.1%}")
+        )
+        if options["reset"]:
+            reset_stats()
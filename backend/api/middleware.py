@@ -0,0 +1,288 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from hashlib import md5
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+
+from foodgram.replicas import RequestState, current_request
+
+logger = logging.getLogger("foodgram.sql")
+
+IN_LIST_RE = re.compile(r"IN \((?:%s, )*%s\)")
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+STICKY_KEY = "replica_sticky:{}"
+STICKY_COOKIE = "replica_sticky"
+
+
+class QueryBudgetExceededError(Exception):
+    pass
+
+
+class QueryStats:
+    """Счётчик SQL-запросов, подключаемый через execute_wrapper."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.slowest_duration = 0.0
+        self.slowest_sql = ""
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            self.fingerprints[IN_LIST_RE.sub("IN (...)", sql)] += 1
+            if duration >= self.slowest_duration:
+                self.slowest_duration = duration
+                self.slowest_sql = sql
+
+    @property
+    def duplicates(self):
+        return sum(
+            count - 1 for count in self.fingerprints.values() if count > 1
+        )
+
+
+# Счётчик текущего запроса к API: контекст доходит и до потоков,
+# в которых асинхронные представления выполняют запросы к базе
+current_stats = ContextVar("query_stats", default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """Подключает count_query к каждому новому соединению с базой."""
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+def get_query_budget(view_func, request):
+    """Бюджет запросов из атрибута query_budget класса представления.
+
+    Для ViewSet бюджет задаётся словарём по имени action,
+    для остальных представлений - числом.
+    """
+    view_class = getattr(view_func, "cls", None)
+    budget = getattr(view_class, "query_budget", None)
+    if not isinstance(budget, dict):
+        return budget
+    actions = getattr(view_func, "actions", None) or {}
+    return budget.get(actions.get(request.method.lower()))
+
+
+class QueryBudgetMiddleware:
+    """Учёт SQL-запросов каждого запроса к API.
+
+    Количество запросов, суммарное время и число повторов отдаются
+    в заголовках ответа и пишутся в лог foodgram.sql. При превышении
+    бюджета представления пишется предупреждение, а при
+    QUERY_BUDGET_RAISE = True выбрасывается QueryBudgetExceededError.
+    Работает и в синхронной, и в асинхронной цепочке обработки.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = QueryStats()
+        token = current_stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.process_stats(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        token = current_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.process_stats(request, response, stats)
+
+    def process_stats(self, request, response, stats):
+        """Заголовки со статистикой и проверка бюджета.
+
+        Тело потокового ответа читает базу уже после выхода из
+        представления, поэтому его запросы досчитываются при отдаче,
+        а бюджет проверяется после последнего фрагмента. Заголовки
+        такого ответа содержат только запросы представления.
+        """
+        response["X-DB-Query-Count"] = stats.count
+        response["X-DB-Query-Time"] = f"{stats.duration * 1000:.1f}"
+        response["X-DB-Duplicate-Queries"] = stats.duplicates
+        if response.streaming:
+            response.streaming_content = self.count_stream(
+                request, response, stats, response.streaming_content
+            )
+            return response
+        self.check_budget(request, response, stats)
+        return response
+
+    def count_stream(self, request, response, stats, content):
+        iterator = iter(content)
+        while True:
+            token = current_stats.set(stats)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                current_stats.reset(token)
+            yield chunk
+        self.check_budget(request, response, stats)
+
+    def check_budget(self, request, response, stats):
+        budget = getattr(request, "query_budget", None)
+        log_data = {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "queries": stats.count,
+            "sql_time_ms": round(stats.duration * 1000, 1),
+            "duplicates": stats.duplicates,
+            "slowest_ms": round(stats.slowest_duration * 1000, 1),
+            "slowest_sql": stats.slowest_sql,
+            "budget": budget,
+        }
+        logger.info(
+            "%(method)s %(path)s queries=%(queries)s "
+            "sql_time_ms=%(sql_time_ms)s duplicates=%(duplicates)s "
+            "slowest_ms=%(slowest_ms)s",
+            log_data,
+            extra={"sql": log_data}
+        )
+        if budget is not None and stats.count > budget:
+            message = (
+                f"{request.method} {request.path}: {stats.count} "
+                f"SQL-запросов при бюджете {budget}"
+            )
+            if settings.QUERY_BUDGET_RAISE:
+                raise QueryBudgetExceededError(message)
+            logger.warning(message, extra={"sql": log_data})
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_query_budget(view_func, request)
+
+
+def client_key(request):
+    """Ключ клиента по токену или сессии, для анонимного - None.
+
+    Адрес анонимного клиента за nginx - адрес nginx, общий для всех,
+    поэтому анонимный клиент закрепляется кукой, см. ReplicaMiddleware.
+    """
+    identity = (
+        request.META.get("HTTP_AUTHORIZATION")
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not identity:
+        return None
+    return STICKY_KEY.format(md5(identity.encode()).hexdigest())
+
+
+def stick_to_primary(response):
+    response.set_cookie(
+        STICKY_COOKIE,
+        "1",
+        max_age=settings.REPLICA_STICKY_SECONDS,
+        httponly=True,
+        samesite="Lax"
+    )
+
+
+class ReplicaMiddleware:
+    """Чтение с реплик с гарантией чтения своих записей.
+
+    Безопасные запросы читают с реплик (см. foodgram.replicas), пока
+    клиент ничего не записывал. После записи клиент на
+    REPLICA_STICKY_SECONDS секунд закрепляется за основной базой,
+    чтобы не увидеть на отстающей реплике состояние до своей записи:
+    клиент с токеном или сессией - записью в кэше, анонимный - кукой.
+    Если запрос к реплике упал с ошибкой базы, безопасный запрос
+    повторяется целиком на основной базе вместо ответа 500.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def respond(self, request, state):
+        token = current_request.set(state)
+        try:
+            return self.get_response(request)
+        finally:
+            current_request.reset(token)
+
+    async def arespond(self, request, state):
+        token = current_request.set(state)
+        try:
+            return await self.get_response(request)
+        finally:
+            current_request.reset(token)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        key = client_key(request)
+        sticky = (
+            STICKY_COOKIE in request.COOKIES if key is None
+            else cache.get(key) is not None
+        )
+        state = RequestState(request.method in SAFE_METHODS and not sticky)
+        response = self.respond(request, state)
+        if state.replica_failed and response.status_code >= 500:
+            state = RequestState(False)
+            response = self.respond(request, state)
+        if state.wrote or request.method not in SAFE_METHODS:
+            if key is None:
+                stick_to_primary(response)
+            else:
+                cache.set(key, True, settings.REPLICA_STICKY_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        key = client_key(request)
+        sticky = (
+            STICKY_COOKIE in request.COOKIES if key is None
+            else await cache.aget(key) is not None
+        )
+        state = RequestState(request.method in SAFE_METHODS and not sticky)
+        response = await self.arespond(request, state)
+        if state.replica_failed and response.status_code >= 500:
+            state = RequestState(False)
+            response = await self.arespond(request, state)
+        if state.wrote or request.method not in SAFE_METHODS:
+            if key is None:
+                stick_to_primary(response)
+            else:
+                await cache.aset(key, True, settings.REPLICA_STICKY_SECONDS)
+        return response
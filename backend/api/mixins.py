@@ -0,0 +1,229 @@
+from hashlib import md5
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .pagination import alist
+from foodgram.replicas import synced_since
+from recipes import relations
+from recipes.versions import get_version, version_time
+
+
+class ConditionalReadMixin:
+    """ETag и Cache-Control для справочников.
+
+    ETag строится из версии данных модели и адреса запроса, поэтому
+    If-None-Match проверяется до обращения к базе и сериализации.
+    Версия читается из кэша один раз, а тело ответа собирается
+    на реплике, только если она догнала момент этой версии.
+
+    Без общего кэша (REFERENCE_ETAG_ENABLED = False) ETag не отдаётся:
+    ответ тогда устаревает не дольше, чем через REFERENCE_CACHE_MAX_AGE.
+    """
+
+    def get_etag(self, request, *args, **kwargs):
+        key = md5(
+            f"{request.get_full_path()}|{request.META.get('HTTP_ACCEPT')}"
+            .encode()
+        ).hexdigest()
+        return f"{self.model_name}-{self.version}-{key}"
+
+    def load_version(self):
+        model = self.get_queryset().model
+        self.model_name = model._meta.model_name
+        self.version = get_version(model)
+
+    def conditional(self, view, request, *args, **kwargs):
+        if not settings.REFERENCE_ETAG_ENABLED:
+            return self.patch_cache_headers(view(request, *args, **kwargs))
+        self.load_version()
+        with synced_since(version_time(self.version)):
+            response = condition(etag_func=self.get_etag)(view)(
+                request, *args, **kwargs
+            )
+        return self.patch_cache_headers(response)
+
+    async def async_conditional(self, view, request, *args, **kwargs):
+        if not settings.REFERENCE_ETAG_ENABLED:
+            return self.patch_cache_headers(
+                await view(request, *args, **kwargs)
+            )
+        await sync_to_async(self.load_version)()
+        etag = quote_etag(self.get_etag(request, *args, **kwargs))
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            with synced_since(version_time(self.version)):
+                response = await view(request, *args, **kwargs)
+        response.headers.setdefault("ETag", etag)
+        return self.patch_cache_headers(response)
+
+    def patch_cache_headers(self, response):
+        if response.status_code in (200, 304):
+            response["Cache-Control"] = (
+                f"public, max-age={settings.REFERENCE_CACHE_MAX_AGE}"
+            )
+            patch_vary_headers(response, ("Accept",))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
+    async def async_list(self, request, *args, **kwargs):
+        return await self.async_conditional(
+            super().async_list, request, *args, **kwargs
+        )
+
+    async def async_retrieve(self, request, *args, **kwargs):
+        return await self.async_conditional(
+            super().async_retrieve, request, *args, **kwargs
+        )
+
+
+class AsyncReadMixin:
+    """Асинхронное чтение для ASGI.
+
+    При ASYNC_READ_VIEWS = True GET-запросы к действиям из async_actions
+    обслуживают корутины async_<действие>: выборки и подсчёт идут через
+    асинхронный ORM, а аутентификация, фильтры и сериализаторы общие
+    с синхронными действиями и выполняются в потоке запроса. Остальные
+    методы и ответы не в JSON обрабатывает синхронное представление.
+    """
+    async_actions = ("list", "retrieve")
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if (
+            not settings.ASYNC_READ_VIEWS
+            or actions.get("get") not in cls.async_actions
+        ):
+            return view
+        sync_view = sync_to_async(view)
+
+        async def async_view(request, *args, **kwargs):
+            if request.method == "GET":
+                self = cls(**initkwargs)
+                self.action_map = {"head": actions["get"], **actions}
+                for method, action in self.action_map.items():
+                    setattr(self, method, getattr(self, action))
+                self.request = request
+                response = await self.async_dispatch(request, *args, **kwargs)
+                if response is not None:
+                    return response
+            return await sync_view(request, *args, **kwargs)
+
+        async_view.cls = view.cls
+        async_view.initkwargs = view.initkwargs
+        async_view.actions = view.actions
+        async_view.csrf_exempt = True
+        return async_view
+
+    async def async_dispatch(self, request, *args, **kwargs):
+        """APIView.dispatch с асинхронным обработчиком действия.
+
+        Возвращает None, если клиент просит не JSON: такой запрос
+        отдаётся синхронному представлению.
+        """
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await sync_to_async(self.perform_authentication)(request)
+            self.initial(request, *args, **kwargs)
+            if not isinstance(request.accepted_renderer, JSONRenderer):
+                return None
+            handler = getattr(self, f"async_{self.action}")
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(
+            request, response, *args, **kwargs
+        )
+        return self.response
+
+    async def aget_object(self):
+        queryset = await sync_to_async(self.filter_queryset)(
+            self.get_queryset()
+        )
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        except (
+            queryset.model.DoesNotExist, TypeError, ValueError,
+            ValidationError
+        ):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def apaginate_queryset(self, queryset):
+        paginator = self.paginator
+        if paginator is None:
+            return None
+        if hasattr(paginator, "apaginate_queryset"):
+            return await paginator.apaginate_queryset(
+                queryset, self.request, view=self
+            )
+        return await sync_to_async(self.paginate_queryset)(queryset)
+
+    async def aserialize(self, instance, many=False):
+        """Данные сериализатора: он может читать кэш и связи из базы."""
+        return await sync_to_async(
+            lambda: self.get_serializer(instance, many=many).data
+        )()
+
+    async def async_list(self, request, *args, **kwargs):
+        queryset = await sync_to_async(self.filter_queryset)(
+            self.get_queryset()
+        )
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(
+                await self.aserialize(page, many=True)
+            )
+        objects = await alist(queryset)
+        return Response(await self.aserialize(objects, many=True))
+
+    async def async_retrieve(self, request, *args, **kwargs):
+        return Response(await self.aserialize(await self.aget_object()))
+
+
+class BulkRelationsMixin:
+    """Групповое добавление и удаление связей пользователя.
+
+    POST добавляет связи с объектами из списка, DELETE удаляет их
+    одним запросом к базе. Уже существующие и отсутствующие связи
+    пропускаются, в ответе - id объектов, которых изменение коснулось.
+    Как и у одиночных запросов, POST отвечает 201, а DELETE - 200,
+    потому что ответ содержит тело.
+    """
+
+    def change_relations(self, request, model, serializer_class,
+                         clear_all=False):
+        field, = serializer_class().fields
+        serializer = serializer_class(
+            data=request.data,
+            partial=clear_all and request.method == "DELETE"
+        )
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data.get(field)
+        if request.method == "POST":
+            added = relations.add(model, request.user.id, ids)
+            return Response({"added": added}, status=status.HTTP_201_CREATED)
+        removed = relations.remove(model, request.user.id, ids)
+        return Response({"removed": removed}, status=status.HTTP_200_OK)
@@ -1,5 +1,104 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import InvalidPage
+from django.db import connections
+from django.db.models import QuerySet
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+
+async def alist(objects):
+    """Список объектов выборки через асинхронный ORM."""
+    if isinstance(objects, QuerySet):
+        return [obj async for obj in objects]
+    return list(objects)
 
 
 class CustomPagination(PageNumberPagination):
     page_size_query_param = "limit"
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset с подсчётом и выборкой страницы без блокировок."""
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        paginator = self.django_paginator_class(queryset, page_size)
+        if isinstance(queryset, QuerySet):
+            paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            ))
+        self.page.object_list = await alist(self.page.object_list)
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Постраничный вывод по курсору для ленты рецептов.
+
+    Включается параметром pagination=cursor или наличием cursor.
+    Любая страница выбирается условием по id без OFFSET. Общее количество
+    по умолчанию не считается: count=exact даёт точное значение,
+    count=estimate - оценку планировщика PostgreSQL. Выборка с другой
+    сортировкой, например по релевантности поиска, по курсору
+    не листается: курсор заменил бы её сортировкой по id.
+    """
+    ordering = "-id"
+    page_size = 6
+    page_size_query_param = "limit"
+    mode_query_param = "pagination"
+    count_query_param = "count"
+
+    @classmethod
+    def is_requested(cls, request):
+        return (
+            request.query_params.get(cls.mode_query_param) == "cursor"
+            or cls.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if queryset.query.order_by and tuple(
+            queryset.query.order_by
+        ) != (self.ordering,):
+            raise ValidationError({
+                self.cursor_query_param: (
+                    "Постраничный вывод по курсору не сочетается "
+                    "с сортировкой выборки, например с поиском"
+                )
+            })
+        self.count = self.get_count(queryset, request)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param)
+        connection = connections[queryset.db]
+        if mode == "estimate" and connection.vendor == "postgresql":
+            sql, params = queryset.order_by().query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                plan = cursor.fetchone()[0]
+            return plan[0]["Plan"]["Plan Rows"]
+        if mode in ("exact", "estimate"):
+            return queryset.count()
+        return None
+
+    def get_paginated_response(self, data):
+        return Response({
+            "count": self.count,
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"]["count"] = {
+            "type": "integer",
+            "nullable": True,
+        }
+        return response_schema
@@ -0,0 +1,158 @@
+import csv
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.http import Http404
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.renderers import BaseRenderer
+
+CHUNK_SIZE = 64 * 1024
+PDF_FONT_NAME = "ShoppingListFont"
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 18
+PDF_MARGIN = 50
+
+
+class ShoppingListContentNegotiation(BaseContentNegotiation):
+    """Формат списка покупок выбирается только параметром format.
+
+    Заголовок Accept не учитывается, без параметра отдаётся
+    первый из renderer_classes.
+    """
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        format_query = format_suffix or request.query_params.get("format")
+        if format_query is None:
+            return renderers[0], renderers[0].media_type
+        for renderer in renderers:
+            if renderer.format == format_query:
+                return renderer, renderer.media_type
+        raise Http404
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Потоковая выгрузка списка покупок.
+
+    stream() принимает итератор строк с ключами ingredient__name,
+    ingredient__measurement_unit и amount и отдаёт байты частями,
+    не собирая весь файл в памяти.
+    """
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Обычный Response здесь бывает только с описанием ошибки."""
+        if isinstance(data, dict):
+            data = data.get("detail", data)
+        return str(data).encode()
+
+    def stream(self, rows):
+        raise NotImplementedError
+
+    @staticmethod
+    def format_row(row):
+        return (
+            f'{row["ingredient__name"]} '
+            f'({row["ingredient__measurement_unit"]}) '
+            f'- {row["amount"]}'
+        )
+
+    @staticmethod
+    def chunked(lines):
+        buffer = []
+        size = 0
+        for line in lines:
+            encoded = line.encode()
+            buffer.append(encoded)
+            size += len(encoded)
+            if size >= CHUNK_SIZE:
+                yield b"".join(buffer)
+                buffer = []
+                size = 0
+        if buffer:
+            yield b"".join(buffer)
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    media_type = "text/plain"
+    format = "txt"
+
+    def stream(self, rows):
+        lines = (
+            ("\n" if index else "") + self.format_row(row)
+            for index, row in enumerate(rows)
+        )
+        return self.chunked(lines)
+
+
+class Echo:
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = "text/csv"
+    format = "csv"
+    header = ("Ингредиент", "Единица измерения", "Количество")
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        lines = (
+            writer.writerow((
+                row["ingredient__name"],
+                row["ingredient__measurement_unit"],
+                row["amount"],
+            )) for row in rows
+        )
+        yield "\ufeff".encode() + writer.writerow(self.header).encode()
+        yield from self.chunked(lines)
+
+
+class ShoppingListPDFRenderer(ShoppingListRenderer):
+    """PDF для печати.
+
+    reportlab держит все страницы документа в памяти до save(),
+    поэтому PDF строится целиком и только потом отдаётся частями.
+    Память ограничена числом строк: список длиннее max_rows
+    в PDF не выгружается, для него есть txt и csv.
+    Для кириллицы нужен TTF-шрифт SHOPPING_LIST_PDF_FONT.
+    """
+    media_type = "application/pdf"
+    format = "pdf"
+    charset = None
+    title = "Список покупок"
+    spool_size = 1024 * 1024
+    max_rows = settings.SHOPPING_LIST_PDF_MAX_ROWS
+
+    def stream(self, rows):
+        if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT)
+            )
+        width, height = A4
+        with SpooledTemporaryFile(max_size=self.spool_size) as file:
+            canvas = Canvas(file, pagesize=A4)
+            canvas.setTitle(self.title)
+            canvas.setFont(PDF_FONT_NAME, PDF_FONT_SIZE + 4)
+            canvas.drawString(PDF_MARGIN, height - PDF_MARGIN, self.title)
+            canvas.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+            y = height - PDF_MARGIN - 2 * PDF_LINE_HEIGHT
+            for row in rows:
+                if y < PDF_MARGIN:
+                    canvas.showPage()
+                    canvas.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+                    y = height - PDF_MARGIN
+                canvas.drawString(
+                    PDF_MARGIN, y, f"• {self.format_row(row)}"
+                )
+                y -= PDF_LINE_HEIGHT
+            canvas.save()
+            file.seek(0)
+            yield from iter(lambda: file.read(CHUNK_SIZE), b"")
@@ -0,0 +1,166 @@
+from collections import defaultdict
+
+from recipes.images import variant_url
+from recipes.models import Recipe, RecipeIngredient, RecipeTag
+from users.models import CustomUser
+
+# Столбцы рецепта, которые нужны полям представления помимо id
+COLUMNS = {
+    "author": ("author_id",),
+    "name": ("name",),
+    "image": ("image",),
+    "image_card": ("image", "image_variants"),
+    "image_detail": ("image", "image_variants"),
+    "image_webp": ("image", "image_variants"),
+    "text": ("text",),
+    "cooking_time": ("cooking_time",),
+}
+
+
+def absolute(url, request):
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def tags_map(recipe_ids):
+    tags = defaultdict(list)
+    rows = RecipeTag.objects.filter(recipe_id__in=recipe_ids).order_by(
+        "tag__name"
+    ).values_list("recipe_id", "tag_id", "tag__name", "tag__color",
+                  "tag__slug")
+    for recipe_id, tag_id, name, color, slug in rows:
+        tags[recipe_id].append(
+            {"id": tag_id, "name": name, "color": color, "slug": slug}
+        )
+    return tags
+
+
+def authors_map(author_ids):
+    return {
+        author_id: {
+            "email": email,
+            "id": author_id,
+            "username": username,
+            "first_name": first_name,
+            "last_name": last_name,
+            "is_subscribed": False,
+        }
+        for author_id, email, username, first_name, last_name
+        in CustomUser.objects.filter(id__in=author_ids).values_list(
+            "id", "email", "username", "first_name", "last_name"
+        )
+    }
+
+
+def ingredients_map(recipe_ids):
+    ingredients = defaultdict(list)
+    rows = RecipeIngredient.objects.filter(recipe_id__in=recipe_ids).order_by(
+        "id"
+    ).values_list("recipe_id", "ingredient_id", "ingredient__name",
+                  "ingredient__measurement_unit", "amount")
+    for recipe_id, ingredient_id, name, measurement_unit, amount in rows:
+        ingredients[recipe_id].append({
+            "id": ingredient_id,
+            "name": name,
+            "measurement_unit": measurement_unit,
+            "amount": amount,
+        })
+    return ingredients
+
+
+def image_getter(variant, request):
+    storage = Recipe._meta.get_field("image").storage
+
+    def get(row):
+        name = row["image"]
+        if not name:
+            return None
+        if variant is None:
+            return absolute(storage.url(name), request)
+        return absolute(
+            variant_url(name, variant, row["image_variants"]), request
+        )
+    return get
+
+
+def compile_getters(fields, rows, request):
+    """Функции, которые достают значения полей из строки рецепта.
+
+    Связи загружаются здесь же, по запросу на связь для всех строк.
+    """
+    recipe_ids = [row["id"] for row in rows]
+    getters = {
+        "id": lambda row: row["id"],
+        "is_favorited": lambda row: False,
+        "is_in_shopping_cart": lambda row: False,
+        "name": lambda row: row["name"],
+        "image": image_getter(None, request),
+        "image_card": image_getter("card", request),
+        "image_detail": image_getter("detail", request),
+        "image_webp": image_getter("webp", request),
+        "text": lambda row: row["text"],
+        "cooking_time": lambda row: row["cooking_time"],
+    }
+    if "tags" in fields:
+        tags = tags_map(recipe_ids)
+        getters["tags"] = lambda row: tags[row["id"]]
+    if "author" in fields:
+        authors = authors_map({row["author_id"] for row in rows})
+        getters["author"] = lambda row: authors[row["author_id"]]
+    if "ingredients" in fields:
+        ingredients = ingredients_map(recipe_ids)
+        getters["ingredients"] = lambda row: ingredients[row["id"]]
+    return [(field, getters[field]) for field in fields]
+
+
+def supports(fields):
+    return set(fields) <= {"id", "tags", "ingredients", "is_favorited",
+                           "is_in_shopping_cart", *COLUMNS}
+
+
+def columns_of(fields):
+    return {
+        "id",
+        *(
+            column for field in fields if field in COLUMNS
+            for column in COLUMNS[field]
+        )
+    }
+
+
+def represent_rows(fields, rows, request):
+    getters = compile_getters(fields, rows, request)
+    return {
+        row["id"]: {field: get(row) for field, get in getters}
+        for row in rows
+    }
+
+
+def shared_representations(fields, recipe_ids, request=None):
+    """Общие части представлений рецептов без экземпляров моделей.
+
+    То же, что RecipeSerializer.to_shared_representation, но из строк
+    .values() и словарей связей: {id рецепта: представление}.
+    Удалённых рецептов в результате нет.
+    """
+    fields = list(fields)
+    rows = Recipe.objects.filter(id__in=recipe_ids).values(
+        *columns_of(fields)
+    ).order_by()
+    return represent_rows(fields, list(rows), request)
+
+
+def loaded_representations(fields, recipes, request=None):
+    """shared_representations из уже выбранных экземпляров рецептов.
+
+    Столбцы рецепта второй раз не читаются, запросы идут только
+    за связями. Экземпляры должны содержать столбцы полей fields.
+    """
+    fields = list(fields)
+    columns = columns_of(fields)
+    rows = []
+    for recipe in recipes:
+        row = {column: getattr(recipe, column) for column in columns}
+        if "image" in row:
+            row["image"] = row["image"].name
+        rows.append(row)
+    return represent_rows(fields, rows, request)
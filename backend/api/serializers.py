@@ -1,27 +1,65 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
-from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models.manager import BaseManager
 from rest_framework import serializers
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.validators import UniqueTogetherValidator
 
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 
+from recipes import cart
+from recipes.images import variant_url
 from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
     RecipeIngredient,
+    RecipeTag,
     ShoppingCart,
+    ShoppingCartTotal,
     Tag
 )
+from recipes.tags import mask_of
 from users.models import Subscription
-from foodgram.settings import MIN_VALUE, MAX_VALUE
+from foodgram.settings import BULK_RELATIONS_LIMIT, MIN_VALUE, MAX_VALUE
+from .cache import USER_FIELDS, render_recipes
 
 User = get_user_model()
 
 
+def get_recipes_limit(request):
+    recipes_limit = request.query_params.get("recipes_limit")
+    if recipes_limit is None or not recipes_limit.isdigit():
+        return None
+    return int(recipes_limit)
+
+
+class ImageVariantField(serializers.Field):
+    """Ссылка на уменьшенную копию картинки рецепта.
+
+    Пока копия не создана, отдаётся ссылка на оригинал.
+    """
+
+    def __init__(self, variant, **kwargs):
+        self.variant = variant
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return None
+        url = variant_url(
+            recipe.image.name, self.variant, recipe.image_variants
+        )
+        request = self.context.get("request")
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
 class CustomUserSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
@@ -40,6 +78,8 @@ class CustomUserSerializer(UserSerializer):
         request = self.context.get("request")
         if not request or request.user.is_anonymous:
             return False
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         return Subscription.objects.filter(
             user=request.user,
             author=obj
@@ -90,12 +130,29 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         model = RecipeIngredient
 
 
+class ShoppingCartTotalSerializer(RecipeIngredientSerializer):
+
+    class Meta(RecipeIngredientSerializer.Meta):
+        model = ShoppingCartTotal
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        if isinstance(data, BaseManager):
+            data = data.all()
+        return render_recipes(self.child, list(data))
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField(read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_card = ImageVariantField("card")
+    image_detail = ImageVariantField("detail")
+    image_webp = ImageVariantField("webp")
 
     class Meta:
         fields = (
@@ -107,30 +164,85 @@ class RecipeSerializer(serializers.ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "image_card",
+            "image_detail",
+            "image_webp",
             "text",
             "cooking_time",
         )
+        list_serializer_class = RecipeListSerializer
         model = Recipe
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Поля, которые запросил клиент, без них - все
+        fields = self.context.get("fields")
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def to_representation(self, instance):
+        representations = render_recipes(self, [instance])
+        if not representations:
+            # Рецепт удалён, пока собирался ответ
+            raise NotFound()
+        return representations[0]
+
+    def to_shared_representation(self, instance):
+        """Часть представления, одинаковая для всех пользователей."""
+        instance.is_favorited = False
+        instance.is_in_shopping_cart = False
+        if "author" in self.fields:
+            instance.author.is_subscribed = False
+        return super().to_representation(instance)
+
+    def overlay(self, instance, data):
+        """Накладывает на общую часть флаги текущего пользователя."""
+        data = dict(data)
+        if "author" in data:
+            data["author"] = {
+                **data["author"],
+                "is_subscribed": self.get_is_subscribed(instance),
+            }
+        for field in USER_FIELDS:
+            if field in data:
+                data[field] = getattr(self, f"get_{field}")(instance)
+        return data
+
     def get_ingredients(self, obj):
-        ingredients = RecipeIngredient.objects.filter(recipe=obj)
+        ingredients = obj.recipeingredient_set.all()
         return RecipeIngredientSerializer(ingredients, many=True).data
 
     def get_user(self):
         return self.context.get("request").user
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, "is_favorited"):
+            return obj.is_favorited
         user = self.get_user()
         if user.is_anonymous:
             return False
         return Favorite.objects.filter(user=user, recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, "is_in_shopping_cart"):
+            return obj.is_in_shopping_cart
         user = self.get_user()
         if user.is_anonymous:
             return False
         return ShoppingCart.objects.filter(user=user, recipe=obj).exists()
 
+    def get_is_subscribed(self, obj):
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
+        user = self.get_user()
+        if user.is_anonymous:
+            return False
+        return Subscription.objects.filter(
+            user=user,
+            author_id=obj.author_id
+        ).exists()
+
 
 class CreateRecipeIngredientSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField()
@@ -149,9 +261,8 @@ class CreateRecipeIngredientSerializer(serializers.ModelSerializer):
 
 class CreateRecipeSerializer(serializers.ModelSerializer):
     author = CustomUserSerializer(read_only=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True
+    tags = serializers.ListField(
+        child=serializers.IntegerField()
     )
     ingredients = CreateRecipeIngredientSerializer(many=True)
     image = Base64ImageField()
@@ -173,65 +284,85 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         )
         model = Recipe
 
+    @staticmethod
+    def get_missing_error(ids, objects):
+        missing = ", ".join(str(pk) for pk in ids if pk not in objects)
+        return ValidationError(f"Не найдены объекты с id: {missing}")
+
     def validate_tags(self, value):
         if not value:
             raise ValidationError(
                 "Необходимо добавить тег"
             )
-        return value
+        ids = list(dict.fromkeys(value))
+        tags = Tag.objects.in_bulk(ids)
+        if len(tags) != len(ids):
+            raise self.get_missing_error(ids, tags)
+        return [tags[pk] for pk in ids]
 
     def validate_ingredients(self, value):
         if not value:
             raise ValidationError(
                 "Необходимо добавить ингредиент"
             )
-        ingredients_list = []
+        ids = [item["id"] for item in value]
+        if len(set(ids)) != len(ids):
+            raise ValidationError(
+                "Такой ингредиент уже добавлен"
+            )
+        ingredients = Ingredient.objects.in_bulk(ids)
+        if len(ingredients) != len(ids):
+            raise self.get_missing_error(ids, ingredients)
         for item in value:
-            ingredient = get_object_or_404(Ingredient, id=item["id"])
-            if ingredient in ingredients_list:
-                raise ValidationError(
-                    "Такой ингредиент уже добавлен"
-                )
-            if int(item["amount"]) <= 0:
-                raise ValidationError(
-                    "Количество ингрдиентов должно быть больше 0"
-                )
-            ingredients_list.append(ingredient)
+            item["ingredient"] = ingredients[item["id"]]
         return value
 
     def create_ingredients(self, recipe, ingredients):
         create_ingredient = [
             RecipeIngredient(
                 recipe=recipe,
-                ingredient=get_object_or_404(Ingredient, id=ingredient["id"]),
+                ingredient=ingredient["ingredient"],
                 amount=ingredient["amount"]
             ) for ingredient in ingredients
         ]
         RecipeIngredient.objects.bulk_create(create_ingredient)
 
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get("request").user
         tags = validated_data.pop("tags")
         ingredients = validated_data.pop("ingredients")
-        recipe = Recipe.objects.create(author=author, **validated_data)
-        recipe.tags.set(tags)
+        recipe = Recipe.objects.create(
+            author=author,
+            tags_mask=mask_of(tag.bit for tag in tags),
+            **validated_data
+        )
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=recipe, tag=tag) for tag in tags
+        )
         self.create_ingredients(recipe, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop("tags", None)
         if tags is not None:
             instance.tags.set(tags)
+            instance.tags_mask = mask_of(tag.bit for tag in tags)
         ingredients = validated_data.pop("ingredients", None)
         if ingredients is not None:
-            instance.ingredients.clear()
-            self.create_ingredients(instance, ingredients)
+            with cart.replace_items(instance.pk):
+                instance.ingredients.clear()
+                self.create_ingredients(instance, ingredients)
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         request = self.context.get("request")
         context = {"request": request}
-        return RecipeSerializer(instance, context=context).data
+        recipe = Recipe.objects.with_user_flags(
+            request.user
+        ).get(pk=instance.pk)
+        return RecipeSerializer(recipe, context=context).data
 
 
 class CustomUserRegisterSerializer(UserCreateSerializer):
@@ -250,12 +381,18 @@ class CustomUserRegisterSerializer(UserCreateSerializer):
 
 class GetRecipesSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
+    image_card = ImageVariantField("card")
+    image_detail = ImageVariantField("detail")
+    image_webp = ImageVariantField("webp")
 
     class Meta:
         fields = (
             "id",
             "name",
             "image",
+            "image_card",
+            "image_detail",
+            "image_webp",
             "cooking_time",
         )
         model = Recipe
@@ -303,22 +440,22 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         request = self.context.get("request")
         if not request or request.user.is_anonymous:
             return False
-        return Subscription.objects.filter(
-            user=obj.user,
-            author=obj.author
-        ).exists()
+        return obj.user_id == request.user.id
 
     def get_recipes(self, obj):
-        request = self.context.get("request")
-        recipes_limit = request.GET.get("recipes_limit")
-        recipes = Recipe.objects.filter(author=obj.author)
-        if recipes_limit is not None:
-            recipes = recipes[:int(recipes_limit)]
+        author_recipes = self.context.get("author_recipes")
+        if author_recipes is not None:
+            recipes = author_recipes.get(obj.author_id, [])
+        else:
+            recipes_limit = get_recipes_limit(self.context.get("request"))
+            recipes = Recipe.objects.filter(author=obj.author)
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
         serializer = GetRecipesSerializer(recipes, many=True)
         return serializer.data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
+        return obj.author.recipes_count
 
 
 class ChangePasswordSerializer(serializers.Serializer):
@@ -330,5 +467,21 @@ class ChangePasswordSerializer(serializers.Serializer):
         user = self.context.get("request").user
         password = make_password(validated_data.get("new_password"))
         user.password = password
-        user.save()
+        user.save(update_fields=["password"])
         return validated_data
+
+
+def ids_field():
+    return serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_RELATIONS_LIMIT
+    )
+
+
+class BulkRecipesSerializer(serializers.Serializer):
+    recipes = ids_field()
+
+
+class BulkAuthorsSerializer(serializers.Serializer):
+    authors = ids_field()
@@ -0,0 +1,848 @@
+import shutil
+import tempfile
+import time
+from types import ModuleType
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import (
+    AsyncClient,
+    Client,
+    TestCase,
+    TransactionTestCase,
+    override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.routers import DefaultRouter
+from rest_framework.test import APIClient, APIRequestFactory
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag
+)
+from foodgram.replicas import pool, track_replica_errors
+from recipes.versions import bump_version, get_version
+from users.authentication import token_cache_key
+from users.models import CustomUser, Subscription
+from .cache import serialize_shared
+from .middleware import QueryBudgetExceededError
+from .renderers import ShoppingListPDFRenderer
+from .representations import shared_representations
+from .serializers import RecipeSerializer
+from .views import RECIPE_VIEWS, RecipeViewSet
+
+
+IMAGE = (
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAA"
+    "CVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNo"
+    "AAAAggCByxOyYQAAAABJRU5ErkJggg=="
+)
+
+
+def create_user(name):
+    return CustomUser.objects.create_user(
+        username=name,
+        email=f"{name}@example.com",
+        first_name=name,
+        last_name=name,
+        password="password-12345"
+    )
+
+
+def create_recipe(author, tags, ingredients, name="Рецепт"):
+    recipe = Recipe.objects.create(
+        author=author,
+        name=name,
+        image="recipes/test.png",
+        text="Описание",
+        cooking_time=10
+    )
+    recipe.tags.set(tags)
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=amount)
+        for amount, ingredient in enumerate(ingredients, start=1)
+    )
+    return recipe
+
+
+class APITestCase(TestCase):
+    """Авторы, теги, ингредиенты и клиенты гостя и пользователя."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("user")
+        cls.author = create_user("author")
+        cls.tags = [
+            Tag.objects.create(name=name, color=color, slug=slug)
+            for name, color, slug in (
+                ("Завтрак", "#E26C2D", "breakfast"),
+                ("Обед", "#49B64E", "lunch"),
+            )
+        ]
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f"Ингредиент {number}", measurement_unit="г")
+            for number in range(40)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class QueryBudgetTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        recipe = create_recipe(self.author, self.tags, self.ingredients[:5])
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+
+    def test_streamed_body_queries_are_counted(self):
+        with self.assertLogs("foodgram.sql", "INFO") as logs:
+            response = self.client.get(
+                "/api/recipes/download_shopping_cart/?format=txt"
+            )
+            view_queries = int(response["X-DB-Query-Count"])
+            content = b"".join(response.streaming_content)
+        self.assertIn("Ингредиент 4".encode(), content)
+        self.assertGreater(logs.records[-1].sql["queries"], view_queries)
+
+    def test_long_list_is_not_rendered_to_pdf(self):
+        with mock.patch.object(ShoppingListPDFRenderer, "max_rows", 4):
+            response = self.client.get(
+                "/api/recipes/download_shopping_cart/?format=pdf"
+            )
+        self.assertEqual(response.status_code, 400)
+
+    def test_exceeded_budget_raises(self):
+        with mock.patch.dict(
+            RecipeViewSet.query_budget, {"download_shopping_cart": 0}
+        ):
+            response = self.client.get(
+                "/api/recipes/download_shopping_cart/?format=txt"
+            )
+            with self.assertRaises(QueryBudgetExceededError):
+                b"".join(response.streaming_content)
+
+
+@override_settings(RECIPE_CACHE_ENABLED=True)
+class RecipeQueryCountTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipes = [
+            create_recipe(
+                cls.author,
+                cls.tags,
+                cls.ingredients[number:number + 5],
+                f"Рецепт {number}"
+            )
+            for number in range(12)
+        ]
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipes[0])
+
+    def test_list_query_count_does_not_depend_on_page_size(self):
+        # Подсчёт, страница и по запросу на рецепты, авторов, теги и
+        # ингредиенты; из кэша представлений - только подсчёт и страница
+        for client in (self.guest, self.client):
+            for limit in (2, 6, 12):
+                with self.subTest(user=client is self.client, limit=limit):
+                    cache.clear()
+                    with self.assertNumQueries(6):
+                        response = client.get(f"/api/recipes/?limit={limit}")
+                    self.assertEqual(len(response.data["results"]), limit)
+                    with self.assertNumQueries(2):
+                        client.get(f"/api/recipes/?limit={limit}")
+
+    def test_retrieve_query_count(self):
+        for client in (self.guest, self.client):
+            for recipe in (self.recipes[0], self.recipes[5]):
+                with self.subTest(user=client is self.client, id=recipe.id):
+                    cache.clear()
+                    with self.assertNumQueries(5):
+                        response = client.get(f"/api/recipes/{recipe.id}/")
+                    self.assertEqual(len(response.data["ingredients"]), 5)
+                    with self.assertNumQueries(1):
+                        client.get(f"/api/recipes/{recipe.id}/")
+
+    @mock.patch("recipes.search.SEARCH_CHUNK_SIZE", 5)
+    @mock.patch("recipes.search.is_supported", return_value=False)
+    def test_fallback_search_query_count(self, is_supported):
+        # Подсчёт, страница, ранги одним запросом и по запросу на рецепты,
+        # авторов, теги и ингредиенты - в пределах бюджета списка
+        with self.assertNumQueries(7):
+            response = self.guest.get("/api/recipes/?search=рецепт&limit=6")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 12)
+
+    def test_user_flags_are_not_shared_through_cache(self):
+        url = f"/api/recipes/{self.recipes[0].id}/"
+        self.assertTrue(self.client.get(url).data["is_in_shopping_cart"])
+        self.assertFalse(self.guest.get(url).data["is_in_shopping_cart"])
+
+    @override_settings(RECIPE_CACHE_ENABLED=False)
+    def test_representations_are_not_cached_when_disabled(self):
+        # Общие части строятся из строк страницы: подсчёт, страница,
+        # авторы, теги и ингредиенты
+        for _ in range(2):
+            with self.assertNumQueries(5):
+                self.guest.get("/api/recipes/?limit=6")
+
+    def test_author_full_save_without_changes_keeps_cache(self):
+        self.guest.get(f"/api/recipes/{self.recipes[0].id}/")
+        author = CustomUser.objects.get(pk=self.author.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            author.save()
+        with self.assertNumQueries(1):
+            self.guest.get(f"/api/recipes/{self.recipes[0].id}/")
+        author.first_name = "Новое имя"
+        with self.captureOnCommitCallbacks(execute=True):
+            author.save()
+        response = self.guest.get(f"/api/recipes/{self.recipes[0].id}/")
+        self.assertEqual(response.data["author"]["first_name"], "Новое имя")
+
+
+class SubscriptionQueryCountTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.authors = [cls.author] + [
+            create_user(f"author{number}") for number in range(3)
+        ]
+        for number, author in enumerate(cls.authors, start=1):
+            for position in range(number):
+                create_recipe(
+                    author, cls.tags, cls.ingredients[:2], f"Рецепт {position}"
+                )
+            Subscription.objects.create(user=cls.user, author=author)
+
+    def test_query_count_does_not_depend_on_authors(self):
+        # Подсчёт, страница подписок и рецепты всех авторов страницы
+        counts = dict(
+            CustomUser.objects.values_list("id", "recipes_count")
+        )
+        for limit in (2, 4):
+            for recipes_limit in (None, 1, 3):
+                url = f"/api/users/subscriptions/?limit={limit}"
+                if recipes_limit:
+                    url += f"&recipes_limit={recipes_limit}"
+                with self.subTest(url=url):
+                    with self.assertNumQueries(3):
+                        response = self.client.get(url)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(len(response.data["results"]), limit)
+                    for item in response.data["results"]:
+                        total = counts[item["id"]]
+                        self.assertEqual(item["recipes_count"], total)
+                        self.assertEqual(
+                            len(item["recipes"]),
+                            min(total, recipes_limit or total)
+                        )
+
+
+def async_urlconf():
+    """Маршруты рецептов с асинхронными представлениями чтения."""
+    with override_settings(ASYNC_READ_VIEWS=True):
+        router = DefaultRouter()
+        router.register("recipes", RecipeViewSet, basename="recipes")
+        urlconf = ModuleType("async_urls")
+        urlconf.urlpatterns = [path("api/", include(router.urls))]
+    return urlconf
+
+
+class AsyncReadTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipes = [
+            create_recipe(
+                cls.author, cls.tags, cls.ingredients[number:number + 3],
+                f"Рецепт {number}"
+            )
+            for number in range(4)
+        ]
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipes[1])
+        cls.token = Token.objects.create(user=cls.user)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.urlconf = async_urlconf()
+
+    def get_both(self, url, token=None):
+        """Ответы синхронного и асинхронного представлений на url."""
+        sync_headers, async_headers = {}, {}
+        if token:
+            # AsyncClient принимает заголовки без префикса HTTP_
+            sync_headers["HTTP_AUTHORIZATION"] = f"Token {token.key}"
+            async_headers["authorization"] = f"Token {token.key}"
+        cache.clear()
+        sync_response = Client().get(url, **sync_headers)
+        cache.clear()
+        with override_settings(ROOT_URLCONF=self.urlconf):
+            async_response = async_to_sync(AsyncClient().get)(
+                url, **async_headers
+            )
+        return sync_response, async_response
+
+    def test_async_views_match_sync_views(self):
+        for url in (
+            "/api/recipes/?limit=3",
+            "/api/recipes/?limit=3&is_in_shopping_cart=1",
+            "/api/recipes/?tags=unknown",
+            f"/api/recipes/{self.recipes[1].id}/",
+            "/api/recipes/0/",
+        ):
+            for token in (None, self.token):
+                with self.subTest(url=url, user=bool(token)):
+                    sync_response, async_response = self.get_both(url, token)
+                    self.assertEqual(
+                        async_response.status_code, sync_response.status_code
+                    )
+                    self.assertEqual(
+                        async_response.json(), sync_response.json()
+                    )
+                    self.assertEqual(
+                        async_response["X-DB-Query-Count"],
+                        sync_response["X-DB-Query-Count"]
+                    )
+
+    def test_async_budget_is_enforced(self):
+        with mock.patch.dict(RecipeViewSet.query_budget, {"list": 1}):
+            with override_settings(ROOT_URLCONF=self.urlconf):
+                with self.assertRaises(QueryBudgetExceededError):
+                    async_to_sync(AsyncClient().get)("/api/recipes/?limit=3")
+
+
+class TagFilterTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        breakfast, lunch = cls.tags
+        cls.both = create_recipe(cls.author, [breakfast, lunch], [])
+        cls.breakfast = create_recipe(cls.author, [breakfast], [])
+        cls.lunch = create_recipe(cls.author, [lunch], [])
+        cls.untagged = create_recipe(cls.author, [], [])
+
+    def recipe_ids(self, query):
+        response = self.guest.get(f"/api/recipes/?limit=10&{query}")
+        self.assertEqual(response.status_code, 200)
+        return {recipe["id"] for recipe in response.data["results"]}
+
+    def test_any_and_all_tags(self):
+        # Масок перечислением и проверкой битов
+        for limit in (8, 0):
+            with self.subTest(limit=limit), mock.patch(
+                "recipes.tags.MAX_ENUMERATED_TAGS", limit
+            ):
+                self.assertEqual(
+                    self.recipe_ids("tags=breakfast"),
+                    {self.both.id, self.breakfast.id}
+                )
+                self.assertEqual(
+                    self.recipe_ids("tags=breakfast&tags=lunch"),
+                    {self.both.id, self.breakfast.id, self.lunch.id}
+                )
+                self.assertEqual(
+                    self.recipe_ids("tags_all=breakfast&tags_all=lunch"),
+                    {self.both.id}
+                )
+
+    def test_tag_created_after_bits_were_cached(self):
+        self.assertEqual(len(self.recipe_ids("tags=lunch")), 2)
+        # Без on_commit версия Tag не меняется, как при записи
+        # из другого процесса с локальным кэшем
+        dinner = Tag.objects.create(
+            name="Ужин", color="#8775D2", slug="dinner"
+        )
+        self.untagged.tags.add(dinner)
+        self.assertEqual(self.recipe_ids("tags=dinner"), {self.untagged.id})
+
+    def test_unknown_tag_is_rejected(self):
+        response = self.guest.get("/api/recipes/?tags=unknown")
+        self.assertEqual(response.status_code, 400)
+
+
+class IngredientSearchTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit="г")
+            for name in (
+                "Морская соль", "Соль нитритная", "Соль", "Свёкла"
+            )
+        )
+
+    def search(self, name):
+        response = self.guest.get("/api/ingredients/", {"name": name})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient["name"] for ingredient in response.data]
+
+    def test_yo_matches_ye(self):
+        self.assertEqual(self.search("свекла"), ["Свёкла"])
+        self.assertEqual(self.search("СВЁК"), ["Свёкла"])
+
+    def test_prefix_matches_go_first(self):
+        self.assertEqual(
+            self.search("соль"), ["Соль", "Соль нитритная", "Морская соль"]
+        )
+
+    def test_ingredient_added_after_index_was_built(self):
+        self.assertEqual(self.search("сахар"), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name="Сахар", measurement_unit="г")
+        self.assertEqual(self.search("сахар"), ["Сахар"])
+
+
+class RecipeFieldsTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipe = create_recipe(cls.author, cls.tags, cls.ingredients[:2])
+
+    def get(self, query):
+        """Ответы списка и одного рецепта с параметрами query.
+
+        Каждый адрес запрашивается с кэшем представлений и без него.
+        """
+        responses = {}
+        for enabled in (False, True):
+            for url in (
+                f"/api/recipes/?limit=5&{query}",
+                f"/api/recipes/{self.recipe.id}/?{query}",
+            ):
+                with override_settings(RECIPE_CACHE_ENABLED=enabled):
+                    cache.clear()
+                    responses[url, enabled] = self.client.get(url)
+        return responses.items()
+
+    def keys(self, response):
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+        return set(data["results"][0] if "results" in data else data)
+
+    def test_unknown_field_is_rejected(self):
+        for key, response in self.get("fields=name,secret"):
+            with self.subTest(key):
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("secret", str(response.data["fields"]))
+
+    def test_unknown_view_is_rejected(self):
+        for key, response in self.get("view=huge"):
+            with self.subTest(key):
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("view", response.data)
+
+    def test_card_view_omits_text_and_ingredients(self):
+        for key, response in self.get("view=card"):
+            with self.subTest(key):
+                keys = self.keys(response)
+                self.assertEqual(keys, set(RECIPE_VIEWS["card"]))
+                self.assertFalse(keys & {"text", "ingredients"})
+
+    def test_id_is_always_present(self):
+        for query, expected in (
+            ("fields=name", {"id", "name"}),
+            ("fields=", {"id"}),
+            ("fields=id,text", {"id", "text"}),
+        ):
+            for key, response in self.get(query):
+                with self.subTest(key):
+                    self.assertEqual(self.keys(response), expected)
+
+
+class CursorPaginationTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for number in range(3):
+            create_recipe(
+                cls.author, cls.tags, cls.ingredients[:2], f"Суп {number}"
+            )
+
+    def test_cursor_pages_by_id(self):
+        response = self.guest.get("/api/recipes/?pagination=cursor&limit=2")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNotNone(response.data["next"])
+
+    def test_cursor_is_rejected_with_search(self):
+        response = self.guest.get(
+            "/api/recipes/?pagination=cursor&search=суп"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("cursor", response.data)
+
+
+class IngredientFilterTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipe = create_recipe(cls.author, cls.tags, cls.ingredients[:2])
+
+    def test_recipes_with_ingredients(self):
+        ids = ",".join(str(item.id) for item in self.ingredients[:2])
+        response = self.guest.get(f"/api/recipes/?ingredients={ids}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe["id"] for recipe in response.data], [self.recipe.id]
+        )
+
+    def test_non_integer_ids_are_rejected(self):
+        for param in ("ingredients", "exclude_ingredients", "pantry"):
+            for value in ("1.5", "1,a"):
+                with self.subTest(param=param, value=value):
+                    response = self.guest.get(f"/api/recipes/?{param}={value}")
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn(param, response.data)
+
+
+class CreateRecipeTests(APITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def payload(self, ingredients):
+        return {
+            "ingredients": [
+                {"id": ingredient.id, "amount": 10}
+                for ingredient in ingredients
+            ],
+            "tags": [tag.id for tag in self.tags],
+            "image": IMAGE,
+            "name": "Рецепт",
+            "text": "Описание",
+            "cooking_time": 15,
+        }
+
+    def post(self, data):
+        return self.client.post("/api/recipes/", data, format="json")
+
+    def test_query_count_does_not_depend_on_ingredients(self):
+        for count in (1, 30):
+            with self.subTest(ingredients=count):
+                with self.assertNumQueries(12):
+                    response = self.post(self.payload(
+                        self.ingredients[:count]
+                    ))
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(len(response.data["ingredients"]), count)
+
+    def test_duplicate_ingredient_is_rejected(self):
+        data = self.payload(self.ingredients[:2])
+        data["ingredients"].append(data["ingredients"][0])
+        response = self.post(data)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("ingredients", response.data)
+
+    def test_unknown_ingredient_is_rejected(self):
+        data = self.payload(self.ingredients[:2])
+        data["ingredients"].append({"id": 10 ** 6, "amount": 1})
+        response = self.post(data)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("ingredients", response.data)
+        self.assertFalse(Recipe.objects.exists())
+
+
+@override_settings(REFERENCE_ETAG_ENABLED=True)
+class ReferenceETagTests(APITestCase):
+
+    def test_matching_etag_returns_not_modified(self):
+        etag = self.guest.get("/api/tags/")["ETag"]
+        with self.assertNumQueries(0):
+            response = self.guest.get("/api/tags/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("max-age", response["Cache-Control"])
+
+    def test_write_changes_etag(self):
+        etag = self.guest.get("/api/tags/")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name="Ужин", color="#8775D2", slug="dinner")
+        response = self.guest.get("/api/tags/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(len(response.data), 3)
+
+    @override_settings(REFERENCE_ETAG_ENABLED=False)
+    def test_no_etag_without_shared_cache(self):
+        response = self.guest.get("/api/tags/")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("ETag", response)
+        self.assertIn("max-age", response["Cache-Control"])
+
+
+@override_settings(REFERENCE_ETAG_ENABLED=True)
+class ReplicaReadTests(TransactionTestCase):
+    """Вторая база SQLite - реплика с другим содержимым.
+
+    Внутри транзакции основной базы реплики не используются, поэтому
+    тесты идут без обёртки TestCase.
+    """
+    databases = {"default", "replica_test"}
+
+    def setUp(self):
+        cache.clear()
+        # Настройки подменяются только на время теста: очистка баз
+        # после него не должна считать replica_test репликой
+        replicas = override_settings(DATABASE_REPLICAS=["replica_test"])
+        replicas.enable()
+        self.addCleanup(replicas.disable)
+        for patcher in (
+            mock.patch.object(pool, "start"),
+            mock.patch.dict(pool._synced),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # Соединение с репликой открыто до подмены настроек
+        replica = connections["replica_test"]
+        track_replica_errors(None, replica)
+        self.addCleanup(replica.execute_wrappers.clear)
+        Tag.objects.create(name="Основная", color="#E26C2D", slug="primary")
+        Tag.objects.using("replica_test").create(
+            name="Реплика", color="#49B64E", slug="replica", bit=0
+        )
+        self.client = APIClient(raise_request_exception=False)
+
+    def rename_replica_table(self, old, new):
+        with connections["replica_test"].cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {old} RENAME TO {new}")
+
+    def tag_names(self, client=None):
+        response = (client or self.client).get("/api/tags/")
+        self.assertEqual(response.status_code, 200)
+        return [tag["name"] for tag in response.data]
+
+    def test_synced_replica_serves_body(self):
+        get_version(Tag)
+        pool.refresh()
+        with mock.patch("foodgram.replicas.check_replica") as check:
+            self.assertEqual(self.tag_names(), ["Реплика"])
+        check.assert_not_called()
+
+    def test_anonymous_write_sticks_only_its_client(self):
+        get_version(Tag)
+        pool.refresh()
+        response = self.client.post("/api/users/", {
+            "email": "new@example.com",
+            "username": "new",
+            "first_name": "Новый",
+            "last_name": "Новый",
+            "password": "password-12345",
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.tag_names(), ["Основная"])
+        self.assertEqual(self.tag_names(APIClient()), ["Реплика"])
+
+    def test_newer_version_is_read_from_primary(self):
+        pool.refresh()
+        with mock.patch(
+            "recipes.versions.time.time", return_value=time.time() + 1
+        ):
+            bump_version(Tag)
+        self.assertEqual(self.tag_names(), ["Основная"])
+
+    def test_replica_error_is_retried_on_primary(self):
+        get_version(Tag)
+        pool.refresh()
+        self.rename_replica_table("recipes_tag", "recipes_tag_hidden")
+        self.addCleanup(
+            self.rename_replica_table, "recipes_tag_hidden", "recipes_tag"
+        )
+        self.assertEqual(self.tag_names(), ["Основная"])
+        self.assertIsNone(pool.choose())
+
+
+class RelationsTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipes = [
+            create_recipe(cls.author, cls.tags, cls.ingredients[:2])
+            for _ in range(3)
+        ]
+
+    def favorite_counts(self):
+        return list(
+            Recipe.objects.order_by("id").values_list(
+                "favorite_count", flat=True
+            )
+        )
+
+    def test_single_and_bulk_post_return_created(self):
+        response = self.client.post(
+            f"/api/recipes/{self.recipes[0].id}/favorite/"
+        )
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post(
+            "/api/recipes/favorite/",
+            {"recipes": [recipe.id for recipe in self.recipes]},
+            format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            response.data["added"], [self.recipes[1].id, self.recipes[2].id]
+        )
+        self.assertEqual(self.favorite_counts(), [1, 1, 1])
+        response = self.client.delete(
+            "/api/recipes/favorite/",
+            {"recipes": [self.recipes[0].id]},
+            format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.favorite_counts(), [0, 1, 1])
+
+    def test_orm_changes_match_api_changes(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipes[0])
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[0])
+        self.assertEqual(self.favorite_counts(), [1, 0, 0])
+        self.assertEqual(self.user.shopping_cart_totals.count(), 2)
+        Favorite.objects.filter(user=self.user).delete()
+        ShoppingCart.objects.filter(user=self.user).delete()
+        self.assertEqual(self.favorite_counts(), [0, 0, 0])
+        self.assertEqual(self.user.shopping_cart_totals.count(), 0)
+
+
+@override_settings(AUTH_TOKEN_CACHE_TIMEOUT=300)
+class TokenCacheTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def me(self):
+        return self.client.get("/api/users/me/").status_code
+
+    def test_admin_deactivation_forgets_tokens(self):
+        self.assertEqual(self.me(), 200)
+        admin = Client()
+        admin.force_login(CustomUser.objects.create_superuser(
+            username="admin",
+            email="admin@example.com",
+            first_name="admin",
+            last_name="admin",
+            password="password-12345"
+        ))
+        user = CustomUser.objects.get(pk=self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = admin.post(
+                f"/admin/users/customuser/{user.pk}/change/",
+                {
+                    "username": user.username,
+                    "email": user.email,
+                    "first_name": user.first_name,
+                    "last_name": user.last_name,
+                    "password": user.password,
+                    "date_joined_0": user.date_joined.strftime("%Y-%m-%d"),
+                    "date_joined_1": user.date_joined.strftime("%H:%M:%S"),
+                }
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(CustomUser.objects.get(pk=user.pk).is_active)
+        self.assertEqual(self.me(), 401)
+
+    def test_bulk_update_forgets_tokens(self):
+        self.assertEqual(self.me(), 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            CustomUser.objects.filter(pk=self.user.pk).update(
+                is_active=False
+            )
+        self.assertEqual(self.me(), 401)
+
+    def test_counter_update_keeps_tokens(self):
+        self.assertEqual(self.me(), 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            CustomUser.objects.filter(pk=self.user.pk).update(
+                recipes_count=5
+            )
+        self.assertIsNotNone(cache.get(token_cache_key(self.token.key)))
+
+
+class SharedRepresentationTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipes = [
+            create_recipe(cls.author, cls.tags, cls.ingredients[:3]),
+            create_recipe(cls.user, cls.tags[:1], cls.ingredients[3:4]),
+            create_recipe(cls.author, [], [], name="Пустой"),
+        ]
+
+    def assert_same_representations(self, fields):
+        request = APIRequestFactory().get("/api/recipes/")
+        request.user = AnonymousUser()
+        serializer = RecipeSerializer(
+            context={"request": request, "fields": fields}
+        )
+        recipe_ids = [recipe.id for recipe in self.recipes]
+        expected = serialize_shared(serializer, recipe_ids)
+        shared = shared_representations(
+            list(serializer.fields), recipe_ids, request
+        )
+        self.assertEqual(
+            JSONRenderer().render([shared[pk] for pk in recipe_ids]),
+            JSONRenderer().render([expected[pk] for pk in recipe_ids])
+        )
+
+    def test_views_match_serializer(self):
+        for view, fields in RECIPE_VIEWS.items():
+            with self.subTest(view=view):
+                self.assert_same_representations(fields)
+
+    def test_custom_fields_match_serializer(self):
+        self.assert_same_representations(
+            ("id", "name", "author", "ingredients", "cooking_time")
+        )
+
+    def test_list_reads_recipe_rows_once(self):
+        # Подсчёт и страница, затем без кэша - авторы, теги и ингредиенты,
+        # с кэшем - ещё перечитывание промахов после версий
+        for enabled, queries in ((False, 5), (True, 6)):
+            with self.subTest(cache=enabled), override_settings(
+                RECIPE_CACHE_ENABLED=enabled
+            ):
+                cache.clear()
+                with CaptureQueriesContext(connection) as context:
+                    with self.assertNumQueries(queries):
+                        response = self.guest.get("/api/recipes/?limit=10")
+                self.assertEqual(len(response.data["results"]), 3)
+                self.assertEqual(
+                    sum(
+                        '"recipes_recipe"."text"' in query["sql"]
+                        for query in context.captured_queries
+                    ),
+                    1
+                )
@@ -1,58 +1,158 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
 from .filters import RecipeFilter, IngredientSearch
+from .mixins import (
+    AsyncReadMixin,
+    BulkRelationsMixin,
+    ConditionalReadMixin
+)
 from .permissions import IsAuthorOrAdminOrReadOnly
+from .renderers import (
+    ShoppingListContentNegotiation,
+    ShoppingListCSVRenderer,
+    ShoppingListPDFRenderer,
+    ShoppingListTextRenderer
+)
 from .serializers import (
+    BulkRecipesSerializer,
     CreateRecipeSerializer,
     GetRecipesSerializer,
     IngredientSerializer,
     RecipeSerializer,
+    ShoppingCartTotalSerializer,
     TagSerializer
 )
+from recipes import relations
+from recipes.feed import feed_recipes
 from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
-    RecipeIngredient,
     ShoppingCart,
-    Tag
+    Tag,
+    unused_columns
 )
-from .pagination import CustomPagination
+from .pagination import CustomPagination, RecipeCursorPagination
+
+SHOPPING_LIST_CHUNK_SIZE = 500
+# Наборы полей рецепта для параметра view, None - все поля
+RECIPE_VIEWS = {
+    "full": None,
+    # Карточка в сетке рецептов: без описания и ингредиентов
+    "card": (
+        "id",
+        "tags",
+        "author",
+        "is_favorited",
+        "is_in_shopping_cart",
+        "name",
+        "image",
+        "image_card",
+        "image_webp",
+        "cooking_time",
+    ),
+}
 
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(BulkRelationsMixin, AsyncReadMixin, ModelViewSet):
     queryset = Recipe.objects.all()
+    query_budget = {
+        "list": 8,
+        "retrieve": 6,
+        "create": 16,
+        "update": 19,
+        "partial_update": 19,
+        "feed": 8,
+        "shopping_cart_totals": 2,
+        "download_shopping_cart": 3,
+        "favorite": 8,
+        "shopping_cart": 8,
+        "favorite_bulk": 8,
+        "shopping_cart_bulk": 8,
+    }
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
     pagination_class = CustomPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator") and (
+            self.action == "feed"
+            or RecipeCursorPagination.is_requested(self.request)
+        ):
+            self._paginator = RecipeCursorPagination()
+        return super().paginator
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ("list", "retrieve", "feed"):
+            return queryset
+        queryset = queryset.with_user_flags(self.request.user)
+        if settings.RECIPE_CACHE_ENABLED:
+            # Общие части представлений берутся из кэша, а промахи
+            # перечитываются после версий, см. render_recipes()
+            return queryset.only("id", "author_id")
+        # Без кэша общие части строятся из этих же строк
+        return queryset.defer(*unused_columns(self.get_recipe_fields()))
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in ("list", "retrieve", "feed"):
+            context["fields"] = self.get_recipe_fields()
+        return context
+
+    def get_recipe_fields(self):
+        """Поля рецепта из параметров fields или view, None - все.
+
+        id входит в представление всегда.
+        """
+        params = self.request.query_params
+        if "fields" not in params:
+            view = params.get("view", "full")
+            if view not in RECIPE_VIEWS:
+                raise ValidationError(
+                    {"view": f"Допустимые значения: {', '.join(RECIPE_VIEWS)}"}
+                )
+            return RECIPE_VIEWS[view]
+        fields = {"id", *filter(None, params["fields"].split(","))}
+        unknown = fields - set(RecipeSerializer.Meta.fields)
+        if unknown:
+            raise ValidationError(
+                {"fields": f"Неизвестные поля: {', '.join(sorted(unknown))}"}
+            )
+        return tuple(
+            field for field in RecipeSerializer.Meta.fields if field in fields
+        )
+
     def get_serializer_class(self):
-        if self.action in ("list", "retrieve"):
+        if self.action in ("list", "retrieve", "feed"):
             return RecipeSerializer
         return CreateRecipeSerializer
 
     def create_delete(self, request, pk, model):
-        user = self.request.user
-        recipe = get_object_or_404(Recipe, id=pk)
-        context = {"request": request}
-
         if self.request.method == "POST":
-            model.objects.get_or_create(user=user, recipe=recipe)
-            serializer = GetRecipesSerializer(recipe, context=context)
+            recipe = get_object_or_404(Recipe, id=pk)
+            relations.add(model, request.user.id, [recipe.id])
+            serializer = GetRecipesSerializer(
+                recipe,
+                context={"request": request}
+            )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        if self.request.method == "DELETE":
-            get_object_or_404(model, user=user, recipe=recipe).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        if not str(pk).isdigit():
+            raise Http404
+        relations.remove(model, request.user.id, [int(pk)])
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
         methods=["POST", "DELETE"],
@@ -68,44 +168,114 @@ class RecipeViewSet(ModelViewSet):
     def shopping_cart(self, request, pk=None):
         return self.create_delete(request, pk, ShoppingCart)
 
+    @action(
+        methods=["POST", "DELETE"],
+        detail=False,
+        url_path="favorite",
+        permission_classes=(IsAuthenticated,)
+    )
+    def favorite_bulk(self, request):
+        """Добавление и удаление нескольких рецептов в избранном."""
+        return self.change_relations(request, Favorite, BulkRecipesSerializer)
+
+    @action(
+        methods=["POST", "DELETE"],
+        detail=False,
+        url_path="shopping_cart",
+        permission_classes=(IsAuthenticated,)
+    )
+    def shopping_cart_bulk(self, request):
+        """То же для списка покупок, DELETE без рецептов очищает список."""
+        return self.change_relations(
+            request,
+            ShoppingCart,
+            BulkRecipesSerializer,
+            clear_all=True
+        )
+
+    @action(
+        methods=["GET"],
+        detail=False,
+        permission_classes=(IsAuthenticated,)
+    )
+    def feed(self, request):
+        """Новые рецепты авторов, на которых подписан пользователь."""
+        queryset = self.filter_queryset(
+            self.get_queryset().filter(id__in=feed_recipes(request.user))
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @action(
         methods=["GET"],
         detail=False,
         permission_classes=(IsAuthenticated,)
     )
+    def shopping_cart_totals(self, request):
+        """Итог списка покупок для показа без скачивания файла."""
+        totals = request.user.shopping_cart_totals.select_related(
+            "ingredient"
+        ).order_by("ingredient__name")
+        serializer = ShoppingCartTotalSerializer(totals, many=True)
+        return Response(serializer.data)
+
+    @action(
+        methods=["GET"],
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(
+            ShoppingListTextRenderer,
+            ShoppingListCSVRenderer,
+            ShoppingListPDFRenderer,
+        ),
+        content_negotiation_class=ShoppingListContentNegotiation
+    )
     def download_shopping_cart(self, request):
+        renderer = request.accepted_renderer
+        totals = request.user.shopping_cart_totals.all()
+        max_rows = getattr(renderer, "max_rows", None)
+        if max_rows is not None and totals.count() > max_rows:
+            return Response(
+                {
+                    "detail": (
+                        f"В {renderer.format} выгружается не больше "
+                        f"{max_rows} строк, выберите txt или csv"
+                    )
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
         ingredients = (
-            RecipeIngredient.objects.filter(
-                recipe__shopping_cart__user=request.user
-            ).values(
+            totals.values(
                 "ingredient__name",
-                "ingredient__measurement_unit"
-            ).annotate(
-                amount=Sum("amount")
-            )
+                "ingredient__measurement_unit",
+                "amount"
+            ).order_by(
+                "ingredient__name"
+            ).iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
+        )
+        response = StreamingHttpResponse(
+            renderer.stream(ingredients),
+            content_type=request.accepted_media_type
         )
-        shopping_list = "\n".join([
-            f'{ingredient["ingredient__name"]} '
-            f'({ingredient["ingredient__measurement_unit"]}) '
-            f'- {ingredient["amount"]}'
-            for ingredient in ingredients
-        ])
-        response = HttpResponse(shopping_list, content_type="text/plain")
         response["Content-Disposition"] = (
-            "attachment; filename='shopping_list.txt'"
+            f"attachment; filename='shopping_list.{renderer.format}'"
         )
         return response
 
 
-class IngredientViewSet(ModelViewSet):
+class IngredientViewSet(
+    ConditionalReadMixin, AsyncReadMixin, ModelViewSet
+):
     queryset = Ingredient.objects.all()
+    query_budget = {"list": 2, "retrieve": 2}
     serializer_class = IngredientSerializer
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
     filter_backends = (IngredientSearch,)
-    search_fields = ("^name",)
 
 
-class TagViewSet(ModelViewSet):
+class TagViewSet(ConditionalReadMixin, AsyncReadMixin, ModelViewSet):
     queryset = Tag.objects.all()
+    query_budget = {"list": 2, "retrieve": 2}
     serializer_class = TagSerializer
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
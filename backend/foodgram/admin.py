@@ -0,0 +1,36 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+# С какого размера таблицы без фильтров её размер берётся из статистики
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор, который не считает строки больших таблиц целиком.
+
+    Для выборки без условий в PostgreSQL число строк берётся
+    из pg_class.reltuples, если оно больше порога. С фильтрами
+    и поиском, а также в других базах считается точно.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == "postgresql" and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            if row and row[0] > ESTIMATED_COUNT_THRESHOLD:
+                return int(row[0])
+        return super().count
+
+
+class LargeTableAdminMixin:
+    """Список объектов большой таблицы без полного подсчёта строк."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -0,0 +1,23 @@
+class CounterFieldsMixin:
+    """Модель со счётчиками, которые меняются только атомарным UPDATE.
+
+    Обычное save() существующего объекта не пишет поля counter_fields:
+    иначе оно вернуло бы значения, прочитанные при загрузке объекта,
+    и затёрло бы увеличения через F(), сделанные после неё. Записать
+    счётчик можно, только явно указав его в update_fields.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            kwargs.get("update_fields") is None
+            and not args
+            and not kwargs.get("force_insert")
+            and not self._state.adding
+        ):
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
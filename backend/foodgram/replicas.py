@@ -0,0 +1,213 @@
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    DatabaseError,
+    InterfaceError,
+    OperationalError,
+    connections
+)
+
+logger = logging.getLogger("foodgram.replicas")
+
+# Состояние текущего запроса к API, вне запросов чтение идёт в основную базу
+current_request = ContextVar("replica_request", default=None)
+pinned = ContextVar("replica_pinned", default=False)
+# Момент, данные до которого должна содержать реплика для чтения
+required_since = ContextVar("replica_required_since", default=0)
+
+LAG_SQL = (
+    "SELECT CASE "
+    "WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class RequestState:
+
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.wrote = False
+        self.replica_failed = False
+
+
+@contextmanager
+def primary():
+    """Чтения внутри блока идут в основную базу.
+
+    Нужен для данных, которые кэшируются под версией: отстающая
+    реплика сохранила бы под новой версией старые данные.
+    """
+    token = pinned.set(True)
+    try:
+        yield
+    finally:
+        pinned.reset(token)
+
+
+@contextmanager
+def synced_since(timestamp):
+    """Чтения внутри блока идут на реплики, догнавшие момент timestamp.
+
+    Если такой реплики нет, чтение идёт в основную базу. Так ответ
+    под версией из кэша можно собрать на реплике, не рискуя получить
+    данные старше версии.
+    """
+    token = required_since.set(timestamp)
+    try:
+        yield
+    finally:
+        required_since.reset(token)
+
+
+def check_replica(alias):
+    """Отставание реплики в секундах или None, если она недоступна.
+
+    None и для реплики, которая отстаёт больше REPLICA_MAX_LAG секунд
+    или отставание которой неизвестно.
+    """
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(LAG_SQL)
+                lag = cursor.fetchone()[0]
+            else:
+                cursor.execute("SELECT 1")
+                lag = 0
+    except DatabaseError as error:
+        logger.warning("Реплика %s недоступна: %s", alias, error)
+        return None
+    if lag is None or lag > settings.REPLICA_MAX_LAG:
+        logger.warning("Реплика %s отстаёт на %s с", alias, lag)
+        return None
+    return lag
+
+
+class ReplicaPool:
+    """Реплики из DATABASE_REPLICAS с проверкой доступности в фоне.
+
+    Поток в каждом процессе раз в REPLICA_HEALTH_INTERVAL секунд
+    проверяет реплики и запоминает, до какого момента каждая из них
+    догнала основную базу, а запросы только читают результат. Реплика,
+    на которой запрос упал с ошибкой соединения, выводится из ротации
+    до следующей проверки. До первой проверки чтение идёт в основную базу.
+    """
+
+    def __init__(self):
+        self._synced = {}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def refresh(self):
+        for alias in settings.DATABASE_REPLICAS:
+            checked_at = time.time()
+            lag = check_replica(alias)
+            self._synced[alias] = None if lag is None else checked_at - lag
+
+    def run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Проверка реплик не удалась")
+            finally:
+                connections.close_all()
+            time.sleep(settings.REPLICA_HEALTH_INTERVAL)
+
+    def start(self):
+        """Запускает поток проверки, в том числе после fork воркера."""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid != pid:
+                self._pid = pid
+                threading.Thread(
+                    target=self.run, name="replica-health", daemon=True
+                ).start()
+
+    def mark_failed(self, alias):
+        self._synced[alias] = None
+
+    def choose(self, since=0):
+        """Случайная реплика, которая содержит данные до момента since."""
+        self.start()
+        synced = []
+        for alias in settings.DATABASE_REPLICAS:
+            synced_until = self._synced.get(alias)
+            if synced_until is not None and synced_until >= since:
+                synced.append(alias)
+        return random.choice(synced) if synced else None
+
+
+pool = ReplicaPool()
+
+
+def track_replica_errors(sender, connection, **kwargs):
+    """Подключает к соединениям с репликами учёт ошибок."""
+    if (
+        connection.alias in settings.DATABASE_REPLICAS
+        and replica_errors not in connection.execute_wrappers
+    ):
+        connection.execute_wrappers.append(replica_errors)
+
+
+def replica_errors(execute, sql, params, many, context):
+    try:
+        return execute(sql, params, many, context)
+    except (OperationalError, InterfaceError):
+        pool.mark_failed(context["connection"].alias)
+        state = current_request.get()
+        if state is not None:
+            state.replica_failed = True
+        raise
+
+
+class ReplicaRouter:
+    """Чтение безопасных запросов с реплик, всё остальное - с основной.
+
+    Реплика выбирается, только если запрос к API безопасный, клиент
+    недавно ничего не записывал (см. ReplicaMiddleware), в этом запросе
+    ещё не было записи и нет открытой транзакции в основной базе.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = current_request.get()
+        if (
+            state is None
+            or not state.use_replica
+            or state.wrote
+            or pinned.get()
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return pool.choose(required_since.get()) or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = current_request.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Все базы из DATABASES - копии одной схемы и одних данных
+        if (
+            obj1._state.db in settings.DATABASES
+            and obj2._state.db in settings.DATABASES
+        ):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
@@ -1,4 +1,6 @@
+import json
 import os
+import sys
 
 from dotenv import load_dotenv
 
@@ -14,6 +16,9 @@ MAX_VALUE = 32767
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# Запуск тестов командой manage.py test
+TESTING = sys.argv[1:2] == ['test']
+
 SECRET_KEY = os.getenv('SECRET_KEY', default='blablabla')
 
 DEBUG = True
@@ -41,6 +46,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.ReplicaMiddleware',
+    'api.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,6 +88,59 @@ DATABASES = {
     }
 }
 
+# Без настроек базы тесты идут на SQLite
+if TESTING and not DATABASES['default']['ENGINE']:
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+    }
+
+# Реплики для чтения: JSON-список параметров, которыми каждая реплика
+# отличается от основной базы, например [{"HOST": "replica1"}]
+DATABASE_REPLICAS = []
+for number, overrides in enumerate(
+    json.loads(os.getenv('DB_REPLICAS', '[]')), start=1
+):
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        **overrides,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+# Отдельная база SQLite, которую тесты подключают как отстающую реплику
+if TESTING:
+    DATABASES['replica_test'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'replica.sqlite3'),
+    }
+
+DATABASE_ROUTERS = ['foodgram.replicas.ReplicaRouter']
+
+# Сколько секунд после записи клиент читает из основной базы, как часто
+# проверять реплики и допустимое отставание реплики, секунды
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 10))
+REPLICA_HEALTH_INTERVAL = int(os.getenv('REPLICA_HEALTH_INTERVAL', 15))
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', 5))
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Число записей ограничивают только локальный и файловый бэкенды,
+# клиенты Redis и Memcached не принимают такой параметр
+if CACHES['default']['BACKEND'].endswith(('LocMemCache', 'FileBasedCache')):
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 100000)),
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -112,7 +172,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
 }
 
@@ -142,3 +202,86 @@ CSRF_TRUSTED_ORIGINS = [
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
+
+# Период перестроения индексов ингредиентов в памяти процесса, секунды
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', 300))
+
+# Время жизни справочника битов тегов в кэше, секунды
+TAG_BITS_TIMEOUT = int(os.getenv('TAG_BITS_TIMEOUT', 300))
+
+# Время жизни ответов справочников тегов и ингредиентов в кэше, секунды
+REFERENCE_CACHE_MAX_AGE = int(os.getenv('REFERENCE_CACHE_MAX_AGE', 60))
+
+# Длина ленты рецептов подписчика и число подписчиков автора, начиная
+# с которого его рецепты не раскладываются по лентам, а читаются при запросе
+FEED_LENGTH = int(os.getenv('FEED_LENGTH', 300))
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 1000))
+
+# Наибольшее число результатов поиска рецептов без PostgreSQL
+SEARCH_FALLBACK_LIMIT = int(os.getenv('SEARCH_FALLBACK_LIMIT', 200))
+
+# Время жизни закэшированных представлений рецептов, секунды
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 3600))
+
+# Версии кэша, ETag и журналы индексов должны быть общими для всех
+# процессов, иначе запись в одном процессе не видна в остальных.
+# С локальным LocMemCache кэш представлений рецептов по умолчанию выключен
+SHARED_CACHE = not CACHES['default']['BACKEND'].endswith('LocMemCache')
+RECIPE_CACHE_ENABLED = os.getenv(
+    'RECIPE_CACHE_ENABLED', str(SHARED_CACHE)
+) == 'True'
+# ETag справочников строится из версии в кэше: с LocMemCache запись
+# из другого процесса его не меняет, и клиенты получали бы 304 на старые
+# данные, поэтому условные ответы справочников тогда тоже выключены
+REFERENCE_ETAG_ENABLED = os.getenv(
+    'REFERENCE_ETAG_ENABLED', str(SHARED_CACHE)
+) == 'True'
+
+# TTF-шрифт с кириллицей для PDF-версии списка покупок
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+# Наибольшее число строк списка покупок в PDF: документ строится в памяти
+SHOPPING_LIST_PDF_MAX_ROWS = int(
+    os.getenv('SHOPPING_LIST_PDF_MAX_ROWS', 1000)
+)
+
+# Асинхронные обработчики чтения рецептов, тегов, ингредиентов и подписок,
+# включаются при запуске под ASGI-сервером, например uvicorn
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False') == 'True'
+
+# Превышение бюджета SQL-запросов: исключение в тестах, предупреждение в проде
+QUERY_BUDGET_RAISE = os.getenv(
+    'QUERY_BUDGET_RAISE', str(TESTING)
+) == 'True'
+
+# Наибольшее число рецептов или авторов в одном групповом запросе
+BULK_RELATIONS_LIMIT = int(os.getenv('BULK_RELATIONS_LIMIT', 500))
+
+# Время жизни токена с пользователем в кэше аутентификации, секунды,
+# 0 - без кэша. Выход и блокировка удаляют токен из кэша всех воркеров
+# только при общем кэше, поэтому с LocMemCache кэш по умолчанию выключен
+AUTH_TOKEN_CACHE_TIMEOUT = int(
+    os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', 300 if SHARED_CACHE else 0)
+)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'foodgram.sql': {
+            'handlers': ['console'],
+            'level': os.getenv('SQL_LOG_LEVEL', 'WARNING'),
+        },
+        'foodgram.images': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+    },
+}
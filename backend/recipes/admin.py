@@ -2,6 +2,7 @@ from django.contrib import admin
 from import_export import resources
 from import_export.admin import ImportExportModelAdmin
 
+from foodgram.admin import LargeTableAdminMixin
 from .models import (
     Favorite,
     Ingredient,
@@ -24,16 +25,13 @@ class IngredientResource(resources.ModelResource):
         )
 
 
-class IngredientAdmin(ImportExportModelAdmin):
+class IngredientAdmin(LargeTableAdminMixin, ImportExportModelAdmin):
     from_encoding = "utf-8-sig"
     resource_classes = [IngredientResource]
     list_display = (
         "name",
         "measurement_unit"
     )
-    list_filter = (
-        "name",
-    )
     search_fields = (
         "name",
     )
@@ -52,13 +50,19 @@ class TagAdmin(admin.ModelAdmin):
 
 class RecipeIngredientInLine(admin.TabularInline):
     model = RecipeIngredient
+    autocomplete_fields = (
+        "ingredient",
+    )
 
 
 class RecipeTagsInLine(admin.TabularInline):
     model = RecipeTag
+    autocomplete_fields = (
+        "tag",
+    )
 
 
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = (
         "author",
         "name",
@@ -68,58 +72,92 @@ class RecipeAdmin(admin.ModelAdmin):
         "cooking_time",
         "favorite_count"
     )
+    # Автор ищется по точному адресу почты, теги выбираются фильтром
     list_filter = (
-        "author",
-        "name",
-        "text",
-        "tags"
+        "tags",
     )
     search_fields = (
-        "author__email",
-        "name",
-        "tags__name"
+        "=author__email",
+        "name"
+    )
+    list_select_related = (
+        "author",
+    )
+    autocomplete_fields = (
+        "author",
     )
     inlines = (
         RecipeIngredientInLine,
         RecipeTagsInLine,
     )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related("tags")
+
     @admin.display(description="Теги")
     def get_tags(self, obj):
         return ', '.join([t.name for t in obj.tags.all()])
 
-    @admin.display(description="Избранное")
-    def favorite_count(self, obj):
-        return obj.favorite.count()
 
-
-class RecipeTagAdmin(admin.ModelAdmin):
+class RecipeTagAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = (
         "recipe",
         "tag"
     )
+    list_select_related = (
+        "recipe",
+        "tag",
+    )
+    autocomplete_fields = (
+        "recipe",
+        "tag",
+    )
 
 
-class RecipeIngredientAdmin(admin.ModelAdmin):
+class RecipeIngredientAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = (
         "recipe",
         "ingredient",
         "amount"
     )
+    list_select_related = (
+        "recipe",
+        "ingredient",
+    )
+    autocomplete_fields = (
+        "recipe",
+        "ingredient",
+    )
 
 
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = (
         "user",
         "recipe"
     )
+    list_select_related = (
+        "user",
+        "recipe",
+    )
+    autocomplete_fields = (
+        "user",
+        "recipe",
+    )
 
 
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = (
         "user",
         "recipe"
     )
+    list_select_related = (
+        "user",
+        "recipe",
+    )
+    autocomplete_fields = (
+        "user",
+        "recipe",
+    )
 
 
 admin.site.register(Ingredient, IngredientAdmin)
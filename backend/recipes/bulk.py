@@ -0,0 +1,60 @@
+from django.db import transaction
+
+from users.models import CustomUser, Subscription
+from . import cart, feed
+from .counters import COUNTERS, recount
+from .models import (
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeTag,
+    ShoppingCart,
+    Tag
+)
+from .search import update_search_vectors
+from .tags import update_tags_masks
+from .versions import bump_version
+
+# Модели, от которых зависит закэшированное представление рецепта
+REPRESENTATION_MODELS = (
+    Recipe, RecipeIngredient, RecipeTag, Ingredient, Tag, CustomUser
+)
+
+
+def refresh_after_bulk_load(labels, chunk_size):
+    """Обновляет то, что при bulk_create не делают сигналы.
+
+    labels - метки загруженных моделей, например {"recipes.Recipe"}.
+    Пересчитываются счётчики, маски тегов, итоги списков покупок,
+    поисковые векторы и ленты, а версии справочников, индексов и кэша
+    представлений сбрасываются после фиксации транзакции.
+    """
+    labels = set(labels)
+
+    def loaded(*models):
+        return any(model._meta.label in labels for model in models)
+
+    for model in (Ingredient, Tag, RecipeIngredient):
+        if loaded(model):
+            transaction.on_commit(lambda model=model: bump_version(model))
+    if loaded(*REPRESENTATION_MODELS):
+        transaction.on_commit(lambda: bump_version(Recipe))
+    recount_loaded(loaded, chunk_size)
+    if loaded(Recipe, RecipeTag, Tag):
+        update_tags_masks()
+    if loaded(Ingredient, Recipe, RecipeIngredient):
+        update_search_vectors()
+    if loaded(ShoppingCart, RecipeIngredient):
+        cart.rebuild()
+    if loaded(Recipe, Subscription):
+        feed.rebuild()
+
+
+def recount_loaded(loaded, chunk_size):
+    """Пересчитывает счётчики, которые зависят от загруженных моделей."""
+    for model, field, related_model, related_field in COUNTERS:
+        if loaded(related_model):
+            for _ in recount(
+                model, field, related_model, related_field, chunk_size
+            ):
+                pass
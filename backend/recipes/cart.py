@@ -0,0 +1,133 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connection
+from django.db.models import Sum
+
+from .models import RecipeIngredient, ShoppingCart, ShoppingCartTotal
+
+# Рецепт, ингредиенты которого сейчас заменяются целиком
+replacing_recipe = ContextVar("replacing_recipe", default=None)
+
+UPSERT_SQL = (
+    "INSERT INTO {totals} (user_id, ingredient_id, amount) {select} "
+    "ON CONFLICT (user_id, ingredient_id) "
+    "DO UPDATE SET amount = {totals}.amount + EXCLUDED.amount"
+)
+# Строки (user_id, ingredient_id, amount) для разных изменений
+RECIPE_SQL = (
+    "SELECT %s, ingredient_id, %s * SUM(amount) FROM {items} "
+    "WHERE {where} GROUP BY ingredient_id"
+)
+ITEM_SQL = "SELECT user_id, %s, %s FROM {cart} WHERE recipe_id = %s"
+CARTS_SQL = (
+    "SELECT cart.user_id, item.ingredient_id, %s * SUM(item.amount) "
+    "FROM {cart} cart JOIN {items} item ON item.recipe_id = cart.recipe_id "
+    "WHERE {where} GROUP BY cart.user_id, item.ingredient_id"
+)
+
+
+def table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def upsert(select, params, where="1 = 1"):
+    """Прибавляет к итогам строки, которые отдаёт select."""
+    select = select.format(
+        cart=table(ShoppingCart), items=table(RecipeIngredient), where=where
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            UPSERT_SQL.format(totals=table(ShoppingCartTotal), select=select),
+            params
+        )
+
+
+def delete_empty(**filters):
+    ShoppingCartTotal.objects.filter(amount__lte=0, **filters).delete()
+
+
+def add_recipes(user_id, recipe_ids, sign=1):
+    """Прибавляет рецепты к списку пользователя, при sign=-1 вычитает."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(recipe_ids))
+    upsert(
+        RECIPE_SQL,
+        [user_id, sign, *recipe_ids],
+        where=f"recipe_id IN ({placeholders})"
+    )
+    if sign < 0:
+        delete_empty(user_id=user_id)
+
+
+def add_item(recipe_id, ingredient_id, amount):
+    """Ингредиент рецепта во всех списках, где есть рецепт.
+
+    Отрицательный amount вычитается: ингредиент удалён из рецепта.
+    """
+    upsert(ITEM_SQL, [ingredient_id, amount, recipe_id])
+    if amount < 0:
+        delete_empty(
+            ingredient_id=ingredient_id,
+            user__shopping_cart__recipe_id=recipe_id
+        )
+
+
+def add_to_carts(recipe_id, sign=1):
+    """Все ингредиенты рецепта во всех списках, где он есть."""
+    upsert(CARTS_SQL, [sign, recipe_id], where="cart.recipe_id = %s")
+    if sign < 0:
+        delete_empty(user__shopping_cart__recipe_id=recipe_id)
+
+
+@contextmanager
+def replace_items(recipe_id):
+    """Замена ингредиентов рецепта одним вычитанием и одним прибавлением.
+
+    Сигналы отдельных RecipeIngredient внутри блока итоги не меняют.
+    """
+    add_to_carts(recipe_id, -1)
+    token = replacing_recipe.set(recipe_id)
+    try:
+        yield
+    finally:
+        replacing_recipe.reset(token)
+    add_to_carts(recipe_id)
+
+
+def rebuild(recipe_id=None):
+    """Пересчитывает итоги по спискам покупок.
+
+    С recipe_id - только у пользователей, в чьих списках есть рецепт,
+    без него - у всех.
+    """
+    totals = ShoppingCartTotal.objects.all()
+    if recipe_id is None:
+        totals.delete()
+        upsert(CARTS_SQL, [1])
+        return
+    users = ShoppingCart.objects.filter(recipe_id=recipe_id).values("user")
+    totals.filter(user__in=users).delete()
+    upsert(
+        CARTS_SQL,
+        [1, recipe_id],
+        where=(
+            f"cart.user_id IN (SELECT user_id FROM {table(ShoppingCart)} "
+            "WHERE recipe_id = %s)"
+        )
+    )
+
+
+def expected_totals():
+    """Итоги GROUP BY по спискам покупок: {(user, ingredient): amount}."""
+    rows = RecipeIngredient.objects.filter(
+        recipe__shopping_cart__isnull=False
+    ).values_list(
+        "recipe__shopping_cart__user", "ingredient"
+    ).annotate(total=Sum("amount")).order_by()
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in rows.iterator()
+    }
@@ -0,0 +1,61 @@
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from users.models import CustomUser, Subscription
+from .models import Favorite, Recipe, ShoppingCart
+
+# (модель, поле счётчика, связанная модель, поле связи)
+COUNTERS = (
+    (Recipe, "favorite_count", Favorite, "recipe"),
+    (Recipe, "shopping_cart_count", ShoppingCart, "recipe"),
+    (CustomUser, "recipes_count", Recipe, "author"),
+    (CustomUser, "followers_count", Subscription, "author"),
+)
+
+
+def increment(model, pk, field, delta=1):
+    """Атомарно меняет счётчик на delta, не опуская его ниже нуля."""
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+def increment_many(model, pks, field, delta=1):
+    """increment() для нескольких объектов одним UPDATE."""
+    model.objects.filter(pk__in=pks).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+def actual_count(related_model, related_field):
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(
+                **{related_field: OuterRef("pk")}
+            ).order_by().values(
+                related_field
+            ).annotate(
+                total=Count("pk")
+            ).values("total")
+        ),
+        0
+    )
+
+
+def recount(model, field, related_model, related_field, chunk_size):
+    """Пересчитывает счётчик по диапазонам pk.
+
+    Обновляются только разошедшиеся строки, функция отдаёт
+    их количество по каждому обработанному диапазону.
+    """
+    last_pk = model.objects.aggregate(last_pk=Max("pk"))["last_pk"] or 0
+    for start in range(0, last_pk + 1, chunk_size):
+        actual = actual_count(related_model, related_field)
+        yield start, model.objects.filter(
+            pk__gte=start,
+            pk__lt=start + chunk_size
+        ).exclude(
+            **{field: actual}
+        ).update(
+            **{field: actual}
+        )
@@ -0,0 +1,199 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+
+from users.models import CustomUser, Subscription
+from .models import FeedEntry, Recipe
+
+
+def tables():
+    return {
+        name: connection.ops.quote_name(model._meta.db_table)
+        for name, model in (
+            ("feed", FeedEntry),
+            ("recipe", Recipe),
+            ("subscription", Subscription),
+            ("user", CustomUser),
+        )
+    }
+
+
+def is_pushed(author):
+    """Рецепты автора раскладываются по лентам подписчиков."""
+    return author.followers_count < settings.FEED_FANOUT_LIMIT
+
+
+def prune(chunk_size):
+    """Обрезает ленты до FEED_LENGTH записей по диапазонам id пользователей.
+
+    Раскладка нового рецепта ленты не обрезает, чтобы не считать оконную
+    функцию по лентам всех подписчиков автора на каждый рецепт: лишние
+    старые записи удаляет команда prune_feeds, запускаемая по расписанию.
+    Функция отдаёт число удалённых записей по каждому диапазону.
+    """
+    last_pk = CustomUser.objects.aggregate(last_pk=Max("pk"))["last_pk"] or 0
+    for start in range(0, last_pk + 1, chunk_size):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM {feed} WHERE id IN ("
+                "SELECT id FROM ("
+                "SELECT id, ROW_NUMBER() OVER ("
+                "PARTITION BY user_id ORDER BY recipe_id DESC"
+                ") AS position FROM {feed} "
+                "WHERE user_id >= %s AND user_id < %s"
+                ") AS ranked WHERE position > %s)".format(**tables()),
+                [start, start + chunk_size, settings.FEED_LENGTH]
+            )
+            yield start, cursor.rowcount
+
+
+def fan_out(recipe):
+    """Добавляет новый рецепт в ленты подписчиков автора.
+
+    Рецепты авторов, у которых FEED_FANOUT_LIMIT подписчиков и больше,
+    не копируются: они попадают в ленту при чтении, см. feed_recipes().
+    """
+    author = CustomUser.objects.only("followers_count").get(
+        pk=recipe.author_id
+    )
+    if not is_pushed(author):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO {feed} (user_id, recipe_id) "
+            "SELECT user_id, %s FROM {subscription} WHERE author_id = %s "
+            "ON CONFLICT DO NOTHING".format(**tables()),
+            [recipe.pk, recipe.author_id]
+        )
+
+
+def rebuild(user_ids=None):
+    """Заново собирает ленты пользователей, без user_ids - все.
+
+    В ленту попадают последние FEED_LENGTH рецептов авторов,
+    рецепты которых раскладываются по лентам.
+    """
+    filters = ""
+    params = [settings.FEED_FANOUT_LIMIT]
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        placeholders = ", ".join(["%s"] * len(user_ids))
+        filters = f"AND subscription.user_id IN ({placeholders})"
+        params += user_ids
+    params.append(settings.FEED_LENGTH)
+    feed = FeedEntry.objects.all()
+    if user_ids is not None:
+        feed = feed.filter(user_id__in=user_ids)
+    feed.delete()
+    sql = (
+        "INSERT INTO {feed} (user_id, recipe_id) "
+        "SELECT user_id, recipe_id FROM ("
+        "SELECT subscription.user_id, recipe.id AS recipe_id, "
+        "ROW_NUMBER() OVER ("
+        "PARTITION BY subscription.user_id ORDER BY recipe.id DESC"
+        ") AS position "
+        "FROM {subscription} AS subscription "
+        "JOIN {user} AS author ON author.id = subscription.author_id "
+        "JOIN {recipe} AS recipe ON recipe.author_id = author.id "
+        "WHERE author.followers_count < %s {filters}"
+        ") AS ranked WHERE position <= %s "
+        "ON CONFLICT DO NOTHING"
+    ).format(filters=filters, **tables())
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def subscribe(user_id, author_id):
+    """Добавляет в ленту последние рецепты нового автора."""
+    author = CustomUser.objects.only("followers_count").get(pk=author_id)
+    if not is_pushed(author):
+        return
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, recipe_id=recipe_id)
+            for recipe_id in Recipe.objects.filter(
+                author_id=author_id
+            ).order_by("-id").values_list(
+                "id", flat=True
+            )[:settings.FEED_LENGTH]
+        ),
+        ignore_conflicts=True
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM {feed} WHERE user_id = %s AND recipe_id < ("
+            "SELECT recipe_id FROM {feed} WHERE user_id = %s "
+            "ORDER BY recipe_id DESC LIMIT 1 OFFSET %s)".format(**tables()),
+            [user_id, user_id, settings.FEED_LENGTH - 1]
+        )
+
+
+def backfill(author_ids):
+    """Раскладывает по лентам подписчиков последние рецепты авторов.
+
+    Пока у автора было FEED_FANOUT_LIMIT подписчиков и больше, его
+    рецепты читались при запросе и в ленты не попадали. Когда подписчиков
+    становится меньше, без этого они пропали бы из лент.
+    """
+    author_ids = list(author_ids)
+    if not author_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(author_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO {feed} (user_id, recipe_id) "
+            "SELECT subscription.user_id, recipe.id "
+            "FROM {subscription} AS subscription JOIN ("
+            "SELECT id, author_id, ROW_NUMBER() OVER ("
+            "PARTITION BY author_id ORDER BY id DESC"
+            ") AS position FROM {recipe} "
+            "WHERE author_id IN ({placeholders})"
+            ") AS recipe ON recipe.author_id = subscription.author_id "
+            "WHERE recipe.position <= %s "
+            "ON CONFLICT DO NOTHING".format(
+                placeholders=placeholders, **tables()
+            ),
+            [*author_ids, settings.FEED_LENGTH]
+        )
+
+
+def followers_removed(author_ids):
+    """Вызывается после уменьшения followers_count авторов на единицу.
+
+    Счётчик уменьшается UPDATE внутри той же транзакции, поэтому здесь
+    видно его новое значение, и переход через FEED_FANOUT_LIMIT
+    замечает ровно одна транзакция.
+    """
+    crossed = list(
+        CustomUser.objects.filter(
+            pk__in=author_ids,
+            followers_count=settings.FEED_FANOUT_LIMIT - 1
+        ).values_list("pk", flat=True)
+    )
+    if crossed:
+        transaction.on_commit(lambda: backfill(crossed))
+
+
+def unsubscribe(user_id, author_ids):
+    FeedEntry.objects.filter(
+        user_id=user_id,
+        recipe__author_id__in=author_ids
+    ).delete()
+
+
+def feed_recipes(user):
+    """Подзапрос id рецептов ленты пользователя.
+
+    Записи из таблицы ленты объединяются с рецептами авторов,
+    у которых слишком много подписчиков для раскладки по лентам.
+    """
+    pushed = FeedEntry.objects.filter(user=user).values("recipe_id")
+    pulled = Recipe.objects.filter(
+        author__in=Subscription.objects.filter(
+            user=user,
+            author__followers_count__gte=settings.FEED_FANOUT_LIMIT
+        ).values("author_id")
+    ).order_by().values("id")
+    return pushed.union(pulled)
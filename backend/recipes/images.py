@@ -0,0 +1,99 @@
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .models import Recipe
+from .versions import bump_versions
+
+# Размеры и формат уменьшенных копий картинки рецепта
+VARIANTS = {
+    "card": {"size": (480, 320), "crop": True, "format": "JPEG"},
+    "detail": {"size": (1024, 1024), "crop": False, "format": "JPEG"},
+    "webp": {"size": (1024, 1024), "crop": False, "format": "WEBP"},
+}
+EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp"}
+QUALITY = 82
+
+
+def variant_name(name, variant):
+    """Путь копии рядом с оригиналом: recipes/<имя>_<вариант>.<расширение>."""
+    root = os.path.splitext(name)[0]
+    extension = EXTENSIONS[VARIANTS[variant]["format"]]
+    return f"{root}_{variant}.{extension}"
+
+
+def variant_url(name, variant, generated, storage=default_storage):
+    """Адрес копии картинки, пока копии нет - адрес оригинала.
+
+    Созданные копии generated берутся из Recipe.image_variants,
+    а не проверяются в хранилище при каждом чтении.
+    """
+    return storage.url(
+        variant_name(name, variant) if variant in generated else name
+    )
+
+
+def record_variants(name):
+    """Отмечает копии картинки name созданными у всех её рецептов."""
+    recipe_ids = list(
+        Recipe.objects.filter(image=name).values_list("id", flat=True)
+    )
+    Recipe.objects.filter(id__in=recipe_ids).update(
+        image_variants=list(VARIANTS)
+    )
+    # Представления могли закэшироваться со ссылками на оригинал
+    bump_versions(Recipe, recipe_ids)
+
+
+def delete_variants(name, storage=default_storage):
+    for variant in VARIANTS:
+        path = variant_name(name, variant)
+        if storage.exists(path):
+            storage.delete(path)
+
+
+def render_variant(image, size, crop, image_format):
+    if crop:
+        image = ImageOps.fit(image, size, Image.LANCZOS)
+    else:
+        image = image.copy()
+        image.thumbnail(size, Image.LANCZOS)
+    if image_format == "JPEG" and image.mode != "RGB":
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, image_format, quality=QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def generate_variants(name, force=False, storage=default_storage):
+    """Создаёт недостающие копии картинки и возвращает их количество.
+
+    Уже существующие копии не пересоздаются без force, поэтому
+    повторный вызов для той же картинки ничего не делает.
+    """
+    missing = [
+        variant for variant in VARIANTS
+        if force or not storage.exists(variant_name(name, variant))
+    ]
+    if not missing:
+        return 0
+    with storage.open(name) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image = image.convert(
+            "RGBA" if "A" in image.getbands() or image.mode == "P" else "RGB"
+        )
+    for variant in missing:
+        options = VARIANTS[variant]
+        path = variant_name(name, variant)
+        content = render_variant(
+            image, options["size"], options["crop"], options["format"]
+        )
+        if storage.exists(path):
+            storage.delete(path)
+        storage.save(path, ContentFile(content))
+    return len(missing)
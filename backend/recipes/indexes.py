@@ -0,0 +1,216 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+from foodgram.replicas import primary
+from .models import Ingredient, RecipeIngredient
+from .versions import changes_position, get_version, read_changes
+
+INDEX_CHUNK_SIZE = 10000
+# Наибольшее число изменений, которые индекс применяет без перестроения
+INDEX_CHANGES_LIMIT = 1000
+
+
+def normalize(value):
+    return value.strip().casefold().replace("ё", "е")
+
+
+class VersionedIndex:
+    """Индекс в памяти процесса, привязанный к версии модели.
+
+    Индекс перестраивается целиком при смене версии model и не реже
+    чем раз в INGREDIENT_INDEX_TTL секунд, если кэш с версиями
+    у процессов не общий. Индекс с incremental = True между сменами
+    версии обновляет по журналу изменений только изменившиеся объекты.
+    Данные заменяются одной ссылкой, поэтому читатели никогда не видят
+    индекс в середине обновления.
+    """
+    model = None
+    incremental = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._version = None
+        self._position = 0
+        self._built_at = 0
+
+    def _is_stale(self, version):
+        return (
+            self._data is None
+            or self._version != version
+            or time.monotonic() - self._built_at
+            > settings.INGREDIENT_INDEX_TTL
+        )
+
+    def _is_behind(self, version):
+        return (
+            self.incremental
+            and changes_position(self.model, version) != self._position
+        )
+
+    def _build(self):
+        raise NotImplementedError
+
+    def _update(self, data, pks):
+        """Данные индекса после изменения объектов pks."""
+        raise NotImplementedError
+
+    def _rebuild(self, version):
+        with primary():
+            position = changes_position(self.model, version)
+            self._data = self._build()
+        self._version = version
+        self._position = position
+        self._built_at = time.monotonic()
+
+    def _catch_up(self, version):
+        changes = read_changes(
+            self.model, version, self._position, INDEX_CHANGES_LIMIT
+        )
+        if changes is None:
+            self._rebuild(version)
+            return
+        pks, position = changes
+        with primary():
+            self._data = self._update(self._data, set(pks))
+        self._position = position
+
+    def _snapshot(self):
+        version = get_version(self.model)
+        if self._is_stale(version) or self._is_behind(version):
+            with self._lock:
+                if self._is_stale(version):
+                    self._rebuild(version)
+                elif self._is_behind(version):
+                    self._catch_up(version)
+        return self._data
+
+
+class IngredientIndex(VersionedIndex):
+    """Индекс названий ингредиентов.
+
+    Справочник ингредиентов небольшой и меняется редко, поэтому он
+    целиком держится в отсортированном списке нормализованных названий.
+    Совпадения по началу названия ищутся бинарным поиском и идут первыми,
+    за ними - совпадения по подстроке.
+    """
+    model = Ingredient
+
+    def _build(self):
+        entries = sorted(
+            (normalize(ingredient.name), ingredient.id, ingredient)
+            for ingredient in Ingredient.objects.all()
+        )
+        return (
+            [entry[0] for entry in entries],
+            [entry[2] for entry in entries],
+        )
+
+    def search(self, name):
+        query = normalize(name)
+        keys, ingredients = self._snapshot()
+        if not query:
+            return list(ingredients)
+        prefix = []
+        position = bisect_left(keys, query)
+        while position < len(keys) and keys[position].startswith(query):
+            prefix.append(ingredients[position])
+            position += 1
+        contains = [
+            ingredient for key, ingredient in zip(keys, ingredients)
+            if query in key and not key.startswith(query)
+        ]
+        return prefix + contains
+
+
+class RecipeIngredientIndex(VersionedIndex):
+    """Обратный индекс: ингредиент -> множество id рецептов.
+
+    Вместе с составом каждого рецепта позволяет отвечать на вопросы
+    "что содержит", "что не содержит" и "что можно приготовить
+    из имеющегося" пересечением множеств в памяти, без соединений
+    и GROUP BY по RecipeIngredient. Сохранение рецепта пишет его id
+    в журнал изменений, и индекс перечитывает только его ингредиенты;
+    целиком он перестраивается после импорта и массовой загрузки.
+    """
+    model = RecipeIngredient
+    incremental = True
+
+    def _build(self):
+        postings = defaultdict(set)
+        contents = defaultdict(set)
+        pairs = RecipeIngredient.objects.order_by().values_list(
+            "ingredient_id", "recipe_id"
+        ).iterator(chunk_size=INDEX_CHUNK_SIZE)
+        for ingredient_id, recipe_id in pairs:
+            postings[ingredient_id].add(recipe_id)
+            contents[recipe_id].add(ingredient_id)
+        return dict(postings), {
+            recipe_id: frozenset(ingredient_ids)
+            for recipe_id, ingredient_ids in contents.items()
+        }
+
+    def _update(self, data, recipe_ids):
+        current = defaultdict(set)
+        pairs = RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by().values_list("ingredient_id", "recipe_id")
+        for ingredient_id, recipe_id in pairs:
+            current[recipe_id].add(ingredient_id)
+        # Копируются только затронутые множества: читатели старого
+        # снимка продолжают работать с неизменными данными
+        postings, contents = dict(data[0]), dict(data[1])
+        copied = set()
+
+        def posting(ingredient_id):
+            if ingredient_id not in copied:
+                copied.add(ingredient_id)
+                postings[ingredient_id] = set(postings.get(ingredient_id, ()))
+            return postings[ingredient_id]
+
+        for recipe_id in recipe_ids:
+            old = contents.pop(recipe_id, frozenset())
+            new = frozenset(current[recipe_id])
+            if new:
+                contents[recipe_id] = new
+            for ingredient_id in old - new:
+                posting(ingredient_id).discard(recipe_id)
+            for ingredient_id in new - old:
+                posting(ingredient_id).add(recipe_id)
+        return postings, contents
+
+    def including(self, ingredient_ids):
+        """Рецепты, в которых есть все перечисленные ингредиенты."""
+        postings, _ = self._snapshot()
+        sets = sorted(
+            (postings.get(pk, set()) for pk in set(ingredient_ids)), key=len
+        )
+        if not sets:
+            return set()
+        return sets[0].intersection(*sets[1:])
+
+    def containing_any(self, ingredient_ids):
+        """Рецепты, в которых есть хотя бы один из ингредиентов."""
+        postings, _ = self._snapshot()
+        return set().union(
+            *(postings.get(pk, set()) for pk in set(ingredient_ids))
+        )
+
+    def covered(self, ingredient_ids, percent=100):
+        """Рецепты, не меньше percent % ингредиентов которых в списке."""
+        postings, contents = self._snapshot()
+        matches = Counter()
+        for pk in set(ingredient_ids):
+            matches.update(postings.get(pk, ()))
+        return {
+            recipe_id for recipe_id, count in matches.items()
+            if count * 100 >= percent * len(contents[recipe_id])
+        }
+
+
+ingredient_index = IngredientIndex()
+recipe_ingredient_index = RecipeIngredientIndex()
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes import cart
+from recipes.models import ShoppingCartTotal
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверяет итоги списков покупок с суммой ингредиентов рецептов "
+        "в списках (GROUP BY)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Пересчитать итоги, если есть расхождения"
+        )
+
+    def handle(self, *args, **options):
+        expected = cart.expected_totals()
+        actual = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in
+            ShoppingCartTotal.objects.values_list(
+                "user_id", "ingredient_id", "amount"
+            ).iterator()
+        }
+        differences = sorted(
+            key for key in expected.keys() | actual.keys()
+            if expected.get(key) != actual.get(key)
+        )
+        if options["verbosity"] > 1:
+            for user_id, ingredient_id in differences:
+                self.stdout.write(
+                    f"Пользователь {user_id}, ингредиент {ingredient_id}: "
+                    f"{actual.get((user_id, ingredient_id))} вместо "
+                    f"{expected.get((user_id, ingredient_id))}"
+                )
+        self.stdout.write(
+            f"Итогов: {len(actual)}, расхождений: {len(differences)}"
+        )
+        if not differences:
+            return
+        if not options["fix"]:
+            raise CommandError("Итоги списков покупок расходятся")
+        with transaction.atomic():
+            cart.rebuild()
+        self.stdout.write(self.style.SUCCESS("Итоги пересчитаны"))
@@ -0,0 +1,311 @@
+import random
+import time
+from io import BytesIO
+from itertools import accumulate
+from uuid import uuid4
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from recipes.bulk import refresh_after_bulk_load
+from recipes.images import VARIANTS, generate_variants
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeTag,
+    ShoppingCart,
+    Tag
+)
+from users.models import CustomUser, Subscription
+
+IMAGE_NAME = "recipes/dataset.png"
+PARETO_ALPHA = 1.5
+PARETO_MEAN = PARETO_ALPHA / (PARETO_ALPHA - 1)
+
+DEFAULT_TAGS = (
+    ("Завтрак", "#E26C2D", "breakfast"),
+    ("Обед", "#49B64E", "lunch"),
+    ("Ужин", "#8775D2", "dinner"),
+)
+UNITS = ("г", "мл", "шт.", "ст. л.", "ч. л.", "по вкусу")
+DISHES = (
+    "Салат", "Суп", "Паста", "Пирог", "Омлет", "Рагу", "Каша",
+    "Запеканка", "Плов", "Блины", "Котлеты", "Смузи",
+)
+
+
+def zipf_weights(size, exponent=1.0):
+    """Накопленные веса рангового распределения Ципфа."""
+    return list(accumulate(1 / (rank + 1) ** exponent for rank in range(size)))
+
+
+def power_law_count(rng, mean, limit):
+    """Случайное количество с тяжёлым хвостом и заданным средним."""
+    value = rng.paretovariate(PARETO_ALPHA) * mean / PARETO_MEAN
+    return min(limit, int(value))
+
+
+def batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Command(BaseCommand):
+    help = (
+        "Создаёт синтетические данные: пользователей, рецепты, избранное, "
+        "списки покупок и подписки со степенными распределениями"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users", type=int, default=1000,
+            help="Количество пользователей"
+        )
+        parser.add_argument(
+            "--recipes", type=int, default=10000,
+            help="Количество рецептов"
+        )
+        parser.add_argument(
+            "--favorites", type=float, default=20,
+            help="Среднее число рецептов в избранном у пользователя"
+        )
+        parser.add_argument(
+            "--carts", type=float, default=3,
+            help="Среднее число рецептов в списке покупок у пользователя"
+        )
+        parser.add_argument(
+            "--subscriptions", type=float, default=10,
+            help="Среднее число подписок у пользователя"
+        )
+        parser.add_argument(
+            "--ingredients", type=int, default=1000,
+            help="Сколько ингредиентов создать, если справочник пуст"
+        )
+        parser.add_argument(
+            "--prefix",
+            help=(
+                "Префикс имён пользователей, по умолчанию новый "
+                "для каждого запуска"
+            )
+        )
+        parser.add_argument(
+            "--password", default="foodgram-dataset",
+            help="Пароль всех созданных пользователей"
+        )
+        parser.add_argument(
+            "--seed", type=int, default=None,
+            help="Зерно генератора случайных чисел"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=5000,
+            help="Количество записей в одной вставке"
+        )
+
+    def handle(self, *args, **options):
+        prefix = options["prefix"] or f"user-{uuid4().hex[:8]}-"
+        if CustomUser.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f"Пользователи с префиксом {prefix} уже есть, "
+                "укажите другой --prefix"
+            )
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.verbosity = options["verbosity"]
+        started = time.monotonic()
+        with transaction.atomic():
+            tags = self.ensure_tags()
+            ingredients = self.ensure_ingredients(options["ingredients"])
+            users = self.create_users(
+                options["users"], prefix, options["password"]
+            )
+            recipes = self.create_recipes(
+                options["recipes"], users, tags, ingredients
+            )
+            self.create_relations(
+                Favorite, users, recipes, options["favorites"]
+            )
+            self.create_relations(
+                ShoppingCart, users, recipes, options["carts"]
+            )
+            self.create_subscriptions(users, options["subscriptions"])
+            refresh_after_bulk_load(
+                {
+                    model._meta.label for model in (
+                        CustomUser, Recipe, RecipeIngredient, RecipeTag,
+                        Favorite, ShoppingCart, Subscription,
+                    )
+                },
+                self.batch_size
+            )
+        self.stdout.write(
+            f"Готово за {time.monotonic() - started:.1f} с"
+        )
+
+    def log(self, message):
+        if self.verbosity > 1:
+            self.stdout.write(message)
+
+    def ensure_tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug, bit=bit)
+                for bit, (name, color, slug) in enumerate(DEFAULT_TAGS)
+            )
+        return list(Tag.objects.values_list("id", flat=True))
+
+    def ensure_ingredients(self, count):
+        if not Ingredient.objects.exists():
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(
+                        name=f"Ингредиент {number}",
+                        measurement_unit=UNITS[number % len(UNITS)]
+                    ) for number in range(1, count + 1)
+                ),
+                batch_size=self.batch_size
+            )
+        ingredients = list(Ingredient.objects.values_list("id", "name"))
+        # Популярность ингредиентов не связана с алфавитом
+        self.rng.shuffle(ingredients)
+        return ingredients
+
+    def create_users(self, count, prefix, password):
+        password = make_password(password)
+        users = []
+        for numbers in batches(range(1, count + 1), self.batch_size):
+            users += CustomUser.objects.bulk_create(
+                CustomUser(
+                    username=f"{prefix}{number}",
+                    email=f"{prefix}{number}@example.com",
+                    first_name="Имя",
+                    last_name=f"Фамилия {number}",
+                    password=password
+                ) for number in numbers
+            )
+            self.log(f"Пользователей: {len(users)}")
+        self.stdout.write(f"Пользователей: {len(users)}")
+        user_ids = [user.pk for user in users]
+        self.rng.shuffle(user_ids)
+        return user_ids
+
+    def get_image(self):
+        if not default_storage.exists(IMAGE_NAME):
+            buffer = BytesIO()
+            Image.new("RGB", (1200, 800), (230, 120, 45)).save(
+                buffer, format="PNG"
+            )
+            default_storage.save(IMAGE_NAME, ContentFile(buffer.getvalue()))
+        generate_variants(IMAGE_NAME)
+        return IMAGE_NAME
+
+    def create_recipes(self, count, users, tags, ingredients):
+        image = self.get_image()
+        author_weights = zipf_weights(len(users))
+        ingredient_weights = zipf_weights(len(ingredients), 1.1)
+        tag_weights = zipf_weights(len(tags), 0.5)
+        recipe_ids = []
+        for numbers in batches(range(count), self.batch_size):
+            contents = []
+            recipes = []
+            for _ in numbers:
+                chosen = {
+                    ingredient_id: name for ingredient_id, name in
+                    self.rng.choices(
+                        ingredients,
+                        cum_weights=ingredient_weights,
+                        k=self.rng.randint(3, 12)
+                    )
+                }
+                names = list(chosen.values())
+                recipes.append(Recipe(
+                    author_id=self.rng.choices(
+                        users, cum_weights=author_weights
+                    )[0],
+                    name=f"{self.rng.choice(DISHES)}: {names[0].lower()}",
+                    image=image,
+                    image_variants=list(VARIANTS),
+                    text=(
+                        "Подготовить " + ", ".join(names).lower()
+                        + ". Смешать, довести до готовности и подавать."
+                    ),
+                    cooking_time=self.rng.randint(5, 180)
+                ))
+                contents.append((
+                    chosen,
+                    set(self.rng.choices(
+                        tags,
+                        cum_weights=tag_weights,
+                        k=self.rng.randint(1, len(tags))
+                    ))
+                ))
+            Recipe.objects.bulk_create(recipes)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe_id=recipe.pk,
+                    ingredient_id=ingredient_id,
+                    amount=self.rng.randint(1, 500)
+                )
+                for recipe, (chosen, _) in zip(recipes, contents)
+                for ingredient_id in chosen
+            )
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe_id=recipe.pk, tag_id=tag_id)
+                for recipe, (_, recipe_tags) in zip(recipes, contents)
+                for tag_id in recipe_tags
+            )
+            recipe_ids += [recipe.pk for recipe in recipes]
+            self.log(f"Рецептов: {len(recipe_ids)}")
+        self.stdout.write(f"Рецептов: {len(recipe_ids)}")
+        self.rng.shuffle(recipe_ids)
+        return recipe_ids
+
+    def create_relations(self, model, users, recipes, mean):
+        """Избранное или список покупок: популярные рецепты чаще."""
+        if not recipes:
+            return
+        weights = zipf_weights(len(recipes))
+        limit = len(recipes)
+        total = 0
+        for chunk in batches(users, self.batch_size):
+            objects = [
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in chunk
+                for recipe_id in set(self.rng.choices(
+                    recipes,
+                    cum_weights=weights,
+                    k=power_law_count(self.rng, mean, limit)
+                ))
+            ]
+            model.objects.bulk_create(
+                objects, batch_size=self.batch_size, ignore_conflicts=True
+            )
+            total += len(objects)
+        self.stdout.write(f"{model._meta.verbose_name_plural}: {total}")
+
+    def create_subscriptions(self, users, mean):
+        """Подписки: на популярных авторов подписываются чаще."""
+        weights = zipf_weights(len(users))
+        limit = len(users) - 1
+        total = 0
+        for chunk in batches(users, self.batch_size):
+            objects = [
+                Subscription(user_id=user_id, author_id=author_id)
+                for user_id in chunk
+                for author_id in set(self.rng.choices(
+                    users,
+                    cum_weights=weights,
+                    k=power_law_count(self.rng, mean, limit)
+                ))
+                if author_id != user_id
+            ]
+            Subscription.objects.bulk_create(
+                objects, batch_size=self.batch_size, ignore_conflicts=True
+            )
+            total += len(objects)
+        self.stdout.write(f"Подписок: {total}")
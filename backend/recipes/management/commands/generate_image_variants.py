@@ -0,0 +1,59 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import django
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_variants, record_variants
+from recipes.models import Recipe
+
+
+def process(name, force):
+    try:
+        return name, generate_variants(name, force=force), None
+    except Exception as error:
+        return name, 0, error
+
+
+class Command(BaseCommand):
+    help = "Создаёт уменьшенные копии картинок всех рецептов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Количество параллельных процессов"
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Пересоздать уже существующие копии"
+        )
+
+    def handle(self, *args, **options):
+        names = Recipe.objects.exclude(
+            image=""
+        ).order_by("image").values_list(
+            "image", flat=True
+        ).distinct().iterator()
+        created = failed = 0
+        with ProcessPoolExecutor(
+            max_workers=options["workers"],
+            initializer=django.setup
+        ) as executor:
+            results = executor.map(
+                partial(process, force=options["force"]),
+                names,
+                chunksize=16
+            )
+            for name, count, error in results:
+                created += count
+                if error is not None:
+                    failed += 1
+                    self.stderr.write(f"{name}: {error}")
+                else:
+                    record_variants(name)
+        self.stdout.write(
+            f"Создано копий: {created}, ошибок: {failed}"
+        )
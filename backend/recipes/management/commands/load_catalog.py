@@ -0,0 +1,320 @@
+import csv
+import json
+import os
+from io import StringIO
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.python import Deserializer
+from django.db import IntegrityError, connection, transaction
+
+from recipes.bulk import refresh_after_bulk_load
+from recipes.models import Ingredient, RecipeIngredient, Tag, assign_tag_bits
+
+READ_SIZE = 64 * 1024
+
+# Поля строк CSV без заголовка и правила обновления для простых записей
+PLAIN_MODELS = {
+    "ingredient": {
+        "model": Ingredient,
+        "fields": ("name", "measurement_unit"),
+        "unique_fields": ("name", "measurement_unit"),
+        "update_fields": (),
+    },
+    "tag": {
+        "model": Tag,
+        "fields": ("name", "color", "slug"),
+        "unique_fields": ("slug",),
+        "update_fields": ("name", "color"),
+    },
+}
+
+# Модели, которые загружаются из дампа dumpdata, остальные пропускаются
+FIXTURE_MODELS = (
+    "recipes.ingredient",
+    "recipes.tag",
+    "users.customuser",
+    "recipes.recipe",
+    "recipes.recipetag",
+    "recipes.recipeingredient",
+    "recipes.favorite",
+    "recipes.shoppingcart",
+    "users.subscription",
+)
+
+
+def iter_json_array(file):
+    """Построчно разбирает JSON-массив объектов, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    while True:
+        chunk = file.read(READ_SIZE)
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in "[, \t\r\n":
+                position += 1
+            if buffer[position:position + 1] == "]":
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield item
+        buffer = buffer[position:]
+        if not chunk:
+            if buffer.strip():
+                raise CommandError("Файл JSON оборван или повреждён")
+            return
+
+
+def iter_ndjson(file):
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_csv(file, fields, header):
+    if header:
+        yield from csv.DictReader(file)
+        return
+    for row in csv.reader(file):
+        if row:
+            yield dict(zip(fields, row))
+
+
+class Command(BaseCommand):
+    help = (
+        "Потоковая загрузка ингредиентов, тегов и рецептов "
+        "из CSV, JSON, NDJSON или дампа dumpdata пачками"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу")
+        parser.add_argument(
+            "--format",
+            choices=("csv", "json", "ndjson"),
+            help="Формат файла, по умолчанию определяется по расширению"
+        )
+        parser.add_argument(
+            "--model",
+            choices=tuple(PLAIN_MODELS),
+            default="ingredient",
+            help="Модель для записей без ключа model"
+        )
+        parser.add_argument(
+            "--header",
+            action="store_true",
+            help="Первая строка CSV содержит названия полей"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Количество записей в одной вставке"
+        )
+        parser.add_argument(
+            "--no-copy",
+            action="store_true",
+            help="Не использовать COPY для ингредиентов в PostgreSQL"
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = (
+            options["format"] or os.path.splitext(path)[1].lstrip(".")
+        )
+        if file_format not in ("csv", "json", "ndjson"):
+            raise CommandError(f"Неизвестный формат файла: {file_format}")
+        self.batch_size = options["batch_size"]
+        self.plain = PLAIN_MODELS[options["model"]]
+        self.use_copy = (
+            not options["no_copy"]
+            and connection.vendor == "postgresql"
+            and self.plain["model"] is Ingredient
+        )
+        self.verbosity = options["verbosity"]
+        self.buffers = {}
+        self.current_key = None
+        # id ингредиентов дампа -> id таких же ингредиентов в базе
+        self.ingredient_ids = {}
+        self.totals = {}
+        self.skipped = {}
+
+        with open(path, encoding="utf-8-sig", newline="") as file:
+            if file_format == "csv":
+                records = iter_csv(
+                    file, self.plain["fields"], options["header"]
+                )
+            elif file_format == "json":
+                records = iter_json_array(file)
+            else:
+                records = iter_ndjson(file)
+            try:
+                with transaction.atomic():
+                    for record in records:
+                        self.add(record)
+                    for key in list(self.buffers):
+                        self.flush(key)
+                    self.after_load()
+            except IntegrityError as error:
+                raise CommandError(
+                    "Записи файла противоречат данным в базе, "
+                    f"ничего не загружено: {error}"
+                )
+
+        for label, total in self.totals.items():
+            self.stdout.write(f"{label}: загружено {total}")
+        for label, total in self.skipped.items():
+            self.stdout.write(f"{label}: пропущено {total}")
+
+    def add(self, record):
+        if "model" in record:
+            label = record["model"].lower()
+            if label not in FIXTURE_MODELS:
+                self.skipped[label] = self.skipped.get(label, 0) + 1
+                return
+            key = label
+        else:
+            key = None
+        if key != self.current_key:
+            # Модели дампа идут в порядке зависимостей: ингредиенты
+            # сохраняются раньше, чем загружаются ссылки на них
+            self.flush(self.current_key)
+            self.current_key = key
+        buffer = self.buffers.setdefault(key, [])
+        buffer.append(record)
+        if len(buffer) >= self.batch_size:
+            self.flush(key)
+
+    def flush(self, key):
+        records = self.buffers.pop(key, [])
+        if not records:
+            return
+        if key is None:
+            model = self.plain["model"]
+            if self.use_copy:
+                self.copy_ingredients(records)
+            else:
+                objects = [model(**record) for record in records]
+                if model is Tag:
+                    assign_tag_bits(objects)
+                self.upsert(
+                    model,
+                    objects,
+                    self.plain["unique_fields"],
+                    self.plain["update_fields"]
+                )
+        else:
+            model = apps.get_model(key)
+            objects = [item.object for item in Deserializer(records)]
+            if model is Ingredient:
+                self.insert_ingredients(objects)
+            else:
+                self.load_fixture_objects(model, objects)
+        label = model._meta.label
+        self.totals[label] = self.totals.get(label, 0) + len(records)
+        if self.verbosity > 1:
+            self.stdout.write(f"{label}: {self.totals[label]}")
+
+    def load_fixture_objects(self, model, objects):
+        if model is Tag:
+            # В старых дампах у тегов нет битов маски
+            assign_tag_bits(objects)
+        elif model is RecipeIngredient:
+            for item in objects:
+                item.ingredient_id = self.ingredient_ids.get(
+                    item.ingredient_id, item.ingredient_id
+                )
+        update_fields = [
+            field.name for field in model._meta.concrete_fields
+            if not field.primary_key
+        ]
+        self.upsert(model, objects, ("id",), update_fields)
+
+    def insert_ingredients(self, objects):
+        """Ингредиенты дампа, сопоставленные по названию и единице.
+
+        Ингредиент, который уже есть в базе, например из CSV, не
+        дублируется: ссылки на него из дампа переводятся на id в базе.
+        Новый ингредиент сохраняет id из дампа, если тот свободен.
+        """
+        existing = {
+            (name, unit): pk
+            for pk, name, unit in Ingredient.objects.filter(
+                name__in={item.name for item in objects}
+            ).values_list("id", "name", "measurement_unit")
+        }
+        taken = set(
+            Ingredient.objects.filter(
+                id__in=[item.id for item in objects]
+            ).values_list("id", flat=True)
+        )
+        new = []
+        renumbered = []
+        for item in objects:
+            pk = existing.get((item.name, item.measurement_unit))
+            if pk is not None:
+                self.ingredient_ids[item.id] = pk
+            elif item.id in taken:
+                renumbered.append((item.id, item))
+                item.id = None
+            else:
+                new.append(item)
+        Ingredient.objects.bulk_create(new)
+        Ingredient.objects.bulk_create(item for _, item in renumbered)
+        for old_id, item in renumbered:
+            self.ingredient_ids[old_id] = item.id
+
+    def upsert(self, model, objects, unique_fields, update_fields):
+        if update_fields:
+            model.objects.bulk_create(
+                objects,
+                update_conflicts=True,
+                unique_fields=unique_fields,
+                update_fields=update_fields
+            )
+        else:
+            model.objects.bulk_create(objects, ignore_conflicts=True)
+
+    def copy_ingredients(self, records):
+        """Вставка ингредиентов через COPY во временную таблицу."""
+        buffer = StringIO()
+        csv.writer(buffer).writerows(
+            (record["name"], record["measurement_unit"])
+            for record in records
+        )
+        buffer.seek(0)
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS ingredient_import "
+                "(name text, measurement_unit text) ON COMMIT DROP"
+            )
+            cursor.copy_expert(
+                "COPY ingredient_import FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+            cursor.execute(
+                f"INSERT INTO {table} (name, measurement_unit) "
+                "SELECT DISTINCT name, measurement_unit "
+                "FROM ingredient_import "
+                "ON CONFLICT (name, measurement_unit) DO NOTHING"
+            )
+            cursor.execute("TRUNCATE ingredient_import")
+
+    def after_load(self):
+        refresh_after_bulk_load(self.totals, self.batch_size)
+        if connection.vendor == "postgresql":
+            self.reset_sequences()
+
+    def reset_sequences(self):
+        models = [
+            apps.get_model(label) for label in self.totals
+            if label.lower() in FIXTURE_MODELS
+        ]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                self.style, models
+            ):
+                cursor.execute(sql)
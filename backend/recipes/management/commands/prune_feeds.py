@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from recipes.feed import prune
+
+
+class Command(BaseCommand):
+    help = "Обрезает ленты подписок до FEED_LENGTH записей"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Количество пользователей в одном DELETE"
+        )
+
+    def handle(self, *args, **options):
+        removed = 0
+        for start, deleted in prune(options["chunk_size"]):
+            removed += deleted
+            if options["verbosity"] > 1:
+                self.stdout.write(
+                    f"Пользователи с id {start}: удалено {deleted}"
+                )
+        self.stdout.write(f"Удалено записей лент: {removed}")
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from recipes.counters import COUNTERS, recount
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счётчики избранного, корзин, рецептов и подписчиков"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=10000,
+            help="Количество строк в одном UPDATE"
+        )
+
+    def handle(self, *args, **options):
+        for model, field, related_model, related_field in COUNTERS:
+            fixed = 0
+            for start, updated in recount(
+                model, field, related_model, related_field,
+                options["chunk_size"]
+            ):
+                fixed += updated
+                if options["verbosity"] > 1:
+                    self.stdout.write(
+                        f"{model._meta.label}.{field} "
+                        f"с id {start}: исправлено {updated}"
+                    )
+            self.stdout.write(
+                f"{model._meta.label}.{field}: исправлено {fixed}"
+            )
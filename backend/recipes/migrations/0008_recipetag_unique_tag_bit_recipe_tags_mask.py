@@ -0,0 +1,88 @@
+# Generated by Django 4.1.7 on 2026-10-18 04:10
+
+from django.db import migrations, models
+from django.db.models import (
+    BigIntegerField,
+    F,
+    Min,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value
+)
+from django.db.models.functions import Cast, Coalesce
+
+MAX_TAGS = 63
+
+
+def delete_duplicate_recipe_tags(apps, schema_editor):
+    RecipeTag = apps.get_model('recipes', 'RecipeTag')
+    keep = RecipeTag.objects.values('recipe', 'tag').annotate(
+        keep_id=Min('id')
+    ).values('keep_id')
+    RecipeTag.objects.exclude(id__in=keep).delete()
+
+
+def assign_tag_bits(apps, schema_editor):
+    Tag = apps.get_model('recipes', 'Tag')
+    tags = list(Tag.objects.order_by('id'))
+    if len(tags) > MAX_TAGS:
+        raise RuntimeError(f'Тегов больше {MAX_TAGS}, маска не поместится')
+    for bit, tag in enumerate(tags):
+        tag.bit = bit
+    Tag.objects.bulk_update(tags, ['bit'])
+
+
+def fill_tags_masks(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeTag = apps.get_model('recipes', 'RecipeTag')
+    Recipe.objects.update(
+        tags_mask=Coalesce(
+            Subquery(
+                RecipeTag.objects.filter(
+                    recipe=OuterRef('pk')
+                ).order_by().values('recipe').annotate(
+                    mask=Sum(
+                        Cast(Value(1), BigIntegerField()).bitleftshift(
+                            F('tag__bit')
+                        )
+                    )
+                ).values('mask')
+            ),
+            0
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_feedentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            delete_duplicate_recipe_tags, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='recipetag',
+            constraint=models.UniqueConstraint(fields=('recipe', 'tag'), name='recipe_tag_unique'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, verbose_name='Бит в маске тегов рецепта'),
+        ),
+        migrations.RunPython(assign_tag_bits, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, unique=True, verbose_name='Бит в маске тегов рецепта'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, verbose_name='Маска тегов'),
+        ),
+        migrations.RunPython(fill_tags_masks, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,17 @@
+from django.contrib.postgres.search import SearchVectorField
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import connection, models
+from django.db.models import Exists, OuterRef, Prefetch, Value
 
-from users.models import CustomUser
+from users.models import CustomUser, Subscription
+from foodgram.models import CounterFieldsMixin
 from foodgram.settings import MIN_VALUE, MAX_VALUE
 
 MAX_LENGTH = 200
 MAX_HEX_COLOR_LENGTH = 7
+# Теги рецепта хранятся битами в знаковом bigint
+MAX_TAGS = 63
 
 
 class Ingredient(models.Model):
@@ -50,6 +56,11 @@ class Tag(models.Model):
         max_length=MAX_LENGTH,
         unique=True
     )
+    bit = models.PositiveSmallIntegerField(
+        "Бит в маске тегов рецепта",
+        unique=True,
+        editable=False
+    )
 
     class Meta:
         ordering = ("name",)
@@ -59,8 +70,127 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        assign_tag_bits([self])
+        super().save(*args, **kwargs)
+
+
+def assign_tag_bits(tags):
+    """Назначает биты тегам, у которых их ещё нет.
+
+    Тег со слагом, который уже есть в базе, получает его бит, поэтому
+    повторная загрузка тегов не расходует свободные биты.
+    """
+    new_tags = [tag for tag in tags if tag.bit is None]
+    if not new_tags:
+        return
+    used = dict(Tag.objects.values_list("slug", "bit"))
+    free = (bit for bit in range(MAX_TAGS) if bit not in used.values())
+    for tag in new_tags:
+        tag.bit = used.get(tag.slug)
+        if tag.bit is None:
+            tag.bit = next(free, None)
+        if tag.bit is None:
+            raise ValidationError(f"Нельзя создать больше {MAX_TAGS} тегов")
+
+
+class RecipeQuerySet(models.QuerySet):
+
+    def with_user_flags(self, user):
+        """Флаги избранного, корзины и подписки на автора для user."""
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                is_subscribed=Value(False)
+            )
+        return self.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_subscribed=Exists(
+                Subscription.objects.filter(
+                    user=user,
+                    author=OuterRef("author_id")
+                )
+            )
+        )
+
+    def with_related(self, fields=None):
+        """Автор, теги и ингредиенты рецептов одним запросом на связь.
+
+        С fields загружаются только столбцы и связи, нужные этим полям.
+        """
+        return self.defer(*unused_columns(fields)).prefetch_related(
+            *related_lookups(fields)
+        )
+
+    def latest_by_author(self, author_ids, limit=None):
+        """Последние рецепты авторов одним запросом.
+
+        Возвращает словарь {id автора: [рецепты]}. При заданном limit
+        от каждого автора берётся не больше limit рецептов с помощью
+        оконной функции ROW_NUMBER().
+        """
+        recipes = {author_id: [] for author_id in author_ids}
+        if not recipes:
+            return recipes
+        if limit is None:
+            queryset = self.filter(author_id__in=recipes)
+        else:
+            table = connection.ops.quote_name(self.model._meta.db_table)
+            placeholders = ", ".join(["%s"] * len(recipes))
+            queryset = self.raw(
+                "SELECT id, author_id, name, image, image_variants, "
+                "cooking_time FROM ("
+                "SELECT id, author_id, name, image, image_variants, "
+                "cooking_time, "
+                "ROW_NUMBER() OVER ("
+                "PARTITION BY author_id ORDER BY id DESC"
+                ") AS position "
+                f"FROM {table} WHERE author_id IN ({placeholders})"
+                ") AS ranked WHERE position <= %s "
+                "ORDER BY author_id, id DESC",
+                [*recipes, limit]
+            )
+        for recipe in queryset:
+            recipes[recipe.author_id].append(recipe)
+        return recipes
+
+
+def related_lookups(fields=None):
+    """Связи, которые нужны представлению рецепта с полями fields.
+
+    Без fields - полному представлению.
+    """
+    lookups = {
+        "author": "author",
+        "tags": "tags",
+        "ingredients": Prefetch(
+            "recipeingredient_set",
+            queryset=RecipeIngredient.objects.select_related(
+                "ingredient"
+            ).order_by("id")
+        ),
+    }
+    return tuple(
+        lookup for field, lookup in lookups.items()
+        if fields is None or field in fields
+    )
+
 
-class Recipe(models.Model):
+def unused_columns(fields=None):
+    """Столбцы, которые представлению рецепта с полями fields не нужны."""
+    columns = ["search_vector"]
+    if fields is not None and "text" not in fields:
+        columns.append("text")
+    return columns
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     author = models.ForeignKey(
         CustomUser,
         on_delete=models.CASCADE,
@@ -75,6 +205,13 @@ class Recipe(models.Model):
         "Картинка рецепта",
         upload_to="recipes/"
     )
+    # Уменьшенные копии, которые уже созданы, см. recipes.images
+    image_variants = models.JSONField(
+        "Копии картинки",
+        default=list,
+        blank=True,
+        editable=False
+    )
     text = models.TextField(
         "Описание рецепта"
     )
@@ -103,6 +240,31 @@ class Recipe(models.Model):
             ),
         ]
     )
+    favorite_count = models.PositiveIntegerField(
+        "Добавлений в избранное",
+        default=0,
+        editable=False
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        "Добавлений в список покупок",
+        default=0,
+        editable=False
+    )
+    search_vector = SearchVectorField(
+        "Поисковый вектор",
+        null=True,
+        editable=False
+    )
+    # Копия RecipeTag для фильтрации по тегам без соединения таблиц
+    tags_mask = models.BigIntegerField(
+        "Маска тегов",
+        default=0,
+        db_index=True,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
+    counter_fields = ("favorite_count", "shopping_cart_count")
 
     class Meta:
         ordering = ("-id",)
@@ -126,6 +288,13 @@ class RecipeTag(models.Model):
     )
 
     class Meta:
+        constraints = [
+            # Индекс по (recipe, tag) покрывает и выборку тегов рецепта
+            models.UniqueConstraint(
+                fields=["recipe", "tag"],
+                name="recipe_tag_unique"
+            ),
+        ]
         verbose_name = "Тег рецепта"
         verbose_name_plural = "Теги рецептов"
 
@@ -222,3 +391,70 @@ class Favorite(models.Model):
 
     def __str__(self):
         return f"{self.user} добавил в избранное {self.recipe}"
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписчика, записывается при публикации."""
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name="feed",
+        verbose_name="Подписчик"
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="feed_entries",
+        verbose_name="Рецепт"
+    )
+
+    class Meta:
+        constraints = [
+            # Индекс по (user, recipe) нужен и для выборки ленты
+            models.UniqueConstraint(
+                fields=["user", "recipe"],
+                name="feed_entry_unique_recipe"
+            ),
+        ]
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Записи лент"
+
+    def __str__(self):
+        return f"{self.recipe} в ленте {self.user}"
+
+
+class ShoppingCartTotal(models.Model):
+    """Сумма ингредиента по всем рецептам в списке покупок.
+
+    Обновляется при добавлении и удалении рецептов из списка
+    и при изменении ингредиентов рецептов (см. recipes.cart).
+    """
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name="shopping_cart_totals",
+        verbose_name="Пользователь"
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="shopping_cart_totals",
+        verbose_name="Ингредиент"
+    )
+    amount = models.IntegerField(
+        "Количество"
+    )
+
+    class Meta:
+        constraints = [
+            # Индекс по (user, ingredient) нужен и для чтения списка
+            models.UniqueConstraint(
+                fields=["user", "ingredient"],
+                name="shopping_cart_total_unique_ingredient"
+            ),
+        ]
+        verbose_name = "Итог списка покупок"
+        verbose_name_plural = "Итоги списков покупок"
+
+    def __str__(self):
+        return f"{self.user}: {self.ingredient} {self.amount}"
@@ -0,0 +1,102 @@
+from django.db import connection, transaction
+
+from users.models import CustomUser, Subscription
+from . import cart, feed
+from .counters import increment_many
+from .models import Favorite, Recipe, ShoppingCart, ShoppingCartTotal
+
+# Связь пользователя с объектами: поле связи, модель объекта и его счётчик
+RELATIONS = {
+    Favorite: ("recipe", Recipe, "favorite_count"),
+    ShoppingCart: ("recipe", Recipe, "shopping_cart_count"),
+    Subscription: ("author", CustomUser, "followers_count"),
+}
+
+
+def table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def fetch_ids(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+@transaction.atomic
+def add(model, user_id, ids):
+    """Связывает пользователя с объектами ids одним INSERT.
+
+    Существующие связи и несуществующие объекты пропускаются, поэтому
+    повторный или параллельный запрос не приводит к ошибке.
+    Возвращает id объектов, связи с которыми созданы.
+    """
+    field, target, _ = RELATIONS[model]
+    ids = sorted(set(ids))
+    if model is Subscription:
+        # На себя подписаться нельзя, такую пару отсекает и CHECK в базе
+        ids = [pk for pk in ids if pk != user_id]
+    if not ids:
+        return []
+    placeholders = ", ".join(["%s"] * len(ids))
+    created = fetch_ids(
+        f"INSERT INTO {table(model)} (user_id, {field}_id) "
+        f"SELECT %s, id FROM {table(target)} WHERE id IN ({placeholders}) "
+        f"ON CONFLICT DO NOTHING RETURNING {field}_id",
+        [user_id, *ids]
+    )
+    if created:
+        apply(model, user_id, created, 1)
+    return created
+
+
+@transaction.atomic
+def remove(model, user_id, ids=None):
+    """Удаляет связи пользователя с объектами ids, без ids - все.
+
+    Возвращает id объектов, связи с которыми удалены.
+    """
+    field, _, _ = RELATIONS[model]
+    sql = f"DELETE FROM {table(model)} WHERE user_id = %s"
+    params = [user_id]
+    if ids is not None:
+        ids = sorted(set(ids))
+        if not ids:
+            return []
+        placeholders = ", ".join(["%s"] * len(ids))
+        sql += f" AND {field}_id IN ({placeholders})"
+        params += ids
+    removed = fetch_ids(f"{sql} RETURNING {field}_id", params)
+    if removed:
+        apply(model, user_id, removed, -1, everything=ids is None)
+    return removed
+
+
+def apply(model, user_id, ids, delta, everything=False):
+    """Последствия изменения связей: счётчики, итоги списка покупок, ленты.
+
+    Единственное место с этой логикой: её вызывают и add() с remove(),
+    и сигналы save() и delete() отдельных связей, см. apply_instance().
+    """
+    _, target, counter = RELATIONS[model]
+    increment_many(target, ids, counter, delta)
+    if model is ShoppingCart:
+        if everything:
+            ShoppingCartTotal.objects.filter(user_id=user_id).delete()
+        else:
+            cart.add_recipes(user_id, ids, delta)
+    elif model is Subscription:
+        if delta < 0:
+            feed.followers_removed(ids)
+            feed.unsubscribe(user_id, ids)
+        elif len(ids) == 1:
+            transaction.on_commit(lambda: feed.subscribe(user_id, ids[0]))
+        else:
+            transaction.on_commit(lambda: feed.rebuild([user_id]))
+
+
+def apply_instance(instance, delta):
+    """apply() для одной связи, созданной или удалённой через ORM."""
+    model = type(instance)
+    field, _, _ = RELATIONS[model]
+    apply(model, instance.user_id, [getattr(instance, f"{field}_id")], delta)
@@ -0,0 +1,154 @@
+import heapq
+import re
+from itertools import groupby
+from operator import itemgetter
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector
+)
+from django.conf import settings
+from django.db import connection
+from django.db.models import (
+    Case,
+    F,
+    FloatField,
+    OuterRef,
+    Subquery,
+    TextField,
+    Value,
+    When
+)
+from django.db.models.functions import Coalesce
+
+from .indexes import normalize
+from .models import Recipe, RecipeIngredient
+
+SEARCH_CONFIG = "russian"
+SEARCH_CHUNK_SIZE = 1000
+
+# Веса частей рецепта: название, ингредиенты, описание
+WEIGHTS = (("name", "A", 1.0), ("ingredients", "B", 0.4), ("text", "C", 0.2))
+WORD_RE = re.compile(r"\w+")
+
+
+def is_supported():
+    return connection.vendor == "postgresql"
+
+
+def search_document():
+    """Взвешенный tsvector из названия, ингредиентов и описания."""
+    ingredients = Subquery(
+        RecipeIngredient.objects.filter(
+            recipe=OuterRef("pk")
+        ).order_by().values("recipe").annotate(
+            names=StringAgg("ingredient__name", " ")
+        ).values("names")
+    )
+    sources = {
+        "name": F("name"),
+        "ingredients": Coalesce(
+            ingredients, Value(""), output_field=TextField()
+        ),
+        "text": F("text"),
+    }
+    vector = None
+    for part, weight, _ in WEIGHTS:
+        part_vector = SearchVector(
+            sources[part], weight=weight, config=SEARCH_CONFIG
+        )
+        vector = part_vector if vector is None else vector + part_vector
+    return vector
+
+
+def update_search_vectors(recipe_ids=None):
+    """Пересчитывает search_vector рецептов, без recipe_ids - всех.
+
+    Вне PostgreSQL ничего не делает: там поиск идёт без вектора.
+    """
+    if not is_supported():
+        return
+    queryset = Recipe.objects.all()
+    if recipe_ids is not None:
+        queryset = queryset.filter(id__in=recipe_ids)
+    queryset.update(search_vector=search_document())
+
+
+def search_recipes(queryset, value):
+    """Рецепты, подходящие под поисковую строку, по убыванию релевантности.
+
+    В PostgreSQL используется search_vector с GIN-индексом и синтаксис
+    websearch_to_tsquery, на других базах - поиск слов в памяти
+    с теми же весами полей и не больше SEARCH_FALLBACK_LIMIT лучших
+    рецептов.
+    """
+    if is_supported():
+        query = SearchQuery(
+            value, search_type="websearch", config=SEARCH_CONFIG
+        )
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F("search_vector"), query)
+        ).order_by("-search_rank", "-id")
+    ranks = fallback_ranks(queryset, value)
+    return queryset.filter(id__in=ranks).annotate(
+        search_rank=Case(
+            *(When(id=pk, then=Value(rank)) for pk, rank in ranks.items()),
+            default=Value(0.0),
+            output_field=FloatField()
+        )
+    ).order_by("-search_rank", "-id")
+
+
+def document_rank(document, terms):
+    """Сумма весов полей с совпадениями, 0 - если слово не найдено."""
+    rank = 0.0
+    for term in terms:
+        term_rank = sum(
+            weight for part, _, weight in WEIGHTS if term in document[part]
+        )
+        if not term_rank:
+            return 0.0
+        rank += term_rank
+    return rank
+
+
+def fallback_ranks(queryset, value):
+    """Ранги рецептов без полнотекстового индекса.
+
+    Рецепт подходит, если каждое слово запроса встречается в названии,
+    ингредиентах или описании. Ранг - сумма весов полей с совпадениями.
+    Рецепты с названиями ингредиентов читаются потоком одним запросом,
+    строка на ингредиент. Остаются SEARCH_FALLBACK_LIMIT рецептов
+    с наибольшим рангом, чтобы список id и CASE в итоговом запросе
+    не росли вместе с базой.
+    """
+    terms = WORD_RE.findall(normalize(value))
+    if not terms:
+        return {}
+    limit = settings.SEARCH_FALLBACK_LIMIT
+    best = []
+    rows = queryset.prefetch_related(None).order_by("id").values_list(
+        "id", "name", "text", "recipeingredient__ingredient__name"
+    ).iterator(chunk_size=SEARCH_CHUNK_SIZE)
+    for pk, recipe_rows in groupby(rows, key=itemgetter(0)):
+        recipe_rows = list(recipe_rows)
+        _, name, text, _ = recipe_rows[0]
+        rank = document_rank(
+            {
+                "name": normalize(name),
+                "ingredients": " ".join(
+                    normalize(row[3]) for row in recipe_rows if row[3]
+                ),
+                "text": normalize(text),
+            },
+            terms
+        )
+        if not rank:
+            continue
+        if len(best) < limit:
+            heapq.heappush(best, (rank, pk))
+        else:
+            heapq.heappushpop(best, (rank, pk))
+    return {pk: rank for rank, pk in best}
@@ -0,0 +1,244 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_save
+)
+from django.dispatch import receiver
+from import_export.signals import post_import
+
+from users.models import CustomUser, Subscription
+from . import cart, feed, relations
+from .counters import increment
+from .images import delete_variants, generate_variants, record_variants
+from .models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeTag,
+    ShoppingCart,
+    Tag
+)
+from .search import update_search_vectors
+from .tags import update_tags_masks
+from .versions import bump_version, bump_versions, log_changes
+
+logger = logging.getLogger("foodgram.images")
+
+# Поля пользователя, которые входят в представление рецепта
+AUTHOR_FIELDS = {"email", "username", "first_name", "last_name"}
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_reference_version(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(sender))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def log_recipe_ingredient_changes(sender, instance, **kwargs):
+    # Ингредиенты рецепта из API сохраняются через bulk_create,
+    # поэтому в журнал попадает и сохранение самого рецепта
+    recipe_id = instance.pk if sender is Recipe else instance.recipe_id
+    transaction.on_commit(
+        lambda: log_changes(
+            RecipeIngredient, [recipe_id], settings.INGREDIENT_INDEX_TTL
+        )
+    )
+
+
+@receiver(post_import)
+def bump_reference_version_after_import(model, **kwargs):
+    bump_version(model)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Subscription)
+def apply_created_relation(sender, instance, created, **kwargs):
+    if created:
+        relations.apply_instance(instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Subscription)
+def apply_deleted_relation(sender, instance, **kwargs):
+    # При каскадном удалении рецепта его ингредиенты могут быть уже
+    # удалены - тогда итоги списка покупок вычитает сигнал RecipeIngredient
+    relations.apply_instance(instance, -1)
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(sender, instance, created, **kwargs):
+    if created:
+        increment(CustomUser, instance.author_id, "recipes_count")
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(sender, instance, **kwargs):
+    increment(CustomUser, instance.author_id, "recipes_count", -1)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: feed.fan_out(instance))
+
+
+def refresh_image_variants(name, old_name):
+    """Копии новой картинки рецепта вместо копий старой.
+
+    Ошибка обработки картинки не должна превращать уже сохранённый
+    рецепт в ответ 500: она пишется в лог, копии можно создать
+    командой generate_image_variants, а до тех пор вместо копий
+    отдаётся оригинал.
+    """
+    if old_name and not Recipe.objects.filter(image=old_name).exists():
+        try:
+            delete_variants(old_name)
+        except Exception:
+            logger.exception("Не удалены копии картинки %s", old_name)
+    if not name:
+        return
+    try:
+        generate_variants(name)
+    except Exception:
+        logger.exception("Не созданы копии картинки %s", name)
+        return
+    record_variants(name)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_old_image(sender, instance, raw, **kwargs):
+    instance.old_image = None
+    if raw:
+        return
+    if not instance._state.adding:
+        instance.old_image = Recipe.objects.filter(
+            pk=instance.pk
+        ).values_list("image", flat=True).first()
+    if instance.image.name != instance.old_image:
+        # Копий новой картинки ещё нет, их отметит refresh_image_variants
+        instance.image_variants = []
+
+
+@receiver(post_save, sender=Recipe)
+def generate_image_variants(sender, instance, **kwargs):
+    name = instance.image.name
+    old_name = getattr(instance, "old_image", None)
+    if name != old_name:
+        transaction.on_commit(
+            lambda: refresh_image_variants(name, old_name)
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(sender, instance, **kwargs):
+    # Ингредиенты сохраняются после рецепта, поэтому вектор
+    # пересчитывается после фиксации транзакции
+    recipe_ids = [instance.pk]
+    transaction.on_commit(lambda: update_search_vectors(recipe_ids))
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_search_vectors(sender, instance, created, **kwargs):
+    if not created:
+        recipe_ids = list(
+            instance.recipes.values_list("id", flat=True)
+        )
+        transaction.on_commit(lambda: update_search_vectors(recipe_ids))
+
+
+def bump_recipe_versions(recipe_ids):
+    transaction.on_commit(lambda: bump_versions(Recipe, recipe_ids))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def bump_recipe_version(sender, instance, **kwargs):
+    bump_recipe_versions([instance.pk])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_save, sender=RecipeTag)
+@receiver(post_delete, sender=RecipeTag)
+def bump_parent_recipe_version(sender, instance, **kwargs):
+    bump_recipe_versions([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+def bump_related_recipe_versions(sender, instance, created, **kwargs):
+    if not created:
+        bump_recipe_versions(
+            list(instance.recipes.values_list("id", flat=True))
+        )
+
+
+@receiver(post_save, sender=CustomUser)
+def bump_author_recipe_versions(
+    sender, instance, created, update_fields, **kwargs
+):
+    if created:
+        return
+    fields = AUTHOR_FIELDS
+    if update_fields is not None:
+        fields = fields & set(update_fields)
+    # Полное save() пишет все поля, поэтому сравниваются значения
+    if not instance.changed_fields(fields):
+        return
+    bump_recipe_versions(
+        list(instance.recipes.values_list("id", flat=True))
+    )
+
+
+@receiver(post_save, sender=RecipeTag)
+@receiver(post_delete, sender=RecipeTag)
+def update_recipe_tags_mask(sender, instance, **kwargs):
+    update_tags_masks([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def update_changed_tags_masks(sender, instance, action, reverse, pk_set,
+                              **kwargs):
+    # RecipeTag из add() и set() создаются через bulk_create без post_save
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        update_tags_masks([instance.pk])
+    else:
+        # После tag.recipes.clear() pk_set пуст: пересчитываются все
+        update_tags_masks(pk_set)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def update_cart_totals_item(sender, instance, created, **kwargs):
+    if cart.replacing_recipe.get() == instance.recipe_id:
+        return
+    if created:
+        cart.add_item(
+            instance.recipe_id, instance.ingredient_id, instance.amount
+        )
+    else:
+        # Прежние ингредиент и количество неизвестны
+        cart.rebuild(instance.recipe_id)
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def subtract_cart_totals_item(sender, instance, **kwargs):
+    if cart.replacing_recipe.get() != instance.recipe_id:
+        cart.add_item(
+            instance.recipe_id, instance.ingredient_id, -instance.amount
+        )
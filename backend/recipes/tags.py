@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import BigIntegerField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce
+
+from foodgram.replicas import primary
+from .models import Recipe, RecipeTag, Tag
+from .versions import get_version
+
+TAG_BITS_KEY = "tag_bits:{}"
+# До стольких тегов фильтр перечисляет подходящие маски списком,
+# который обслуживает индекс по tags_mask, больше - проверяет биты
+MAX_ENUMERATED_TAGS = 8
+
+
+def tag_bits(slugs=()):
+    """Слаги тегов и их биты в маске: {slug: bit}.
+
+    Справочник лежит в кэше под версией Tag, поэтому фильтр
+    по тегам обычно не обращается к базе. Версия в локальном кэше
+    не видит тегов, созданных другим процессом, поэтому справочник
+    перечитывается, если в нём нет какого-то из slugs, и живёт
+    не дольше TAG_BITS_TIMEOUT секунд.
+    """
+    key = TAG_BITS_KEY.format(get_version(Tag))
+    bits = cache.get(key)
+    if bits is None or not bits.keys() >= set(slugs):
+        with primary():
+            bits = dict(Tag.objects.values_list("slug", "bit"))
+        cache.set(key, bits, timeout=settings.TAG_BITS_TIMEOUT)
+    return bits
+
+
+def mask_of(bits):
+    mask = 0
+    for bit in bits:
+        mask |= 1 << bit
+    return mask
+
+
+def tags_mask():
+    """Маска тегов рецепта из RecipeTag для UPDATE."""
+    return Coalesce(
+        Subquery(
+            RecipeTag.objects.filter(
+                recipe=OuterRef("pk")
+            ).order_by().values("recipe").annotate(
+                mask=Sum(
+                    Cast(Value(1), BigIntegerField()).bitleftshift(
+                        F("tag__bit")
+                    )
+                )
+            ).values("mask")
+        ),
+        0
+    )
+
+
+def update_tags_masks(recipe_ids=None):
+    """Пересчитывает tags_mask рецептов, без recipe_ids - всех."""
+    queryset = Recipe.objects.all()
+    if recipe_ids is not None:
+        queryset = queryset.filter(id__in=recipe_ids)
+    queryset.update(tags_mask=tags_mask())
+
+
+def filter_by_tags(queryset, slugs, match_all=False):
+    """Рецепты с любым из тегов, а при match_all - со всеми сразу.
+
+    Условие одно и на столбец tags_mask, поэтому строки
+    не размножаются и DISTINCT не нужен.
+    """
+    bits = tag_bits()
+    mask = mask_of(bits[slug] for slug in slugs)
+    if len(bits) > MAX_ENUMERATED_TAGS:
+        matched = queryset.alias(tags_match=F("tags_mask").bitand(mask))
+        if match_all:
+            return matched.filter(tags_match=mask)
+        return matched.exclude(tags_match=0)
+    # Все возможные маски - подмножества битов существующих тегов
+    full = mask_of(bits.values())
+    masks = []
+    subset = full
+    while True:
+        if (subset & mask == mask) if match_all else (subset & mask):
+            masks.append(subset)
+        if not subset:
+            break
+        subset = (subset - 1) & full
+    return queryset.filter(tags_mask__in=masks)
@@ -0,0 +1,700 @@
+import json
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from foodgram.admin import EstimatedCountPaginator, LargeTableAdminMixin
+from users.models import CustomUser, Subscription
+from . import cart, feed, relations
+from .counters import increment
+from .images import VARIANTS, variant_name, variant_url
+from .indexes import RecipeIngredientIndex
+from .models import (
+    Favorite,
+    FeedEntry,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingCartTotal,
+    Tag
+)
+from .search import search_recipes
+from .versions import changes_key, get_version
+
+
+def create_user(name, email=None):
+    return CustomUser.objects.create_user(
+        username=name,
+        email=email or f"{name}@example.com",
+        first_name=name,
+        last_name=name,
+        password="password-12345"
+    )
+
+
+class CounterFieldsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user("author")
+        cls.recipe = Recipe.objects.create(
+            author=cls.author,
+            name="Рецепт",
+            image="recipes/test.png",
+            text="Описание",
+            cooking_time=10
+        )
+
+    def test_recipe_save_keeps_concurrent_increment(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        increment(Recipe, recipe.pk, "favorite_count")
+        recipe.name = "Новое название"
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, "Новое название")
+        self.assertEqual(recipe.favorite_count, 1)
+
+    def test_user_save_keeps_concurrent_increment(self):
+        user = CustomUser.objects.get(pk=self.author.pk)
+        increment(CustomUser, user.pk, "followers_count")
+        user.set_password("new-password-12345")
+        user.save()
+        user.refresh_from_db()
+        self.assertEqual(user.followers_count, 1)
+        self.assertEqual(user.recipes_count, 1)
+
+    def test_counter_is_saved_when_named(self):
+        self.recipe.favorite_count = 5
+        self.recipe.save(update_fields=["favorite_count"])
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorite_count, 5)
+
+
+def png():
+    buffer = BytesIO()
+    Image.new("RGB", (20, 10), "red").save(buffer, "PNG")
+    return ContentFile(buffer.getvalue())
+
+
+class ImageVariantsTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user("author")
+
+    def create_recipe(self, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Recipe.objects.create(
+                author=self.author,
+                name="Рецепт",
+                image=image,
+                text="Описание",
+                cooking_time=10
+            )
+
+    def test_original_is_served_until_variant_exists(self):
+        name = default_storage.save("recipes/missing.png", png())
+        self.assertEqual(
+            variant_url(name, "card", []), default_storage.url(name)
+        )
+
+    def test_generated_variants_are_recorded(self):
+        recipe = self.create_recipe(
+            default_storage.save("recipes/recorded.png", png())
+        )
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_variants, list(VARIANTS))
+        with mock.patch.object(default_storage, "exists") as exists:
+            url = variant_url(
+                recipe.image.name, "card", recipe.image_variants
+            )
+        exists.assert_not_called()
+        self.assertEqual(
+            url, default_storage.url(variant_name(recipe.image.name, "card"))
+        )
+
+    def test_broken_image_does_not_fail_save(self):
+        name = default_storage.save(
+            "recipes/broken.png", ContentFile(b"not an image")
+        )
+        with self.assertLogs("foodgram.images", "ERROR"):
+            recipe = self.create_recipe(name)
+        self.assertTrue(Recipe.objects.filter(pk=recipe.pk).exists())
+
+    def test_changed_image_replaces_variants(self):
+        old_name = default_storage.save("recipes/old.png", png())
+        recipe = self.create_recipe(old_name)
+        old_variants = [variant_name(old_name, v) for v in VARIANTS]
+        self.assertTrue(all(map(default_storage.exists, old_variants)))
+        recipe.image = default_storage.save("recipes/new.png", png())
+        with self.captureOnCommitCallbacks() as callbacks:
+            recipe.save()
+        # До создания копий новой картинки отдаётся оригинал
+        self.assertEqual(
+            Recipe.objects.get(pk=recipe.pk).image_variants, []
+        )
+        for callback in callbacks:
+            callback()
+        self.assertEqual(
+            Recipe.objects.get(pk=recipe.pk).image_variants, list(VARIANTS)
+        )
+        self.assertFalse(any(map(default_storage.exists, old_variants)))
+        self.assertTrue(default_storage.exists(
+            variant_name(recipe.image.name, "card")
+        ))
+
+
+@mock.patch("recipes.search.is_supported", return_value=False)
+class FallbackSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user("author")
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=author,
+                name=f"Суп {number}" if number % 2 else f"Каша {number}",
+                image="recipes/test.png",
+                text="Суп" if number == 2 else "Описание",
+                cooking_time=10
+            )
+            for number in range(10)
+        )
+
+    def test_name_outranks_text(self, is_supported):
+        found = search_recipes(Recipe.objects.all(), "СУП")
+        self.assertEqual(
+            [recipe.name for recipe in found],
+            ["Суп 9", "Суп 7", "Суп 5", "Суп 3", "Суп 1", "Каша 2"]
+        )
+
+    @override_settings(SEARCH_FALLBACK_LIMIT=2)
+    def test_only_best_candidates_are_kept(self, is_supported):
+        found = search_recipes(Recipe.objects.all(), "суп")
+        self.assertEqual(
+            [recipe.name for recipe in found], ["Суп 9", "Суп 7"]
+        )
+
+    @mock.patch("recipes.search.SEARCH_CHUNK_SIZE", 3)
+    def test_ingredients_are_ranked_in_one_query(self, is_supported):
+        carrot, salt = Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit="г")
+            for name in ("Морковь", "Соль")
+        )
+        recipe = Recipe.objects.get(name="Каша 4")
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in (salt, carrot)
+        )
+        # Ранги одним запросом и сама выборка рецептов
+        with self.assertNumQueries(2):
+            found = list(search_recipes(Recipe.objects.all(), "морковь"))
+        self.assertEqual(found, [recipe])
+
+
+class RecipeIngredientIndexTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user("author")
+        cls.salt, cls.flour, cls.milk = Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit="г")
+            for name in ("Соль", "Мука", "Молоко")
+        )
+        cls.recipe = Recipe.objects.create(
+            author=author,
+            name="Блины",
+            image="recipes/test.png",
+            text="Описание",
+            cooking_time=10
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=cls.recipe, ingredient=ingredient,
+                             amount=1)
+            for ingredient in (cls.salt, cls.flour)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.index = RecipeIngredientIndex()
+        self.assertEqual(
+            self.index.including([self.salt.id]), {self.recipe.id}
+        )
+
+    def test_changed_recipe_is_updated_without_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredient.objects.filter(
+                recipe=self.recipe, ingredient=self.salt
+            ).delete()
+            RecipeIngredient.objects.create(
+                recipe=self.recipe, ingredient=self.milk, amount=1
+            )
+        with mock.patch.object(
+            RecipeIngredientIndex, "_build", side_effect=AssertionError
+        ):
+            self.assertEqual(self.index.including([self.salt.id]), set())
+            self.assertEqual(
+                self.index.including([self.flour.id, self.milk.id]),
+                {self.recipe.id}
+            )
+            self.assertEqual(
+                self.index.covered([self.flour.id], 50), {self.recipe.id}
+            )
+
+    def test_deleted_recipe_is_removed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.filter(pk=self.recipe.pk).delete()
+        self.assertEqual(self.index.containing_any([self.flour.id]), set())
+
+    def test_lost_changes_rebuild_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredient.objects.create(
+                recipe=self.recipe, ingredient=self.milk, amount=1
+            )
+        log = changes_key(RecipeIngredient, get_version(RecipeIngredient))
+        cache.delete(f"{log}:1")
+        with mock.patch.object(
+            RecipeIngredientIndex, "_build",
+            wraps=self.index._build
+        ) as build:
+            self.assertEqual(
+                self.index.including([self.milk.id]), {self.recipe.id}
+            )
+        build.assert_called_once()
+
+
+@override_settings(FEED_FANOUT_LIMIT=2, FEED_LENGTH=2)
+class FeedTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader, cls.other = (
+            create_user(name) for name in ("author", "reader", "other")
+        )
+
+    def create_recipes(self, count):
+        # Файла картинки нет, копии для ленты не нужны
+        with mock.patch("recipes.signals.refresh_image_variants"):
+            with self.captureOnCommitCallbacks(execute=True):
+                for number in range(count):
+                    Recipe.objects.create(
+                        author=self.author,
+                        name=f"Рецепт {number}",
+                        image="recipes/test.png",
+                        text="Описание",
+                        cooking_time=10
+                    )
+
+    def feed_ids(self, user):
+        return set(
+            FeedEntry.objects.filter(user=user).values_list(
+                "recipe_id", flat=True
+            )
+        )
+
+    def test_pulled_recipes_are_backfilled_below_limit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for user in (self.reader, self.other):
+                Subscription.objects.create(user=user, author=self.author)
+        self.create_recipes(3)
+        self.assertEqual(self.feed_ids(self.reader), set())
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscription.objects.filter(user=self.other).delete()
+        latest = set(
+            Recipe.objects.order_by("-id").values_list("id", flat=True)[:2]
+        )
+        self.assertEqual(self.feed_ids(self.reader), latest)
+
+    def test_prune_keeps_latest_recipes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscription.objects.create(user=self.reader, author=self.author)
+        self.create_recipes(3)
+        self.assertEqual(len(self.feed_ids(self.reader)), 3)
+        deleted = sum(count for _, count in feed.prune(chunk_size=1))
+        self.assertEqual(deleted, 1)
+        latest = set(
+            Recipe.objects.order_by("-id").values_list("id", flat=True)[:2]
+        )
+        self.assertEqual(self.feed_ids(self.reader), latest)
+
+
+class GenerateDatasetTests(TestCase):
+
+    def test_repeated_runs_add_users(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root):
+            for _ in range(2):
+                call_command(
+                    "generate_dataset", users=3, recipes=2, ingredients=5,
+                    stdout=StringIO()
+                )
+        self.assertEqual(CustomUser.objects.count(), 6)
+
+
+class ShoppingCartTotalsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.user, cls.other = (
+            create_user(name) for name in ("author", "user", "other")
+        )
+        cls.flour, cls.salt, cls.milk = Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit=unit)
+            for name, unit in (("мука", "г"), ("соль", "г"), ("молоко", "мл"))
+        )
+        cls.bread, cls.pancakes = (
+            Recipe.objects.create(
+                author=cls.author,
+                name=name,
+                image="recipes/test.png",
+                text="Описание",
+                cooking_time=10
+            )
+            for name in ("Хлеб", "Блины")
+        )
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe=cls.bread, ingredient=cls.flour, amount=500
+            ),
+            RecipeIngredient(recipe=cls.bread, ingredient=cls.salt, amount=5),
+            RecipeIngredient(
+                recipe=cls.pancakes, ingredient=cls.flour, amount=200
+            ),
+            RecipeIngredient(
+                recipe=cls.pancakes, ingredient=cls.milk, amount=300
+            ),
+        ])
+
+    def setUp(self):
+        relations.add(ShoppingCart, self.user.id, [self.bread.id])
+        relations.add(
+            ShoppingCart, self.other.id, [self.bread.id, self.pancakes.id]
+        )
+
+    def assert_totals_match(self):
+        actual = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in
+            ShoppingCartTotal.objects.values_list(
+                "user_id", "ingredient_id", "amount"
+            )
+        }
+        self.assertEqual(actual, cart.expected_totals())
+
+    def test_cart_add_and_remove(self):
+        self.assert_totals_match()
+        relations.add(ShoppingCart, self.user.id, [self.pancakes.id])
+        self.assert_totals_match()
+        relations.remove(ShoppingCart, self.other.id, [self.bread.id])
+        self.assert_totals_match()
+        ShoppingCart.objects.create(user=self.author, recipe=self.bread)
+        ShoppingCart.objects.filter(user=self.user).delete()
+        self.assert_totals_match()
+
+    def test_amount_change(self):
+        item = RecipeIngredient.objects.get(
+            recipe=self.bread, ingredient=self.flour
+        )
+        item.amount = 700
+        item.save()
+        self.assert_totals_match()
+
+    def test_ingredient_swap(self):
+        item = RecipeIngredient.objects.get(
+            recipe=self.bread, ingredient=self.salt
+        )
+        item.ingredient = self.milk
+        item.save()
+        self.assert_totals_match()
+        # Так ингредиенты заменяет сериализатор при правке рецепта
+        with cart.replace_items(self.pancakes.id):
+            self.pancakes.ingredients.clear()
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(
+                    recipe=self.pancakes, ingredient=self.salt, amount=2
+                ),
+            ])
+        self.assert_totals_match()
+        RecipeIngredient.objects.create(
+            recipe=self.pancakes, ingredient=self.milk, amount=100
+        )
+        RecipeIngredient.objects.filter(ingredient=self.salt).delete()
+        self.assert_totals_match()
+
+    def test_recipe_delete(self):
+        self.bread.delete()
+        self.assert_totals_match()
+        self.assertFalse(self.user.shopping_cart_totals.exists())
+
+    def test_bulk_clear(self):
+        relations.remove(ShoppingCart, self.other.id)
+        self.assert_totals_match()
+        self.assertFalse(self.other.shopping_cart_totals.exists())
+        self.assertTrue(self.user.shopping_cart_totals.exists())
+
+    def test_check_command_reports_and_repairs_drift(self):
+        ShoppingCartTotal.objects.filter(
+            user=self.user, ingredient=self.flour
+        ).update(amount=1)
+        ShoppingCartTotal.objects.filter(
+            user=self.other, ingredient=self.milk
+        ).delete()
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command("check_shopping_cart_totals", stdout=out)
+        self.assertIn("расхождений: 2", out.getvalue())
+        call_command("check_shopping_cart_totals", fix=True, stdout=out)
+        self.assert_totals_match()
+        out = StringIO()
+        call_command("check_shopping_cart_totals", stdout=out)
+        self.assertIn("расхождений: 0", out.getvalue())
+
+
+DUMP = [
+    {
+        "model": "recipes.ingredient",
+        "pk": 1,
+        "fields": {"name": "мука", "measurement_unit": "г"},
+    },
+    {
+        "model": "recipes.ingredient",
+        "pk": 5,
+        "fields": {"name": "соль", "measurement_unit": "г"},
+    },
+    {
+        "model": "users.customuser",
+        "pk": 10,
+        "fields": {
+            "username": "cook",
+            "email": "cook@example.com",
+            "first_name": "cook",
+            "last_name": "cook",
+            "password": "password-12345",
+        },
+    },
+    {
+        "model": "recipes.recipe",
+        "pk": 20,
+        "fields": {
+            "author": 10,
+            "name": "Хлеб",
+            "image": "recipes/bread.png",
+            "text": "Испечь",
+            "cooking_time": 60,
+        },
+    },
+    {
+        "model": "recipes.recipeingredient",
+        "pk": 30,
+        "fields": {"recipe": 20, "ingredient": 1, "amount": 500},
+    },
+    {
+        "model": "recipes.recipeingredient",
+        "pk": 31,
+        "fields": {"recipe": 20, "ingredient": 5, "amount": 5},
+    },
+    {
+        "model": "admin.logentry",
+        "pk": 1,
+        "fields": {},
+    },
+]
+
+
+class LoadCatalogTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+        return path
+
+    def load(self, path, **options):
+        call_command("load_catalog", path, stdout=StringIO(), **options)
+
+    def ingredients(self):
+        return set(
+            Ingredient.objects.values_list("name", "measurement_unit")
+        )
+
+    def recipe_ingredients(self, recipe_id):
+        return set(
+            RecipeIngredient.objects.filter(recipe_id=recipe_id).values_list(
+                "ingredient__name", "amount"
+            )
+        )
+
+    def test_csv_is_loaded_once(self):
+        path = self.write("ingredients.csv", "соль,г\nмука,г\n")
+        for _ in range(2):
+            self.load(path)
+        self.assertEqual(self.ingredients(), {("соль", "г"), ("мука", "г")})
+
+    def test_json_array(self):
+        path = self.write("ingredients.json", json.dumps([
+            {"name": "соль", "measurement_unit": "г"},
+            {"name": "молоко", "measurement_unit": "мл"},
+        ]))
+        self.load(path, batch_size=1)
+        self.assertEqual(
+            self.ingredients(), {("соль", "г"), ("молоко", "мл")}
+        )
+
+    def test_ndjson_tags_are_updated_by_slug(self):
+        path = self.write(
+            "tags.ndjson",
+            '{"name": "Завтрак", "color": "#E26C2D", "slug": "breakfast"}\n'
+        )
+        self.load(path, model="tag")
+        path = self.write(
+            "tags.ndjson",
+            '{"name": "Завтрак", "color": "#49B64E", "slug": "breakfast"}\n'
+            '{"name": "Обед", "color": "#8775D2", "slug": "lunch"}\n'
+        )
+        self.load(path, model="tag")
+        self.assertEqual(
+            set(Tag.objects.values_list("slug", "color")),
+            {("breakfast", "#49B64E"), ("lunch", "#8775D2")}
+        )
+        bits = list(Tag.objects.values_list("bit", flat=True))
+        self.assertEqual(len(set(bits)), 2)
+
+    def test_dump_is_loaded_repeatedly(self):
+        path = self.write("dump.json", json.dumps(DUMP))
+        for _ in range(2):
+            self.load(path, batch_size=1)
+        self.assertEqual(Ingredient.objects.count(), 2)
+        self.assertEqual(Recipe.objects.get().author.username, "cook")
+        self.assertEqual(
+            self.recipe_ingredients(20), {("мука", 500), ("соль", 5)}
+        )
+
+    def test_dump_after_csv_reuses_ingredients(self):
+        # id 1 из CSV достаётся соли, а в дампе под ним мука
+        self.load(self.write("ingredients.csv", "соль,г\n"))
+        salt = Ingredient.objects.get()
+        self.load(self.write("dump.json", json.dumps(DUMP)))
+        self.assertEqual(self.ingredients(), {("соль", "г"), ("мука", "г")})
+        self.assertEqual(
+            Ingredient.objects.get(name="соль").id, salt.id
+        )
+        self.assertEqual(
+            self.recipe_ingredients(20), {("мука", 500), ("соль", 5)}
+        )
+
+    def test_conflicting_dump_is_rejected(self):
+        create_user("cook", email="other@example.com")
+        with self.assertRaises(CommandError):
+            self.load(self.write("dump.json", json.dumps(DUMP)))
+        self.assertFalse(Recipe.objects.exists())
+
+
+class LargeTableAdminTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(
+            username="admin",
+            email="admin@example.com",
+            first_name="admin",
+            last_name="admin",
+            password="password-12345"
+        )
+        author = create_user("author")
+        tag = Tag.objects.create(
+            name="Завтрак", color="#E26C2D", slug="breakfast"
+        )
+        ingredient = Ingredient.objects.create(
+            name="Соль", measurement_unit="г"
+        )
+        recipe = Recipe.objects.create(
+            author=author,
+            name="Каша",
+            image="recipes/test.png",
+            text="Описание",
+            cooking_time=10
+        )
+        recipe.tags.add(tag)
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=1
+        )
+        Favorite.objects.create(user=cls.admin, recipe=recipe)
+        ShoppingCart.objects.create(user=cls.admin, recipe=recipe)
+        Subscription.objects.create(user=cls.admin, author=author)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.model_admins = [
+            model_admin for model_admin in admin.site._registry.values()
+            if isinstance(model_admin, LargeTableAdminMixin)
+        ]
+
+    def test_changelists(self):
+        for model_admin in self.model_admins:
+            opts = model_admin.model._meta
+            url = reverse(
+                f"admin:{opts.app_label}_{opts.model_name}_changelist"
+            )
+            queries = [""]
+            if model_admin.search_fields:
+                queries.append("?q=a")
+            for query in queries:
+                with self.subTest(url=url + query):
+                    response = self.client.get(url + query)
+                    self.assertEqual(response.status_code, 200)
+                    changelist = response.context["cl"]
+                    self.assertIsInstance(
+                        changelist.paginator, EstimatedCountPaginator
+                    )
+                    if not query:
+                        self.assertEqual(
+                            changelist.result_count,
+                            model_admin.model.objects.count()
+                        )
+
+    def test_autocomplete_fields(self):
+        for model_admin in self.model_admins:
+            opts = model_admin.model._meta
+            for field in model_admin.autocomplete_fields:
+                with self.subTest(model=opts.label, field=field):
+                    response = self.client.get(
+                        reverse("admin:autocomplete"),
+                        {
+                            "app_label": opts.app_label,
+                            "model_name": opts.model_name,
+                            "field_name": field,
+                            "term": "",
+                        }
+                    )
+                    self.assertEqual(response.status_code, 200)
+                    self.assertTrue(response.json()["results"])
@@ -0,0 +1,114 @@
+import time
+from uuid import uuid4
+
+from django.core.cache import cache
+
+VERSION_KEY = "version:{}"
+CHANGES_KEY = "changes:{}:{}"
+
+
+def new_version():
+    """Время создания версии и случайная часть: 1700000000.123456-9f2c..."""
+    return f"{time.time():.6f}-{uuid4().hex}"
+
+
+def version_time(version):
+    """Момент, не раньше которого зафиксированы данные версии.
+
+    Для версии без времени, созданной до его появления, - текущий момент:
+    такую версию гарантированно содержит только основная база.
+    """
+    try:
+        return float(version.split("-", 1)[0])
+    except ValueError:
+        return time.time()
+
+
+def get_version(model):
+    """Текущая версия данных модели.
+
+    Версия - строка в кэше из времени и случайной части, которая
+    меняется после фиксации каждой записи в модель. По времени видно,
+    догнала ли версию реплика. Если ключ пропал из кэша, создаётся
+    новая версия, поэтому старые ETag после этого не совпадут.
+    """
+    key = VERSION_KEY.format(model._meta.label_lower)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(model):
+    key = VERSION_KEY.format(model._meta.label_lower)
+    cache.set(key, new_version(), timeout=None)
+
+
+def get_versions(model, pks):
+    """Версии отдельных объектов модели: {pk: версия}.
+
+    Устроены так же, как версия всей модели, но хранятся по ключу
+    на объект и читаются из кэша одним запросом.
+    """
+    label = model._meta.label_lower
+    keys = {VERSION_KEY.format(f"{label}:{pk}"): pk for pk in pks}
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, uuid4().hex, timeout=None)
+        versions.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def bump_versions(model, pks):
+    label = model._meta.label_lower
+    cache.set_many(
+        {VERSION_KEY.format(f"{label}:{pk}"): uuid4().hex for pk in pks},
+        timeout=None
+    )
+
+
+def changes_key(model, version):
+    return CHANGES_KEY.format(model._meta.label_lower, version)
+
+
+def log_changes(model, pks, timeout):
+    """Дописывает pks в журнал изменений текущей версии модели.
+
+    Журнал - счётчик записей и по ключу на запись, записи живут
+    timeout секунд. По нему индексы в памяти процессов обновляют
+    только изменившиеся объекты, а смена версии начинает новый журнал.
+    """
+    key = changes_key(model, get_version(model))
+    cache.add(key, 0, timeout=None)
+    end = cache.incr(key, len(pks))
+    cache.set_many(
+        {
+            f"{key}:{position}": pk
+            for position, pk in enumerate(pks, start=end - len(pks) + 1)
+        },
+        timeout=timeout
+    )
+
+
+def changes_position(model, version):
+    return cache.get(changes_key(model, version), 0)
+
+
+def read_changes(model, version, start, limit):
+    """pks из журнала после позиции start и новая позиция журнала.
+
+    Возвращает None, если записей больше limit или часть из них уже
+    вытеснена из кэша: тогда индекс дешевле перестроить целиком.
+    """
+    key = changes_key(model, version)
+    end = cache.get(key, 0)
+    if not start <= end <= start + limit:
+        return None
+    keys = [f"{key}:{position}" for position in range(start + 1, end + 1)]
+    found = cache.get_many(keys)
+    if len(found) < len(keys):
+        return None
+    return [found[name] for name in keys], end
@@ -1,19 +1,22 @@
 from django.contrib import admin
 
+from foodgram.admin import LargeTableAdminMixin
 from .models import CustomUser, Subscription
 
 
-class CustomUserAdmin(admin.ModelAdmin):
+class CustomUserAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = (
         "id",
         "email",
         "username",
         "first_name",
-        "last_name"
+        "last_name",
+        "recipes_count",
+        "followers_count"
     )
     list_filter = (
-        "email",
-        "username"
+        "is_staff",
+        "is_active"
     )
     search_fields = (
         "email",
@@ -22,11 +25,19 @@ class CustomUserAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
 
-class SubscriptionAdmin(admin.ModelAdmin):
+class SubscriptionAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = (
         "user",
         "author"
     )
+    list_select_related = (
+        "user",
+        "author",
+    )
+    autocomplete_fields = (
+        "user",
+        "author",
+    )
     empty_value_display = '-пусто-'
 
 
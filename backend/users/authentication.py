@@ -0,0 +1,60 @@
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+
+from foodgram.replicas import primary
+
+TOKEN_KEY = "auth_token:{}"
+
+
+def token_cache_key(key):
+    # Сам токен в ключ не попадает, чтобы его нельзя было прочитать из кэша
+    return TOKEN_KEY.format(sha256(key.encode()).hexdigest())
+
+
+def forget_tokens(keys):
+    """Удаляет токены из кэша после фиксации транзакции.
+
+    Иначе параллельный запрос успел бы снова положить туда
+    ещё не изменённые данные.
+    """
+    keys = [token_cache_key(key) for key in keys]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, который хранит токен с пользователем в кэше.
+
+    Запись живёт AUTH_TOKEN_CACHE_TIMEOUT секунд и удаляется сигналами
+    при удалении токена (выход через djoser) и при сохранении
+    пользователя: смене пароля, блокировке, правке профиля, а также
+    при CustomUser.objects.update(). Поэтому следующий запрос после
+    блокировки читает токен из базы, где DRF и проверяет is_active.
+    Изменения в обход ORM, например сырым SQL, видны только после
+    истечения записи.
+
+    Удаление из кэша действует на все воркеры, только если кэш общий.
+    С LocMemCache кэш токенов по умолчанию выключен, см. settings.
+
+    Пользователь из кэша только читается: единственная запись
+    request.user - смена пароля с update_fields=["password"].
+    """
+
+    def authenticate_credentials(self, key):
+        timeout = settings.AUTH_TOKEN_CACHE_TIMEOUT
+        if not timeout:
+            with primary():
+                return super().authenticate_credentials(key)
+        cache_key = token_cache_key(key)
+        token = cache.get(cache_key)
+        if token is None:
+            # Только что выданного токена на реплике может ещё не быть
+            with primary():
+                user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, token, timeout=timeout)
+            return user, token
+        return token.user, token
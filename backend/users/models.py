@@ -1,6 +1,7 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
 
+from foodgram.models import CounterFieldsMixin
 from foodgram.settings import (
     MAX_EMAIL_LENGTH,
     MAX_PASSWORD_LENGTH,
@@ -8,7 +9,36 @@ from foodgram.settings import (
 )
 
 
-class CustomUser(AbstractUser):
+class CustomUserQuerySet(models.QuerySet):
+
+    def update(self, **kwargs):
+        """UPDATE, после которого токены пользователей удаляются из кэша.
+
+        Массовое изменение не отправляет post_save, поэтому без этого
+        заблокированный через update(is_active=False) пользователь
+        оставался бы в кэше аутентификации. Счётчики токены не трогают.
+        """
+        if set(kwargs) <= set(self.model.counter_fields):
+            return super().update(**kwargs)
+        from rest_framework.authtoken.models import Token
+
+        from .authentication import forget_tokens
+        # Ключи читаются до UPDATE: он может изменить поля из фильтра
+        keys = list(
+            Token.objects.filter(
+                user__in=self.values("pk")
+            ).values_list("key", flat=True)
+        )
+        updated = super().update(**kwargs)
+        forget_tokens(keys)
+        return updated
+
+
+class CustomUserManager(UserManager.from_queryset(CustomUserQuerySet)):
+    pass
+
+
+class CustomUser(CounterFieldsMixin, AbstractUser):
     email = models.EmailField(
         "Адрес электронной почты",
         max_length=MAX_EMAIL_LENGTH,
@@ -35,6 +65,22 @@ class CustomUser(AbstractUser):
         blank=False
     )
 
+    recipes_count = models.PositiveIntegerField(
+        "Количество рецептов",
+        default=0,
+        editable=False
+    )
+
+    followers_count = models.PositiveIntegerField(
+        "Количество подписчиков",
+        default=0,
+        editable=False
+    )
+
+    counter_fields = ("recipes_count", "followers_count")
+
+    objects = CustomUserManager()
+
     REQUIRED_FIELDS = [
         "email",
         "first_name",
@@ -49,6 +95,24 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return self.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Прочитанные значения нужны, чтобы отличить настоящую правку
+        # профиля от полного save(), который пишет все поля
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def changed_fields(self, fields):
+        """Поля из fields, значения которых отличаются от прочитанных."""
+        loaded = getattr(self, "_loaded_values", None)
+        if loaded is None:
+            return set(fields)
+        return {
+            field for field in fields
+            if field not in loaded or loaded[field] != getattr(self, field)
+        }
+
 
 class Subscription(models.Model):
     user = models.ForeignKey(
@@ -1,32 +1,61 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from api.serializers import (
+    BulkAuthorsSerializer,
     CustomUserRegisterSerializer,
     CustomUserSerializer,
     SubscriptionSerializer,
-    ChangePasswordSerializer
+    ChangePasswordSerializer,
+    get_recipes_limit
 )
+from api.mixins import AsyncReadMixin, BulkRelationsMixin
 from api.pagination import CustomPagination
+from recipes import relations
+from recipes.models import Recipe
 from .models import Subscription
 
 User = get_user_model()
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(BulkRelationsMixin, AsyncReadMixin, UserViewSet):
     queryset = User.objects.all()
     pagination_class = CustomPagination
+    async_actions = ("subscriptions",)
+    query_budget = {
+        "subscriptions": 6,
+        "subscribe": 11,
+        "subscribe_bulk": 8,
+    }
 
     def get_serializer_class(self):
         if self.action in ("list", "retrieve"):
             return CustomUserSerializer
         return CustomUserRegisterSerializer
 
+    def get_subscriptions(self, user):
+        return Subscription.objects.filter(
+            user=user
+        ).select_related(
+            "author"
+        ).order_by("id")
+
+    def get_subscription_context(self, request, subscriptions):
+        """Контекст с рецептами всех авторов страницы подписок."""
+        author_recipes = Recipe.objects.latest_by_author(
+            [subscription.author_id for subscription in subscriptions],
+            get_recipes_limit(request)
+        )
+        return {"request": request, "author_recipes": author_recipes}
+
     def retrieve(self, request, id=None):
         author = get_object_or_404(User, id=id)
         context = {"request": request}
@@ -69,24 +98,39 @@ class CustomUserViewSet(UserViewSet):
     )
     def subscribe(self, request, id=None):
         user = request.user
-        author = get_object_or_404(User, id=id)
-        context = {"request": request}
+        if not str(id).isdigit():
+            raise Http404
+        author_id = int(id)
 
         if request.method == "POST":
-            if Subscription.objects.filter(user=user, author=author).exists():
-                raise ValueError("Уже подписан")
-            sub = Subscription.objects.create(user=user, author=author)
+            if author_id == user.id:
+                raise ValidationError("Нельзя подписаться на самого себя")
+            relations.add(Subscription, user.id, [author_id])
+            sub = get_object_or_404(
+                Subscription.objects.select_related("author"),
+                user=user,
+                author_id=author_id
+            )
+            context = self.get_subscription_context(request, [sub])
             serializer = SubscriptionSerializer(sub, context=context)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        if request.method == "DELETE":
-            subscription = get_object_or_404(
-                Subscription,
-                user=user,
-                author=author
-            )
-            subscription.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        relations.remove(Subscription, user.id, [author_id])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(
+        methods=["POST", "DELETE"],
+        detail=False,
+        url_path="subscribe",
+        permission_classes=(IsAuthenticated,)
+    )
+    def subscribe_bulk(self, request):
+        """Подписка на нескольких авторов и отписка от них."""
+        return self.change_relations(
+            request,
+            Subscription,
+            BulkAuthorsSerializer
+        )
 
     @action(
         methods=["GET"],
@@ -94,9 +138,23 @@ class CustomUserViewSet(UserViewSet):
         permission_classes=(IsAuthenticated,)
     )
     def subscriptions(self, request):
-        user = request.user
-        context = {"request": request}
-        queryset = Subscription.objects.filter(user=user)
+        queryset = self.get_subscriptions(request.user)
         pages = self.paginate_queryset(queryset)
-        serializer = SubscriptionSerializer(pages, many=True, context=context)
-        return self.get_paginated_response(serializer.data)
+        return self.get_paginated_response(
+            self.serialize_subscriptions(request, pages)
+        )
+
+    async def async_subscriptions(self, request):
+        queryset = self.get_subscriptions(request.user)
+        pages = await self.apaginate_queryset(queryset)
+        return self.get_paginated_response(
+            await sync_to_async(self.serialize_subscriptions)(request, pages)
+        )
+
+    def serialize_subscriptions(self, request, subscriptions):
+        context = self.get_subscription_context(request, subscriptions)
+        return SubscriptionSerializer(
+            subscriptions,
+            many=True,
+            context=context
+        ).data